@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+#
+# bench.py: measure how the backup and restore scripts scale, against a local
+# mock DC/OS (mock_dcos.py) holding a synthetic cluster of any size
+#
+# Usage:
+#   bench.py [small|large] [scenario ...] [KEY=VALUE ...]
+#
+# Scenarios are run in order and can be:
+#   get         - FULL GET from the synthetic cluster (pipeline.py get)
+#   post        - FULL POST to an empty cluster (pipeline.py post)
+#   get_*       - any of the get_* scripts on its own, e.g. get_acls
+#   post_*      - any of the post_* scripts on its own, to the cluster restored
+#                 so far (e.g. post_users post_groups post_acls post_service_groups)
+# By default "get" and then "post" are run. POSTs restore the buffer left by
+# the last GET, which is run first if there's none.
+# KEY=VALUE sets a configuration parameter for the scripts, e.g. CONCURRENCY=16,
+# and the size of the synthetic cluster can be changed with USERS=, GROUPS=,
+# ACLS=, APPS= and MOMS=.
+# FIXTURE= serves the requests recorded from a real cluster (see replay.py)
+# instead of a synthetic cluster, and PROFILE= adds the latency, jitter and
+# errors of a profile (see replay.py) to every request, e.g. to measure a
+# backup over a WAN.
+#
+# For each scenario, the wall time, the number of requests received by the
+# mock cluster (by method), the requests per second, the peak memory of the
+# script and the number of errors it printed are reported, and for POSTs how
+# many of the objects in the synthetic cluster were restored.
+
+import sys
+import os
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+import mock_dcos
+import replay
+
+#size of the synthetic cluster: users, groups, ACLs, apps, MoM instances
+SIZES = {
+	'small': { 'USERS': 1000, 'GROUPS': 100, 'ACLS': 5000, 'APPS': 500, 'MOMS': 3 },
+	'large': { 'USERS': 10000, 'GROUPS': 1000, 'ACLS': 50000, 'APPS': 5000, 'MOMS': 5 },
+}
+#parameters of the benchmark itself, not passed to the scripts
+BENCH_PARAMETERS = [ 'FIXTURE', 'PROFILE' ]
+#scripts run by the "get" and "post" scenarios
+PIPELINE_SCENARIOS = { 'get': [ 'pipeline.py', 'get' ], 'post': [ 'pipeline.py', 'post' ] }
+SRC_DIR = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), '..', 'src' )
+#buffer files, as configured by env.sh
+DATA_FILES = {
+	'USERS_FILE': 'users.json',
+	'USERS_GROUPS_FILE': 'users_groups.json',
+	'GROUPS_FILE': 'groups.json',
+	'GROUPS_USERS_FILE': 'groups_users.json',
+	'ACLS_FILE': 'acls.json',
+	'ACLS_PERMISSIONS_FILE': 'acls_permissions.json',
+	'AGENTS_FILE': 'agents.json',
+	'SERVICE_GROUPS_FILE': 'service_groups.json',
+	'SERVICE_GROUPS_MOM_FILE': 'service_groups_mom.json',
+	'APPS_FILE': 'apps.json',
+	'APPS_MOM_FILE': 'apps_mom.json',
+}
+
+def write_config( working_dir, port, parameters ):
+	"""
+	Write the .config.json the scripts read from `working_dir`, for a cluster
+	at 127.0.0.1:[port], with the default parameters of env.sh overridden by
+	`parameters`.
+	"""
+	data_dir = os.path.join( working_dir, 'data' )
+	config = {
+		'DCOS_IP': '127.0.0.1:{}'.format( port ),
+		'USERNAME': 'bench',
+		'PASSWORD': 'bench',
+		'DEFAULT_USER_PASSWORD': 'bench',
+		'DEFAULT_USER_SECRET': 'bench',
+		'WORKING_DIR': working_dir,
+		'CONFIG_FILE': os.path.join( working_dir, '.config.json' ),
+		'TOKEN': 'bench',
+		#every run starts over, instead of resuming from the previous one
+		'CHECKPOINT_MAX_AGE': '0',
+		'MOM_TIMEOUT': '30',
+	}
+	for key, name in DATA_FILES.items():
+		config[key] = os.path.join( data_dir, name )
+	config.update( parameters )
+
+	config_file = open( config['CONFIG_FILE'], 'w' )
+	config_file.write( json.dumps( config ) )
+	config_file.close()
+
+def run_script( working_dir, arguments, log_path ):
+	"""
+	Run a script from src/ in `working_dir`, with its output to `log_path`.
+	Returns the wall time in seconds and the peak memory of the script in MB.
+	"""
+	log_file = open( log_path, 'w' )
+	start = time.monotonic()
+	process = subprocess.Popen( [ sys.executable, os.path.join( SRC_DIR, arguments[0] ) ] + arguments[1:], cwd=working_dir, stdout=log_file, stderr=subprocess.STDOUT )
+	#wait4() gives the resources used by this process only
+	pid, status, usage = os.wait4( process.pid, 0 )
+	elapsed = time.monotonic() - start
+	log_file.close()
+
+	#ru_maxrss is in KB on Linux
+	return elapsed, usage.ru_maxrss / 1024
+
+def count_errors( log_path ):
+	log_file = open( log_path, 'r', errors='replace' )
+	errors = log_file.read().count( '** ERROR' )
+	log_file.close()
+
+	return errors
+
+def run_scenario( scenario, working_dir, cluster, target, parameters ):
+	"""
+	Run a scenario against the synthetic `cluster` (GETs) or the `target`
+	cluster (POSTs), which is emptied before a FULL POST, and return its
+	measurements as a dictionary.
+	"""
+	arguments = PIPELINE_SCENARIOS.get( scenario, [ scenario+'.py' ] )
+	server = cluster if scenario.startswith( 'get' ) else target
+	if scenario == 'post':
+		target.cluster.reset()
+	server.cluster.requests = {}
+	write_config( working_dir, server.server_port, parameters )
+	shutil.rmtree( os.path.join( working_dir, 'data', '.checkpoints' ), ignore_errors=True )
+
+	log_path = os.path.join( working_dir, scenario+'.log' )
+	elapsed, memory = run_script( working_dir, arguments, log_path )
+	requests = sum( server.cluster.requests.values() )
+
+	return {
+		'scenario': scenario,
+		'seconds': round( elapsed, 2 ),
+		'requests': requests,
+		'requests_by_method': dict( server.cluster.requests ),
+		'requests_per_second': round( requests / elapsed, 1 ) if elapsed else 0,
+		'peak_memory_mb': round( memory, 1 ),
+		'errors': count_errors( log_path ),
+		'restored': target.cluster.summary() if server is target else None,
+		'log': log_path,
+	}
+
+def print_results( results, expected=None ):
+	print( '{:<22} {:>10} {:>10} {:>10} {:>12} {:>8}  {}'.format( 'scenario', 'seconds', 'requests', 'req/s', 'peak MB', 'errors', 'by method' ) )
+	for result in results:
+		print( '{scenario:<22} {seconds:>10} {requests:>10} {requests_per_second:>10} {peak_memory_mb:>12} {errors:>8}  {methods}'.format(
+			methods=' '.join( '{}={}'.format( method, count ) for method, count in sorted( result['requests_by_method'].items() ) ),
+			**result ) )
+	#what each POST restored, out of what the synthetic cluster holds
+	for result in results:
+		if result['restored'] is not None:
+			print( '{:<22} restored: {}'.format( result['scenario'], ', '.join(
+				'{}{} {}'.format( count, '/{}'.format( expected[kind] ) if expected else '', kind ) for kind, count in result['restored'].items() ) ) )
+
+if __name__ == '__main__':
+
+	size = dict( SIZES['small'] )
+	scenarios = []
+	parameters = {}
+	options = {}
+	for argument in sys.argv[1:]:
+		if argument in SIZES:
+			size = dict( SIZES[argument] )
+		elif '=' in argument:
+			key, value = argument.split( '=', 1 )
+			if key in size:
+				size[key] = int( value )
+			elif key in BENCH_PARAMETERS:
+				options[key] = value
+			else:
+				parameters[key] = value
+		elif argument in PIPELINE_SCENARIOS or os.path.isfile( os.path.join( SRC_DIR, argument+'.py' ) ):
+			scenarios.append( argument )
+		else:
+			print( '** ERROR: usage: bench.py [small|large] [get|post|get_*|post_* ...] [KEY=VALUE ...]' )
+			sys.exit(1)
+	if not scenarios:
+		scenarios = [ 'get', 'post' ]
+
+	cluster = mock_dcos.Cluster()
+	fixture = None
+	if 'FIXTURE' in options:
+		print( '** INFO: Replaying cluster recorded in {}.'.format( options['FIXTURE'] ) )
+		fixture = replay.load_fixture( options['FIXTURE'] )
+	else:
+		print( '** INFO: Generating synthetic cluster: {USERS} users, {GROUPS} groups, {ACLS} ACLs, {APPS} apps, {MOMS} MoM instances.'.format( **size ) )
+		mock_dcos.generate( cluster, size['USERS'], size['GROUPS'], size['ACLS'], size['APPS'], size['MOMS'] )
+	profile = replay.load_profile( options.get( 'PROFILE' ) )
+	source = replay.serve( fixture, profile, cluster=cluster )
+	target = replay.serve( None, profile )
+
+	working_dir = tempfile.mkdtemp( prefix='dcos-bench-' )
+	os.makedirs( os.path.join( working_dir, 'data' ) )
+	print( '** INFO: Working directory (buffer and logs): {}'.format( working_dir ) )
+
+	results = []
+	for scenario in scenarios:
+		#POSTs need a buffer to restore
+		if not scenario.startswith( 'get' ) and not os.path.isfile( os.path.join( working_dir, 'data', DATA_FILES['USERS_FILE'] ) ):
+			print( '** INFO: Running a FULL GET first to fill the buffer.' )
+			run_scenario( 'get', working_dir, source, target, parameters )
+		print( '** INFO: Running {} ...'.format( scenario ) )
+		results.append( run_scenario( scenario, working_dir, source, target, parameters ) )
+
+	source.shutdown()
+	target.shutdown()
+
+	print_results( results, None if fixture else cluster.summary() )
+	results_file = open( os.path.join( working_dir, 'results.json' ), 'w' )
+	results_file.write( json.dumps( { 'size': size, 'options': options, 'parameters': parameters, 'results': results }, indent=2 ) )
+	results_file.close()
+	print( '** INFO: Results saved to {}'.format( os.path.join( working_dir, 'results.json' ) ) )
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+#
+# mock_dcos.py: local stand-in for the DC/OS APIs used by this project
+#
+# Serves the IAM API (/acs/api/v1/...), Marathon (/marathon/v2/...) and every
+# Marathon-on-Marathon instance (/service/[name]/v2/...) and /mesos/slaves from
+# memory, so that the get_* and post_* scripts can be run and measured without
+# a real cluster. The cluster can be empty (to restore to) or filled with a
+# synthetic configuration of any size generated by generate().
+#
+# Usage:
+#   mock_dcos.py [port] [users] [groups] [acls] [apps] [moms]
+# serves a generated cluster of that size on 127.0.0.1:[port] until interrupted.
+# Use 0 users, groups, ACLs and apps to serve an empty cluster.
+#
+# Only what the scripts use is implemented, and only as far as they need it:
+# any token is accepted and Marathon apps are healthy as soon as they are posted.
+
+import sys
+import json
+import random
+import threading
+from urllib.parse import urlparse, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+#actions that can be granted on an ACL
+ACTIONS = [ 'create', 'read', 'update', 'delete', 'full' ]
+
+class Marathon:
+	"""
+	Apps and service groups of a Marathon instance.
+	"""
+
+	def __init__( self ):
+		self.apps = {}				#app id -> app
+		self.groups = set()			#ids of the groups created explicitly
+
+	def add_app( self, app ):
+		app = dict( app )
+		app.update( { 'version': '2017-01-01T00:00:00.000Z', 'tasksRunning': app.get( 'instances', 1 ), 'tasksHealthy': app.get( 'instances', 1 ), 'tasksStaged': 0, 'tasksUnhealthy': 0 } )
+		self.apps[app['id']] = app
+
+	def add_group( self, group ):
+		"""
+		Add a group as posted to /v2/groups, with its apps and groups.
+		"""
+		self.groups.add( group['id'].rstrip( '/' ) or '/' )
+		for app in group.get( 'apps', [] ):
+			self.add_app( app )
+		for child in group.get( 'groups', [] ):
+			self.add_group( child )
+
+	def has_group( self, group_id ):
+		"""
+		Whether a group exists, created explicitly or holding any app.
+		"""
+		group_id = group_id.rstrip( '/' ) or '/'
+		return group_id in self.groups or any( app_id.startswith( group_id+'/' ) for app_id in self.apps )
+
+	def tree( self ):
+		"""
+		Return the root group, with all groups nested and the apps in them.
+		"""
+		nodes = {}
+		def node( group_id ):
+			if group_id not in nodes:
+				nodes[group_id] = { 'id': group_id, 'apps': [], 'groups': [], 'dependencies': [], 'version': '2017-01-01T00:00:00.000Z' }
+				if group_id != '/':
+					node( group_id.rsplit( '/', 1 )[0] or '/' )['groups'].append( nodes[group_id] )
+			return nodes[group_id]
+
+		node( '/' )
+		for group_id in sorted( self.groups ):
+			node( group_id )
+		for app_id in sorted( self.apps ):
+			node( app_id.rsplit( '/', 1 )[0] or '/' )['apps'].append( self.apps[app_id] )
+
+		return nodes['/']
+
+class Cluster:
+	"""
+	In-memory state of a DC/OS cluster, indexed for fast lookups at any size.
+	Every request received is counted by method.
+	"""
+
+	def __init__( self ):
+		self.lock = threading.Lock()
+		self.reset()
+
+	def reset( self ):
+		with self.lock:
+			self.users = {}				#uid -> user
+			self.groups = {}			#gid -> group
+			self.members = {}			#gid -> set of uids
+			self.memberships = {}		#uid -> set of gids
+			self.acls = {}				#rid -> acl
+			self.grants = {}			#rid -> { ( 'users'|'groups', uid|gid ): set of actions }
+			self.group_grants = {}		#gid -> set of rids
+			self.marathons = { '': Marathon() }		#service name ('' for the root Marathon) -> Marathon
+			self.agents = []
+			self.requests = {}			#method -> number of requests received
+
+	def count( self, method ):
+		with self.lock:
+			self.requests[method] = self.requests.get( method, 0 ) + 1
+
+	def add_user( self, uid, description ):
+		self.users[uid] = { 'uid': uid, 'url': '/acs/api/v1/users/'+uid, 'description': description, 'is_remote': False, 'is_service': False }
+
+	def add_group( self, gid, description ):
+		self.groups[gid] = { 'gid': gid, 'url': '/acs/api/v1/groups/'+gid, 'description': description }
+		self.members.setdefault( gid, set() )
+
+	def add_member( self, gid, uid ):
+		self.members.setdefault( gid, set() ).add( uid )
+		self.memberships.setdefault( uid, set() ).add( gid )
+
+	def add_acl( self, rid, description ):
+		self.acls[rid] = { 'rid': rid, 'url': '/acs/api/v1/acls/'+rid, 'description': description }
+		self.grants.setdefault( rid, {} )
+
+	def grant( self, rid, kind, principal, action ):
+		self.grants.setdefault( rid, {} ).setdefault( ( kind, principal ), set() ).add( action )
+		if kind == 'groups':
+			self.group_grants.setdefault( principal, set() ).add( rid )
+
+	def summary( self ):
+		"""
+		Return the number of objects of each kind in the cluster.
+		"""
+		return {
+			'users': len( self.users ),
+			'groups': len( self.groups ),
+			'memberships': sum( len( uids ) for uids in self.members.values() ),
+			'acls': len( self.acls ),
+			'permissions': sum( len( actions ) for principals in self.grants.values() for actions in principals.values() ),
+			'apps': sum( len( marathon.apps ) for marathon in self.marathons.values() ),
+		}
+
+	def marathon( self, service_name ):
+		"""
+		Return the Marathon instance with that service name ('' for the root
+		Marathon), or None if there's no MoM app running with that name.
+		"""
+		if service_name and service_name not in self.marathons:
+			for app in self.marathons[''].apps.values():
+				labels = app.get( 'labels', {} )
+				if labels.get( 'DCOS_PACKAGE_NAME' ) == 'marathon' and labels.get( 'DCOS_SERVICE_NAME' ) == service_name:
+					self.marathons[service_name] = Marathon()
+		return self.marathons.get( service_name )
+
+def generate( cluster, users, groups, acls, apps, moms, principals=2, actions=2, seed=0 ):
+	"""
+	Fill the cluster with a synthetic configuration:
+	- `users` users, each a member of 1 to 3 of the `groups` groups,
+	- `acls` ACLs, each granting `actions` actions to `principals` users or groups,
+	- `apps` apps in nested service groups, spread over the root Marathon and
+	  `moms` Marathon-on-Marathon instances.
+	The same parameters and `seed` always generate the same configuration.
+	"""
+	generator = random.Random( seed )
+	uids = [ 'user{:05d}'.format( index ) for index in range( users ) ]
+	gids = [ 'group{:04d}'.format( index ) for index in range( groups ) ]
+	for uid in uids:
+		cluster.add_user( uid, 'Synthetic user '+uid )
+	for gid in gids:
+		cluster.add_group( gid, 'Synthetic group '+gid )
+	if gids:
+		for uid in uids:
+			for gid in generator.sample( gids, min( len( gids ), generator.randint( 1, 3 ) ) ):
+				cluster.add_member( gid, uid )
+
+	for index in range( acls ):
+		#some rids have slashes, which the scripts need to escape
+		if index % 2:
+			rid = 'dcos:service:marathon:marathon:services:/team{}/service{}'.format( index % 97, index )
+		else:
+			rid = 'dcos:adminrouter:service:service{}'.format( index )
+		cluster.add_acl( rid, 'Synthetic ACL {}'.format( index ) )
+		for principal in range( principals ):
+			if principal % 2 == 0 and uids:
+				kind, principal_id = 'users', generator.choice( uids )
+			elif gids:
+				kind, principal_id = 'groups', generator.choice( gids )
+			else:
+				continue
+			for action in generator.sample( ACTIONS, min( actions, len( ACTIONS ) ) ):
+				cluster.grant( rid, kind, principal_id, action )
+
+	service_names = [ 'mom{}'.format( index ) for index in range( moms ) ]
+	for service_name in service_names:
+		cluster.marathons[''].add_app( {
+			'id': '/'+service_name,
+			'cmd': 'marathon',
+			'cpus': 2, 'mem': 2048, 'instances': 1,
+			'labels': { 'DCOS_PACKAGE_NAME': 'marathon', 'DCOS_SERVICE_NAME': service_name }
+			} )
+		cluster.marathons[service_name] = Marathon()
+	for index in range( apps ):
+		marathon = cluster.marathons[( [ '' ] + service_names )[index % ( moms + 1 )]]
+		marathon.add_app( {
+			'id': '/team{}/project{}/app{}'.format( index % 13, index % 7, index ),
+			'cmd': 'sleep 3600',
+			'cpus': 0.1, 'mem': 64, 'instances': 1,
+			'env': { 'INDEX': str( index ) },
+			'labels': { 'TEAM': 'team{}'.format( index % 13 ) }
+			} )
+
+	for index in range( max( 1, ( apps + 99 ) // 100 ) ):
+		cluster.agents.append( { 'id': 'agent{}'.format( index ), 'hostname': '10.0.{}.{}'.format( index // 250, index % 250 ), 'active': index % 10 != 9, 'reserved_resources': {} if index % 5 else { 'slave_public': {} } } )
+
+class Handler( BaseHTTPRequestHandler ):
+	"""
+	Answers the requests to the cluster in `server.cluster`.
+	"""
+	protocol_version = 'HTTP/1.1'
+	#headers and body are written separately: don't wait to coalesce them
+	disable_nagle_algorithm = True
+
+	def log_message( self, format, *args ):
+		pass
+
+	def send( self, code, body=None ):
+		data = json.dumps( body ).encode() if body is not None else b''
+		self.send_response( code )
+		self.send_header( 'Content-Type', 'application/json' )
+		self.send_header( 'Content-Length', str( len( data ) ) )
+		self.end_headers()
+		self.wfile.write( data )
+
+	def body( self ):
+		length = int( self.headers.get( 'Content-Length' ) or 0 )
+		return json.loads( self.rfile.read( length ) ) if length else None
+
+	def handle_method( self, method ):
+		cluster = self.server.cluster
+		cluster.count( method )
+		url = urlparse( self.path )
+		#ids are escaped twice by the scripts (e.g. '/' as %252F)
+		parts = [ unquote( unquote( part ) ) for part in url.path.split( '/' ) ]
+		body = self.body() if method in ( 'PUT', 'POST', 'PATCH' ) else None
+		with cluster.lock:
+			if url.path.startswith( '/acs/api/v1/' ):
+				code, response = self.acs( cluster, method, parts[4:], body )
+			elif parts[1] == 'marathon' and parts[2:3] == [ 'v2' ]:
+				code, response = self.marathon( cluster.marathon( '' ), method, parts[3:], body )
+			elif parts[1] == 'service' and parts[3:4] == [ 'v2' ] and cluster.marathon( parts[2] ) is not None:
+				code, response = self.marathon( cluster.marathon( parts[2] ), method, parts[4:], body )
+			elif url.path == '/mesos/slaves':
+				code, response = 200, { 'slaves': cluster.agents }
+			else:
+				code, response = 404, { 'message': 'not found' }
+		self.send( code, response )
+
+	def do_GET( self ):
+		self.handle_method( 'GET' )
+
+	def do_PUT( self ):
+		self.handle_method( 'PUT' )
+
+	def do_POST( self ):
+		self.handle_method( 'POST' )
+
+	def do_PATCH( self ):
+		self.handle_method( 'PATCH' )
+
+	def acs( self, cluster, method, path, body ):
+		"""
+		Answer a request to /acs/api/v1/[path]. Returns ( status code, body ).
+		"""
+		resource = path[0] if path else ''
+
+		if resource == 'users':
+			if len( path ) == 1:
+				return 200, { 'array': list( cluster.users.values() ) }
+			uid = path[1]
+			if len( path ) == 2:
+				if method == 'PUT':
+					if uid in cluster.users:
+						return 409, { 'code': 'ERR_USER_EXISTS' }
+					cluster.add_user( uid, body.get( 'description', '' ) )
+					return 201, None
+				if method == 'PATCH' and uid in cluster.users:
+					cluster.users[uid]['description'] = body.get( 'description', '' )
+					return 204, None
+				if uid in cluster.users:
+					return 200, cluster.users[uid]
+			if path[2:] == [ 'groups' ] and uid in cluster.users:
+				return 200, { 'array': [ { 'membershipurl': '/acs/api/v1/groups/{}/users/{}'.format( gid, uid ), 'group': cluster.groups[gid] }
+					for gid in sorted( cluster.memberships.get( uid, () ) ) ] }
+
+		elif resource == 'groups':
+			if len( path ) == 1:
+				return 200, { 'array': list( cluster.groups.values() ) }
+			gid = path[1]
+			if len( path ) == 2:
+				if method == 'PUT':
+					if gid in cluster.groups:
+						return 409, { 'code': 'ERR_GROUP_EXISTS' }
+					cluster.add_group( gid, body.get( 'description', '' ) )
+					return 201, None
+				if method == 'PATCH' and gid in cluster.groups:
+					cluster.groups[gid]['description'] = body.get( 'description', '' )
+					return 204, None
+			elif gid in cluster.groups and path[2:] == [ 'users' ]:
+				return 200, { 'array': [ { 'membershipurl': '/acs/api/v1/groups/{}/users/{}'.format( gid, uid ), 'user': cluster.users[uid] }
+					for uid in sorted( cluster.members.get( gid, () ) ) ] }
+			elif gid in cluster.groups and len( path ) == 4 and path[2] == 'users' and method == 'PUT':
+				if path[3] not in cluster.users:
+					return 400, { 'code': 'ERR_UNKNOWN_USER_ID' }
+				if path[3] in cluster.members[gid]:
+					return 409, { 'code': 'ERR_MEMBERSHIP_EXISTS' }
+				cluster.add_member( gid, path[3] )
+				return 204, None
+			elif gid in cluster.groups and path[2:] == [ 'permissions' ]:
+				return 200, { 'array': [ {
+					'rid': rid,
+					'aclurl': '/acs/api/v1/acls/'+rid,
+					'description': cluster.acls[rid]['description'],
+					'actions': [ { 'name': action, 'url': '/acs/api/v1/acls/{}/groups/{}/{}'.format( rid, gid, action ) }
+						for action in sorted( cluster.grants[rid][( 'groups', gid )] ) ]
+					} for rid in sorted( cluster.group_grants.get( gid, () ) ) ] }
+
+		elif resource == 'acls':
+			if len( path ) == 1:
+				return 200, { 'array': list( cluster.acls.values() ) }
+			rid = path[1]
+			if len( path ) == 2:
+				if method == 'PUT':
+					if rid in cluster.acls:
+						return 409, { 'code': 'ERR_ACL_EXISTS' }
+					cluster.add_acl( rid, body.get( 'description', '' ) )
+					return 201, None
+				if method == 'PATCH' and rid in cluster.acls:
+					cluster.acls[rid]['description'] = body.get( 'description', '' )
+					return 204, None
+			elif rid in cluster.acls and path[2:] == [ 'permissions' ]:
+				permissions = { 'users': [], 'groups': [] }
+				for ( kind, principal ), actions in sorted( cluster.grants[rid].items() ):
+					field, url = ( 'uid', 'userurl' ) if kind == 'users' else ( 'gid', 'groupurl' )
+					permissions[kind].append( {
+						field: principal,
+						url: '/acs/api/v1/{}/{}'.format( kind, principal ),
+						'actions': [ { 'name': action, 'url': '/acs/api/v1/acls/{}/{}/{}/{}'.format( rid, kind, principal, action ) } for action in sorted( actions ) ]
+						} )
+				return 200, permissions
+			elif rid in cluster.acls and len( path ) == 5 and path[2] in ( 'users', 'groups' ):
+				kind, principal, action = path[2:5]
+				granted = action in cluster.grants[rid].get( ( kind, principal ), () )
+				if method == 'GET':
+					return 200, { 'allowed': granted }
+				if method == 'PUT':
+					if principal not in ( cluster.users if kind == 'users' else cluster.groups ):
+						return 400, { 'code': 'ERR_UNKNOWN_PRINCIPAL' }
+					if granted:
+						return 409, { 'code': 'ERR_PERMISSION_EXISTS' }
+					cluster.grant( rid, kind, principal, action )
+					return 204, None
+
+		return 404, { 'code': 'ERR_NOT_FOUND' }
+
+	def marathon( self, marathon, method, path, body ):
+		"""
+		Answer a request to /v2/[path] of a Marathon instance. Returns ( status code, body ).
+		"""
+		resource = path[0] if path else ''
+
+		if resource in ( 'info', 'ping' ):
+			return 200, { 'name': 'marathon', 'version': '1.4.0' }
+
+		if resource == 'groups':
+			if method == 'GET':
+				return 200, marathon.tree()
+			#POST only creates a group, PUT /v2/groups/{group_id} creates or updates it
+			if method == 'POST' and marathon.has_group( body['id'] ):
+				return 409, { 'message': 'Group {} is already created. Use PUT to change this group.'.format( body['id'] ) }
+			if method == 'PUT' and path[1:]:
+				body = dict( body, id='/'+'/'.join( part for part in path[1:] if part ) )
+			if method in ( 'POST', 'PUT' ):
+				marathon.add_group( body )
+				return 201, { 'version': '2017-01-01T00:00:00.000Z', 'deploymentId': 'deployment' }
+
+		if resource == 'apps':
+			app_id = '/'+'/'.join( part for part in path[1:] if part )
+			if method == 'GET' and app_id == '/':
+				return 200, { 'apps': [ marathon.apps[app_id] for app_id in sorted( marathon.apps ) ] }
+			if method == 'GET':
+				if app_id in marathon.apps:
+					return 200, { 'app': marathon.apps[app_id] }
+				return 404, { 'message': 'App \'{}\' does not exist'.format( app_id ) }
+			if method == 'POST':
+				if body['id'] in marathon.apps:
+					return 409, { 'message': 'An app with id [{}] already exists.'.format( body['id'] ) }
+				marathon.add_app( body )
+				return 201, body
+			if method == 'PUT':
+				for app in ( body if isinstance( body, list ) else [ dict( body, id=app_id ) ] ):
+					marathon.add_app( app )
+				return 200, { 'version': '2017-01-01T00:00:00.000Z', 'deploymentId': 'deployment' }
+
+		return 404, { 'message': 'not found' }
+
+def serve( cluster, port=0, handler=Handler, **attributes ):
+	"""
+	Serve the cluster on 127.0.0.1:[port] (any free port if 0) from a thread.
+	`attributes` are set on the server for `handler` to use.
+	Returns the server: its port is server.server_port, stop it with shutdown().
+	"""
+	server = ThreadingHTTPServer( ( '127.0.0.1', port ), handler )
+	server.daemon_threads = True
+	server.cluster = cluster
+	for name, value in attributes.items():
+		setattr( server, name, value )
+	thread = threading.Thread( target=server.serve_forever, daemon=True )
+	thread.start()
+
+	return server
+
+if __name__ == '__main__':
+
+	if len( sys.argv ) not in ( 2, 7 ):
+		print( '** ERROR: usage: mock_dcos.py [port] [users] [groups] [acls] [apps] [moms]' )
+		sys.exit(1)
+
+	cluster = Cluster()
+	if len( sys.argv ) == 7:
+		generate( cluster, *[ int( argument ) for argument in sys.argv[2:7] ] )
+	server = serve( cluster, int( sys.argv[1] ) )
+	print( '** INFO: Mock DC/OS listening on 127.0.0.1:{}'.format( server.server_port ) )
+	try:
+		threading.Event().wait()
+	except KeyboardInterrupt:
+		server.shutdown()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+#
+# replay.py: serve the requests recorded from a real cluster, with configurable
+# latency, jitter and errors
+#
+# Usage:
+#   replay.py [fixture] [port] [profile]
+#
+# The fixture is a file recorded by the scripts with HTTP_RECORD set in env.sh:
+# one line of JSON per request, with its method, path, status, body and time
+# taken. Each request received is answered with the response recorded for the
+# same method and path; if it was recorded several times (e.g. polling a MoM
+# instance until it's up), the responses are served in the order recorded and
+# the last one is repeated. Requests that weren't recorded are answered by an
+# empty mock DC/OS (mock_dcos.py), so that a restore can be replayed too.
+#
+# The profile is an optional JSON file with the latency, jitter and errors to
+# inject, for all requests and for the endpoints matching a regular expression
+# (the first rule that matches is used):
+#   {
+#     "latency": 0.05, "jitter": 0.02, "error_rate": 0, "error_status": 503,
+#     "rules": [
+#       { "method": "GET", "path": "^/acs/api/v1/acls/[^/]+/permissions$", "latency": 0.3, "error_rate": 0.01 }
+#     ]
+#   }
+# Each response is delayed by `latency` seconds plus or minus up to `jitter`,
+# and replaced by an `error_status` response with probability `error_rate`.
+# With "latency": "recorded", each response is delayed by the time it took in
+# the recording, multiplied by "scale" (1 by default).
+
+import sys
+import re
+import json
+import time
+import random
+import threading
+import mock_dcos
+
+#defaults for what the profile doesn't set
+DEFAULT_PROFILE = { 'latency': 0, 'jitter': 0, 'error_rate': 0, 'error_status': 503, 'scale': 1 }
+
+def load_fixture( path ):
+	"""
+	Return the responses recorded in a fixture file, as a dictionary of
+	( method, path ) -> list of recorded exchanges, in the order recorded.
+	"""
+	fixture = {}
+	fixture_file = open( path, 'r' )
+	for line in fixture_file:
+		if line.strip():
+			exchange = json.loads( line )
+			fixture.setdefault( ( exchange['method'], exchange['path'] ), [] ).append( exchange )
+	fixture_file.close()
+
+	return fixture
+
+def load_profile( path ):
+	"""
+	Return the latency profile in a JSON file, or the default (no latency nor
+	errors) if `path` is None. Each rule is completed with the defaults of the
+	profile, and its path compiled.
+	"""
+	profile = dict( DEFAULT_PROFILE )
+	if path is not None:
+		profile_file = open( path, 'r' )
+		profile.update( json.loads( profile_file.read() ) )
+		profile_file.close()
+
+	rules = []
+	for rule in profile.get( 'rules', [] ):
+		complete = { key: value for key, value in profile.items() if key in DEFAULT_PROFILE }
+		complete.update( rule )
+		complete['pattern'] = re.compile( rule.get( 'path', '' ) )
+		rules.append( complete )
+	profile['rules'] = rules
+
+	return profile
+
+class ReplayHandler( mock_dcos.Handler ):
+	"""
+	Answers the requests recorded in `server.fixture`, or passes them to the
+	mock cluster in `server.cluster`, after the latency and errors of
+	`server.profile`.
+	"""
+
+	def rule( self, method, path ):
+		for rule in self.server.profile['rules']:
+			if rule.get( 'method', method ) == method and rule['pattern'].search( path ):
+				return rule
+		return self.server.profile
+
+	def next_exchange( self, key ):
+		"""
+		Return the next response recorded for a ( method, path ), or None.
+		"""
+		with self.server.lock:
+			exchanges = self.server.fixture.get( key )
+			if not exchanges:
+				return None
+			position = self.server.positions.get( key, 0 )
+			self.server.positions[key] = min( position + 1, len( exchanges ) - 1 )
+			return exchanges[position]
+
+	def handle_method( self, method ):
+		rule = self.rule( method, self.path.split( '?' )[0] )
+		exchange = self.next_exchange( ( method, self.path ) )
+
+		if rule['latency'] == 'recorded':
+			delay = ( exchange['elapsed'] if exchange is not None else 0 ) * rule['scale']
+		else:
+			delay = rule['latency'] + random.uniform( -rule['jitter'], rule['jitter'] )
+		if delay > 0:
+			time.sleep( delay )
+
+		if random.random() < rule['error_rate']:
+			self.server.cluster.count( method )
+			self.body()
+			return self.send( rule['error_status'], { 'message': 'injected error' } )
+
+		if exchange is None:
+			return mock_dcos.Handler.handle_method( self, method )
+
+		self.server.cluster.count( method )
+		self.body()
+		data = exchange['body'].encode()
+		self.send_response( exchange['status'] )
+		self.send_header( 'Content-Type', 'application/json' )
+		self.send_header( 'Content-Length', str( len( data ) ) )
+		self.end_headers()
+		self.wfile.write( data )
+
+def serve( fixture=None, profile=None, port=0, cluster=None ):
+	"""
+	Serve the responses in `fixture` (as returned by load_fixture()) with the
+	latency and errors in `profile` (as returned by load_profile()) on
+	127.0.0.1:[port] (any free port if 0) from a thread. Requests not in the
+	fixture are answered by the mock `cluster` (an empty one if None).
+	Returns the server: its port is server.server_port, stop it with shutdown().
+	"""
+	return mock_dcos.serve(
+		cluster or mock_dcos.Cluster(),
+		port,
+		ReplayHandler,
+		fixture=fixture or {},
+		profile=profile or load_profile( None ),
+		positions={},
+		lock=threading.Lock()
+		)
+
+if __name__ == '__main__':
+
+	if len( sys.argv ) not in ( 3, 4 ):
+		print( '** ERROR: usage: replay.py [fixture] [port] [profile]' )
+		sys.exit(1)
+
+	fixture = load_fixture( sys.argv[1] )
+	profile = load_profile( sys.argv[3] if len( sys.argv ) == 4 else None )
+	server = serve( fixture, profile, int( sys.argv[2] ) )
+	print( '** INFO: Replaying {} requests from {} on 127.0.0.1:{}'.format( sum( len( exchanges ) for exchanges in fixture.values() ), sys.argv[1], server.server_port ) )
+	try:
+		threading.Event().wait()
+	except KeyboardInterrupt:
+		server.shutdown()
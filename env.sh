@@ -16,6 +16,63 @@ PASSWORD=deleteme
 DEFAULT_USER_PASSWORD=deleteme
 DEFAULT_USER_SECRET=secret
 WORKING_DIR=$PWD
+#maximum number of concurrent requests against the cluster
+CONCURRENCY=8
+#"adaptive": send fewer requests at a time to the ACS, Marathon or a MoM
+#instance when it slows down or answers 429/5xx, and more (up to CONCURRENCY)
+#while it keeps up; "fixed": always up to CONCURRENCY
+CONCURRENCY_CONTROL="adaptive"
+#HTTP client: connections kept per host, timeout (seconds), retries and backoff factor
+POOL_SIZE=16
+HTTP_TIMEOUT=30
+HTTP_RETRIES=3
+HTTP_BACKOFF=0.5
+#file to record every request and response to, to replay them with bench/replay.py
+#(empty: don't record)
+HTTP_RECORD=""
+#file to write the latency, bytes and errors of the requests by endpoint to
+#after each run, in Prometheus text format (e.g. in the node exporter's
+#textfile collector directory), with the script that ran added before the
+#extension (e.g. dcos_backup.pipeline_get.prom). Empty: only print the summary
+METRICS_FILE=""
+#file to append the spans of each phase of a backup or restore to, to open
+#with chrome://tracing or ui.perfetto.dev (empty: don't trace)
+TRACE_FILE=""
+#how configurations are saved to disk: "copy" the buffer files, "dedup"
+#them into content-addressed objects shared by all configurations, or
+#"archive" them into a single compressed file
+BACKUP_STORE=copy
+#how configurations are restored: "full" posts every object in the buffer,
+#"diff" only sends what is missing or changed in the target cluster
+RESTORE_MODE=full
+#seconds to wait for each Marathon-on-Marathon instance to start when restoring
+MOM_TIMEOUT=600
+#how the phases of a full GET (users, groups, ACLs, service groups) are run:
+#"concurrent" all at the same time, "sequential" one after the other
+FULL_GET_PHASES=concurrent
+#how a full GET retrieves the relations listed from both sides: "shared"
+#retrieves each of them once (the permissions of the groups from those of the
+#ACLs, and requires USERS_GROUPS_SOURCE=groups), "separate" lets each phase
+#request its own
+FULL_GET_FETCH=shared
+#how the group memberships of each user are retrieved in a full GET: "users"
+#asks for them one user at a time (only with FULL_GET_FETCH=separate), "groups"
+#takes them from the groups' members
+USERS_GROUPS_SOURCE=groups
+#how service groups are retrieved: "embedded" gets the groups with their apps in
+#a single request per Marathon, "separate" gets the groups and then the apps
+MARATHON_FETCH=embedded
+#how service groups are restored: "apps" posts the groups and then each app on
+#its own, "tree" posts each top-level group with all its apps in one request
+MARATHON_DEPLOY=apps
+#seconds during which the responses to GETs are kept in the local buffer
+#directory and reused instead of asking DC/OS again (0: don't keep them), and
+#maximum size of the responses kept, in MB. They are removed on any POST
+RESPONSE_CACHE_TTL=0
+RESPONSE_CACHE_SIZE=100
+#seconds during which an interrupted GET or restore resumes from what it had
+#already done, instead of starting over
+CHECKPOINT_MAX_AGE=3600
 
 #not exposed but saved
 #config file is stored hidden in current directory, fixed location
@@ -50,6 +107,10 @@ POST_USERS=$SRC_DIR"/post_users.py"
 POST_GROUPS=$SRC_DIR"/post_groups.py"
 POST_ACLS=$SRC_DIR"/post_acls.py" 
 POST_SERVICE_GROUPS=$SRC_DIR"/post_service_groups.py"
+PIPELINE=$SRC_DIR"/pipeline.py"
+STORE=$SRC_DIR"/store.py"
+ARCHIVE=$SRC_DIR"/archive.py"
+IAM=$SRC_DIR"/iam.py"
 
 
 #formatting env vars
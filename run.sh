@@ -97,24 +97,9 @@ function load_configuration {
 #config is stored directly on JSON format
 if [ -f $CONFIG_FILE ]; then
 
-	DCOS_IP=$(cat $CONFIG_FILE | jq -r '.DCOS_IP')
-	USERNAME=$(cat $CONFIG_FILE | jq -r '.USERNAME')
-	PASSWORD=$(cat $CONFIG_FILE | jq -r '.PASSWORD')
-	TOKEN=$(cat $CONFIG_FILE | jq -r '.TOKEN')
-	DEFAULT_USER_PASSWORD=$(cat $CONFIG_FILE | jq -r '.DEFAULT_USER_PASSWORD')
-	DEFAULT_USER_SECRET=$(cat $CONFIG_FILE | jq -r '.DEFAULT_USER_SECRET')
-	WORKING_DIR=$(cat $CONFIG_FILE | jq -r '.WORKING_DIR')
-	CONFIG_FILE=$(cat $CONFIG_FILE | jq -r '.CONFIG_FILE')
-	USERS_FILE=$(cat $CONFIG_FILE | jq -r '.USERS_FILE')
-	USERS_GROUPS_FILE=$(cat $CONFIG_FILE | jq -r '.USERS_GROUPS_FILE')
-	GROUPS_FILE=$(cat $CONFIG_FILE | jq -r '.GROUPS_FILE')
-	GROUPS_USERS_FILE=$(cat $CONFIG_FILE | jq -r '.GROUPS_USERS_FILE')
-	ACLS_FILE=$(cat $CONFIG_FILE | jq -r '.ACLS_FILE')
-	ACLS_PERMISSIONS_FILE=$(cat $CONFIG_FILE | jq -r '.ACLS_PERMISSIONS_FILE')
-	SERVICE_GROUPS_FILE=$(cat $CONFIG_FILE | jq -r '.SERVICE_GROUPS_FILE')
-	SERVICE_GROUPS_MOM_FILE=$(cat $CONFIG_FILE | jq -r '.SERVICE_GROUPS_MOM_FILE')
-	APPS_FILE=$(cat $CONFIG_FILE | jq -r '.APPS_FILE')
-	APPS_MOM_FILE=$(cat $CONFIG_FILE | jq -r '.APPS_MOM_FILE')	
+	#read all the parameters with a single jq invocation, as shell-quoted
+	#assignments. Parameters missing from the file keep their env.sh default.
+	eval "$( jq -r 'to_entries[] | "\(.key)=\(.value | @sh)"' $CONFIG_FILE )"
 
 else
 	$CLS
@@ -135,8 +120,11 @@ function show_configuration {
 function delete_local_buffer {
 #erase the current local buffer to start clean
 	echo "** Erasing local buffer ..."
+	#the journals of interrupted GETs in $DATA_DIR/.checkpoints are kept
+	#so that the next GET can resume from them
+	#as are the responses cached in $DATA_DIR/.cache, which expire on their own
 	if [ "$(ls -A $DATA_DIR)" ]; then
-		rm $DATA_DIR/*
+		rm -f $DATA_DIR/*
 	fi
 }
 
@@ -162,6 +150,26 @@ function save_configuration {
 "\"SERVICE_GROUPS_MOM_FILE"\": "\"$SERVICE_GROUPS_MOM_FILE"\",  \
 "\"APPS_FILE"\": "\"$APPS_FILE"\",  \
 "\"APPS_MOM_FILE"\": "\"$APPS_MOM_FILE"\",  \
+"\"CONCURRENCY"\": "\"$CONCURRENCY"\",  \
+"\"CONCURRENCY_CONTROL"\": "\"$CONCURRENCY_CONTROL"\",  \
+"\"POOL_SIZE"\": "\"$POOL_SIZE"\",  \
+"\"HTTP_TIMEOUT"\": "\"$HTTP_TIMEOUT"\",  \
+"\"HTTP_RETRIES"\": "\"$HTTP_RETRIES"\",  \
+"\"HTTP_BACKOFF"\": "\"$HTTP_BACKOFF"\",  \
+"\"HTTP_RECORD"\": "\"$HTTP_RECORD"\",  \
+"\"METRICS_FILE"\": "\"$METRICS_FILE"\",  \
+"\"TRACE_FILE"\": "\"$TRACE_FILE"\",  \
+"\"BACKUP_STORE"\": "\"$BACKUP_STORE"\",  \
+"\"RESTORE_MODE"\": "\"$RESTORE_MODE"\",  \
+"\"MOM_TIMEOUT"\": "\"$MOM_TIMEOUT"\",  \
+"\"FULL_GET_PHASES"\": "\"$FULL_GET_PHASES"\",  \
+"\"FULL_GET_FETCH"\": "\"$FULL_GET_FETCH"\",  \
+"\"USERS_GROUPS_SOURCE"\": "\"$USERS_GROUPS_SOURCE"\",  \
+"\"MARATHON_FETCH"\": "\"$MARATHON_FETCH"\",  \
+"\"MARATHON_DEPLOY"\": "\"$MARATHON_DEPLOY"\",  \
+"\"RESPONSE_CACHE_TTL"\": "\"$RESPONSE_CACHE_TTL"\",  \
+"\"RESPONSE_CACHE_SIZE"\": "\"$RESPONSE_CACHE_SIZE"\",  \
+"\"CHECKPOINT_MAX_AGE"\": "\"$CHECKPOINT_MAX_AGE"\",  \
 "\"TOKEN"\": "\"$TOKEN"\"  \
 } \
 "
@@ -173,8 +181,11 @@ function save_configuration {
 function delete_local_buffer {
 #erase the current local buffer to start clean
 	echo "** Erasing local buffer ..."
+	#the journals of interrupted GETs in $DATA_DIR/.checkpoints are kept
+	#so that the next GET can resume from them
+	#as are the responses cached in $DATA_DIR/.cache, which expire on their own
 	if [ "$(ls -A $DATA_DIR)" ]; then
-		rm $DATA_DIR/*
+		rm -f $DATA_DIR/*
 	fi
 }
 
@@ -182,7 +193,7 @@ function list_iam_configurations {
 #list the configurations currenctly available on disk
 	echo -e "** Configurations currently available on disk:"
 	echo -e "${BLUE}"
-	ls -A1l $BACKUP_DIR | grep ^d | awk '{print $9}'
+	ls -1l $BACKUP_DIR | grep ^d | awk '{print $9}'
 	echo -e "${NC}"
 }
 
@@ -193,6 +204,38 @@ function save_iam_configuration(){
 	if [ -z "$1" ]; then
 		echo "** ERROR: save_iam_configuration: no parameter received"
 		return 1
+	elif [ "$BACKUP_STORE" == "dedup" ]; then
+		#store only the objects that changed since previous backups, plus a manifest
+		ID="$1"
+		mkdir -p $BACKUP_DIR/$ID/
+		if python3 $STORE save $ID; then
+			STATUS=0
+		else
+			STATUS=$?
+		fi
+		chmod -R 0700 $BACKUP_DIR/$ID/ $BACKUP_DIR/.objects/
+		if [ $STATUS -ne 0 ]; then
+			echo -e "** ${RED}ERROR${NC}: Configuration [ "${BLUE}$ID${NC}" ] could not be saved completely at [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+			return 1
+		fi
+		echo -e "** Configuration saved to disk with name [ "${BLUE}$ID${NC}" ] at [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+		return 0
+	elif [ "$BACKUP_STORE" == "archive" ]; then
+		#compress all buffer files into a single archive with a table of contents
+		ID="$1"
+		mkdir -p $BACKUP_DIR/$ID/
+		if python3 $ARCHIVE pack $ID; then
+			STATUS=0
+		else
+			STATUS=$?
+		fi
+		chmod -R 0700 $BACKUP_DIR/$ID/
+		if [ $STATUS -ne 0 ]; then
+			echo -e "** ${RED}ERROR${NC}: Configuration [ "${BLUE}$ID${NC}" ] could not be saved completely at [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+			return 1
+		fi
+		echo -e "** Configuration saved to disk with name [ "${BLUE}$ID${NC}" ] at [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+		return 0
 	else
 		ID="$1"
 		mkdir -p $BACKUP_DIR/$ID/
@@ -264,6 +307,24 @@ function load_iam_configuration(){
 	if [ -z "$1" ]; then
 		echo "** ERROR: load_iam_configuration: no parameter received"
 		return 1
+	elif [ -f $BACKUP_DIR/"$1"/manifest.json ]; then
+		#deduplicated configuration: rebuild the buffer from its manifest
+		ID="$1"
+		if ! python3 $STORE load $ID; then
+			echo -e "** ${RED}ERROR${NC}: Configuration [ "${BLUE}$ID${NC}" ] could not be loaded completely from [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+			return 1
+		fi
+		echo -e "** Configuration loaded from disk with name [ "${BLUE}$ID${NC}" ] at [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+		return 0
+	elif [ -f $BACKUP_DIR/"$1"/config.dcbak ]; then
+		#archived configuration: extract the buffer files from the archive
+		ID="$1"
+		if ! python3 $ARCHIVE unpack $ID; then
+			echo -e "** ${RED}ERROR${NC}: Configuration [ "${BLUE}$ID${NC}" ] could not be loaded completely from [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+			return 1
+		fi
+		echo -e "** Configuration loaded from disk with name [ "${BLUE}$ID${NC}" ] at [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+		return 0
 	elif [ -d $BACKUP_DIR/"$1" ]; then
 		ID="$1"
 		cp $BACKUP_DIR/$ID/$( basename $USERS_FILE )  $USERS_FILE
@@ -284,6 +345,30 @@ function load_iam_configuration(){
 	fi
 }
 
+function delete_iam_configuration(){
+	#delete from disk a configuration saved previously, and the deduplicated
+	#objects that no other configuration uses
+	#receives the name of config to delete as first parameter
+
+	if [ -z "$1" ]; then
+		echo "** ERROR: delete_iam_configuration: no parameter received"
+		return 1
+	elif [[ "$1" == .* ]] || [[ "$1" == */* ]] || [ ! -d $BACKUP_DIR/"$1" ]; then
+		echo "** ERROR: configuration [ "${RED} $1 ${NC}" ] not found."
+		return 1
+	fi
+	ID="$1"
+	rm -rf $BACKUP_DIR/"$ID"
+	echo -e "** Configuration [ "${BLUE}$ID${NC}" ] deleted from [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+	if [ -d $BACKUP_DIR/.objects ]; then
+		if ! python3 $STORE gc; then
+			echo -e "** ${RED}ERROR${NC}: the objects no longer used in [ "${RED}$BACKUP_DIR/.objects${NC}" ] could not be removed."
+			return 1
+		fi
+	fi
+	return 0
+}
+
 function printf_new() {
 #for passwords not visible, print a string N times
  str=$1
@@ -314,6 +399,26 @@ function delete_token(){
 "\"SERVICE_GROUPS_MOM_FILE"\": "\"$SERVICE_GROUPS_MOM_FILE"\",  \
 "\"APPS_FILE"\": "\"$APPS_FILE"\",  \
 "\"APPS_MOM_FILE"\": "\"$APPS_MOM_FILE"\",  \
+"\"CONCURRENCY"\": "\"$CONCURRENCY"\",  \
+"\"CONCURRENCY_CONTROL"\": "\"$CONCURRENCY_CONTROL"\",  \
+"\"POOL_SIZE"\": "\"$POOL_SIZE"\",  \
+"\"HTTP_TIMEOUT"\": "\"$HTTP_TIMEOUT"\",  \
+"\"HTTP_RETRIES"\": "\"$HTTP_RETRIES"\",  \
+"\"HTTP_BACKOFF"\": "\"$HTTP_BACKOFF"\",  \
+"\"HTTP_RECORD"\": "\"$HTTP_RECORD"\",  \
+"\"METRICS_FILE"\": "\"$METRICS_FILE"\",  \
+"\"TRACE_FILE"\": "\"$TRACE_FILE"\",  \
+"\"BACKUP_STORE"\": "\"$BACKUP_STORE"\",  \
+"\"RESTORE_MODE"\": "\"$RESTORE_MODE"\",  \
+"\"MOM_TIMEOUT"\": "\"$MOM_TIMEOUT"\",  \
+"\"FULL_GET_PHASES"\": "\"$FULL_GET_PHASES"\",  \
+"\"FULL_GET_FETCH"\": "\"$FULL_GET_FETCH"\",  \
+"\"USERS_GROUPS_SOURCE"\": "\"$USERS_GROUPS_SOURCE"\",  \
+"\"MARATHON_FETCH"\": "\"$MARATHON_FETCH"\",  \
+"\"MARATHON_DEPLOY"\": "\"$MARATHON_DEPLOY"\",  \
+"\"RESPONSE_CACHE_TTL"\": "\"$RESPONSE_CACHE_TTL"\",  \
+"\"RESPONSE_CACHE_SIZE"\": "\"$RESPONSE_CACHE_SIZE"\",  \
+"\"CHECKPOINT_MAX_AGE"\": "\"$CHECKPOINT_MAX_AGE"\",  \
 "\"TOKEN"\": "\""\"  \
 } \
 "
@@ -360,7 +465,7 @@ if [[ $# -ne 0 ]]; then
 			print_help
 			echo -e "** Configurations currently available on disk:"
 			echo -e "${BLUE}"
-			ls -A1l $BACKUP_DIR | grep ^d | awk '{print $9}'
+			ls -1l $BACKUP_DIR | grep ^d | awk '{print $9}'
 			echo -e "${NC}"
 			exit 0
 	fi
@@ -421,10 +526,11 @@ if [[ $# -ne 0 ]]; then
 			fi
 			CONFIG_NAME="$2"
 			echo -e "** GET from ${RED}$DCOS_IP${NC} into ${RED}$CONFIG_NAME${NC}: Proceeding..."
-			python3 $GET_USERS
-			python3 $GET_GROUPS
-			python3 $GET_ACLS
-			python3 $GET_SERVICE_GROUPS
+			#a failed or partial GET is not saved as a configuration
+			if ! python3 $PIPELINE get; then
+				echo -e "** ${RED}ERROR${NC}: FULL GET did not complete. Configuration [ "${BLUE}$CONFIG_NAME${NC}" ] NOT saved."
+				exit 1
+			fi
 			save_iam_configuration $CONFIG_NAME
 			list_iam_configurations
 	    	shift # past argument
@@ -439,10 +545,10 @@ if [[ $# -ne 0 ]]; then
 		echo -e "** PUT from ${RED}$CONFIG_NAME${NC} into ${RED}$DCOS_IP${NC}: Proceeding..."
 	    	get_token
 	    	load_iam_configuration $CONFIG_NAME
-	    	python3 $POST_USERS
-	    	python3 $POST_GROUPS
-	    	python3 $POST_ACLS
-	    	python3 $POST_SERVICE_GROUPS
+	    	if ! python3 $PIPELINE post; then
+	    		echo -e "** ${RED}ERROR${NC}: FULL POST did not complete. Run it again to send only what remains."
+	    		exit 1
+	    	fi
 	    	shift # past argument
 	    	;;
 	    -n|--nodes)
@@ -570,6 +676,7 @@ while true; do
 	echo -e "${BLUE}d${NC}) List configurations currently available on disk."
 	echo -e "${BLUE}l${NC}) Load a configuration from disk into local buffer."
 	echo -e "${BLUE}s${NC}) Save current local buffer status to disk."
+	echo -e "${BLUE}r${NC}) Remove a configuration from disk."
 	echo -e "*****************************************************************"
 	echo -e "** ${BLUE}GET${NC} configuration from a running DC/OS into local buffer:"
 	echo -e "**"
@@ -593,6 +700,7 @@ while true; do
 	echo -e "${BLUE}8${NC}) Check groups and memberships currently in local buffer."
 	echo -e "${BLUE}9${NC}) Check ACLs and permissions currently in local buffer."
 	echo -e "${BLUE}o${NC}) Check Service Groups currently in local buffer."
+	echo -e "${BLUE}q${NC}) Query what users and groups can do in local buffer."
 	echo -e "${BLUE}0${NC}) Check this program's current configuration."
 	echo -e "*****************************************************************"
 	echo -e "** ${BLUE}CHECK${NC} cluster status:"
@@ -612,23 +720,24 @@ while true; do
 			;;
 
 			[lL]) echo -e "${BLUE}"
-				ls -A1l $BACKUP_DIR | grep ^d | awk '{print $9}'
+				ls -1l $BACKUP_DIR | grep ^d | awk '{print $9}'
 				echo -e "${NC}"
 				echo -e "${BLUE}WARNING${NC}: Current local buffer will be OVERWRITTEN"
 				ID=""
 				while [[ -z "$ID" ]]; do
 					read -p "** Please enter the name of a saved configuration to load to buffer: " ID
 				done
-				#TODO: check that it actually exists
-				load_iam_configuration $ID
-				load_configuration
-				echo -e "** Configuration loaded from disk with name [ "${BLUE}$ID${NC}" ] at [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+				#errors are shown by load_iam_configuration
+				if load_iam_configuration $ID; then
+					load_configuration
+					echo -e "** Configuration loaded from disk with name [ "${BLUE}$ID${NC}" ] at [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+				fi
 				read -p "press ENTER to continue..."
 			;;
 
 			[sS]) echo -e "** Currently available configurations:"
 				echo -e "${BLUE}"
-				ls -A1l $BACKUP_DIR | grep ^d | awk '{print $9}'
+				ls -1l $BACKUP_DIR | grep ^d | awk '{print $9}'
 				echo -e "${NC}"
 				echo -e "${BLUE}WARNING${NC}: If a configuration under this name exists, it will be OVERWRITTEN)"
 				ID=""
@@ -636,8 +745,34 @@ while true; do
 					read -p "** Please enter a name to save buffer under: " ID
 				done
 				#TODO: check if it exists and fail if it does
-				save_iam_configuration $ID
-				echo -e "** Configuration saved to disk with name [ "${BLUE}$ID${NC}" ] at [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+				#errors are shown by save_iam_configuration
+				if save_iam_configuration $ID; then
+					echo -e "** Configuration saved to disk with name [ "${BLUE}$ID${NC}" ] at [ "${RED}$BACKUP_DIR/$ID${NC}" ]"
+				fi
+				read -p "** Press ENTER to continue"
+			;;
+
+			[rR]) echo -e "** Currently available configurations:"
+				list_iam_configurations
+				ID=""
+				while [[ -z "$ID" ]]; do
+					read -p "** Please enter the name of a saved configuration to remove: " ID
+				done
+				echo -e "${BLUE}WARNING${NC}: Configuration [ "${BLUE}$ID${NC}" ] will be DELETED from disk"
+				read -p "Confirm? (y/n): " REPLY
+				case $REPLY in
+					[yY]) echo ""
+						#errors are shown by delete_iam_configuration
+						if delete_iam_configuration $ID; then
+							list_iam_configurations
+						fi
+						;;
+					[nN]) echo ""
+						echo "** Cancelled."
+						;;
+					*) echo -e "** ${RED}ERROR${NC}: Invalid input."
+						;;
+				esac
 				read -p "** Press ENTER to continue"
 			;;
 
@@ -754,17 +889,17 @@ while true; do
 
 					[yY]) echo ""
 						echo "** Proceeding."
-						python3 $GET_USERS
-						python3 $GET_GROUPS
-						python3 $GET_ACLS
-						python3 $GET_SERVICE_GROUPS
+						if python3 $PIPELINE get; then
+							GET_FULL_OK=$PASS
+							GET_USERS_OK=$PASS
+							GET_GROUPS_OK=$PASS
+							GET_ACLS_OK=$PASS
+							GET_SERVICE_GROUPS_OK=$PASS
+						else
+							echo -e "** ${RED}ERROR${NC}: FULL GET did not complete. Do not SAVE the buffer: run the GET again to resume."
+							GET_FULL_OK=$FAIL
+						fi
 						read -p "** Press ENTER to continue"
-						#TODO: validate result
-						GET_FULL_OK=$PASS
-						GET_USERS_OK=$PASS
-						GET_GROUPS_OK=$PASS
-						GET_ACLS_OK=$PASS
-						GET_SERVICE_GROUPS_OK=$PASS
 						;;
 					[nN]) echo ""
 						echo "** Cancelled."
@@ -886,17 +1021,17 @@ while true; do
 
 					[yY]) echo ""
 						echo "** Proceeding."
-						python3 $POST_USERS
-						python3 $POST_GROUPS
-						python3 $POST_ACLS
-						python3 $POST_SERVICE_GROUPS
+						if python3 $PIPELINE post; then
+							POST_FULL_OK=$PASS
+							POST_USERS_OK=$PASS
+							POST_GROUPS_OK=$PASS
+							POST_ACLS_OK=$PASS
+							POST_SERVICE_GROUPS_OK=$PASS
+						else
+							echo -e "** ${RED}ERROR${NC}: FULL POST did not complete. Run it again to send only what remains."
+							POST_FULL_OK=$FAIL
+						fi
 						read -p "** Press ENTER to continue"
-						#TODO: validate result
-						POST_FULL_OK=$PASS
-						POST_USERS_OK=$PASS
-						POST_GROUPS_OK=$PASS
-						POST_ACLS_OK=$PASS
-						POST_SERVICE_GROUPS_OK=$PASS
 						;;
 					[nN]) echo ""
 						echo "** Cancelled."
@@ -956,6 +1091,12 @@ while true; do
 				fi
 			;;
 
+			[qQ]) echo -e "** Queries: summary | user [uid] | group [gid] | rid [rid] [action] | check [uid] [rid] [action]"
+				read -p "** Please enter a query: " QUERY
+				python3 $IAM $QUERY || true
+				read -p "** Press ENTER to continue"
+			;;
+
 			[0]) if [ -f $CONFIG_FILE ]; then
 					echo -e "** Configuration currently in buffer [ "${RED}$CONFIG_FILE${NC}" ] is:"
 					show_configuration
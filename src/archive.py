@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+#
+# archive.py: save and load configurations as a single compressed archive
+#
+# Usage:
+#   archive.py pack   [configuration_name]               - archive the local buffer
+#   archive.py unpack [configuration_name] [entity ...]  - restore the local buffer (or only some entities)
+#   archive.py list   [configuration_name]               - show the table of contents
+#   archive.py cat    [configuration_name] [entity]      - print one entity, e.g. "acls_permissions"
+#
+# The archive is stored in backup/[name]/config.dcbak and is laid out as:
+#   - a magic header,
+#   - one gzip member per buffer file, compressed in chunks as it's read,
+#   - a table of contents in JSON, with the offset and size of each member,
+#   - a fixed-size footer with the offset and length of the table of contents.
+# Any entity can be extracted by seeking straight to its member, without
+# decompressing the rest of the archive.
+
+import sys
+import os
+import json
+import zlib
+import struct
+import helpers			#helper functions in separate module helpers.py
+
+#file in each configuration's directory holding the archive
+ARCHIVE_FILE = 'config.dcbak'
+MAGIC = b'DCOSBAK1'
+#footer: table of contents offset and length, and a magic string to check it
+FOOTER = struct.Struct( '>QQ8s' )
+FOOTER_MAGIC = b'DCOSTOC1'
+#size of the chunks read, compressed and decompressed at a time
+CHUNK_SIZE = 64 * 1024
+#zlib window bits to produce and read gzip-compatible members
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+def archive_path( config, name ):
+	"""
+	Return the location of the archive of the configuration called `name`.
+	"""
+	return os.path.join( config['WORKING_DIR'], 'backup', name, ARCHIVE_FILE )
+
+def entity_name( path ):
+	"""
+	Return the name of the entity stored in a buffer file, e.g. "acls_permissions".
+	"""
+	return os.path.splitext( os.path.basename( path ) )[0]
+
+def pack( config, name ):
+	"""
+	Save the files in the local buffer as an archive for the configuration called `name`.
+	Returns False if any of them is missing or can't be read: the others are
+	archived anyway.
+	"""
+	path = archive_path( config, name )
+	os.makedirs( os.path.dirname( path ), exist_ok=True )
+	toc = { 'entries': {} }
+	ok = True
+
+	#write to a temporary file first so that a half-written archive is never visible
+	archive_file = open( path+'.tmp', 'wb' )
+	archive_file.write( MAGIC )
+	for key in helpers.BUFFER_FILES:
+		if not os.path.isfile( config[key] ):
+			print( '**ERROR: save configuration: {} not retrieved before save. Please GET or LOAD and save again.'.format( os.path.basename( config[key] ) ) )
+			ok = False
+			continue
+		try:
+			buffer_file = open( config[key], 'rb' )
+		except OSError as error:
+			print( '**ERROR: save configuration: {} could not be read: {}'.format( os.path.basename( config[key] ), error ) )
+			ok = False
+			continue
+
+		offset = archive_file.tell()
+		size = 0
+		crc = 0
+		compressor = zlib.compressobj( 9, zlib.DEFLATED, GZIP_WBITS )
+		while True:
+			chunk = buffer_file.read( CHUNK_SIZE )
+			if not chunk:
+				break
+			size += len( chunk )
+			crc = zlib.crc32( chunk, crc )
+			archive_file.write( compressor.compress( chunk ) )
+		buffer_file.close()
+		archive_file.write( compressor.flush() )
+
+		toc['entries'][entity_name( config[key] )] = {
+			'offset':	offset,
+			'length':	archive_file.tell() - offset,
+			'size':		size,
+			'crc32':	crc
+		}
+
+	toc_data = json.dumps( toc ).encode( 'utf-8' )
+	toc_offset = archive_file.tell()
+	archive_file.write( toc_data )
+	archive_file.write( FOOTER.pack( toc_offset, len( toc_data ), FOOTER_MAGIC ) )
+	archive_file.close()
+	os.replace( path+'.tmp', path )
+
+	return ok
+
+def read_toc( archive_file ):
+	"""
+	Read the table of contents of an open archive.
+	Returns None if the file is not a valid archive.
+	"""
+	archive_file.seek( 0 )
+	if archive_file.read( len( MAGIC ) ) != MAGIC:
+		return None
+	try:
+		archive_file.seek( -FOOTER.size, os.SEEK_END )
+		toc_offset, toc_length, footer_magic = FOOTER.unpack( archive_file.read( FOOTER.size ) )
+		if footer_magic != FOOTER_MAGIC:
+			return None
+		archive_file.seek( toc_offset )
+		return json.loads( archive_file.read( toc_length ).decode( 'utf-8' ) )
+	except ( OSError, ValueError, struct.error ):
+		#truncated or corrupted
+		return None
+
+def extract( archive_file, entry, output ):
+	"""
+	Decompress one member of an open archive, described by its table of contents
+	`entry`, into the binary file `output`. Returns True if its checksum matches.
+	"""
+	archive_file.seek( entry['offset'] )
+	remaining = entry['length']
+	crc = 0
+	decompressor = zlib.decompressobj( GZIP_WBITS )
+	while remaining > 0:
+		chunk = archive_file.read( min( CHUNK_SIZE, remaining ) )
+		if not chunk:
+			break
+		remaining -= len( chunk )
+		data = decompressor.decompress( chunk )
+		crc = zlib.crc32( data, crc )
+		output.write( data )
+	data = decompressor.flush()
+	crc = zlib.crc32( data, crc )
+	output.write( data )
+
+	return crc == entry['crc32']
+
+def unpack( config, name, entities=None ):
+	"""
+	Rebuild the files in the local buffer from the archive of the configuration
+	called `name`. If a list of `entities` is given, only those are extracted.
+	"""
+	path = archive_path( config, name )
+	if not os.path.isfile( path ):
+		print( '** ERROR: configuration [ {} ] not found.'.format( name ) )
+		return False
+
+	ok = True
+	archive_file = open( path, 'rb' )
+	toc = read_toc( archive_file )
+	if toc is None:
+		print( '** ERROR: [ {} ] is not a valid archive.'.format( path ) )
+		archive_file.close()
+		return False
+
+	for key in helpers.BUFFER_FILES:
+		entity = entity_name( config[key] )
+		if entities and entity not in entities:
+			continue
+		if entity not in toc['entries']:
+			print( '**ERROR: load configuration: {} not found in [ {} ].'.format( entity, name ) )
+			ok = False
+			continue
+		buffer_file = open( config[key], 'wb' )
+		try:
+			intact = extract( archive_file, toc['entries'][entity], buffer_file )
+		except zlib.error:
+			intact = False
+		if not intact:
+			print( '** ERROR: load configuration: {} is corrupted in [ {} ].'.format( entity, name ) )
+			ok = False
+		buffer_file.close()
+	archive_file.close()
+
+	return ok
+
+if __name__ == '__main__':
+
+	#Load configuration if it exists
+	#config is stored directly in JSON format in a fixed location
+	config_file = os.getcwd()+'/.config.json'
+	config = helpers.get_config( config_file )				#returns config as a dictionary
+	if len( config ) == 0:
+		sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first\n' )
+		sys.exit(1)
+
+	if len( sys.argv ) < 3 or sys.argv[1] not in ( 'pack', 'unpack', 'list', 'cat' ) \
+		or ( sys.argv[1] == 'cat' and len( sys.argv ) != 4 ):
+		print( '** ERROR: usage: archive.py [pack|unpack|list|cat] [configuration_name] [entity ...]' )
+		sys.exit(1)
+
+	command = sys.argv[1]
+	name = sys.argv[2]
+	if command == 'pack':
+		ok = pack( config, name )
+	elif command == 'unpack':
+		ok = unpack( config, name, sys.argv[3:] )
+	else:
+		path = archive_path( config, name )
+		if not os.path.isfile( path ):
+			print( '** ERROR: configuration [ {} ] not found.'.format( name ) )
+			sys.exit(1)
+		archive_file = open( path, 'rb' )
+		toc = read_toc( archive_file )
+		if toc is None:
+			print( '** ERROR: [ {} ] is not a valid archive.'.format( path ) )
+			sys.exit(1)
+		if command == 'list':
+			for entity, entry in toc['entries'].items():
+				print( '{0:32} {1:>12} bytes {2:>12} compressed'.format( entity, entry['size'], entry['length'] ) )
+			ok = True
+		elif sys.argv[3] not in toc['entries']:
+			print( '** ERROR: entity [ {} ] not found in [ {} ].'.format( sys.argv[3], name ) )
+			ok = False
+		else:
+			ok = extract( archive_file, toc['entries'][sys.argv[3]], sys.stdout.buffer )
+			sys.stdout.flush()
+		archive_file.close()
+	if not ok:
+		sys.exit(1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#
+# cache.py: responses to GET requests kept on disk for a while
+#
+# With RESPONSE_CACHE_TTL set in env.sh, the body of every successful GET sent
+# by the shared client is saved in the local buffer directory, under .cache/,
+# and a GET for the same URL within RESPONSE_CACHE_TTL seconds is answered from
+# there without asking DC/OS. This way, running GET Users, then GET Groups and
+# then a FULL GET from the menu doesn't download the same lists again.
+# The cache holds up to RESPONSE_CACHE_SIZE MB: when it's full, the oldest
+# responses are removed first. It's emptied whenever anything is written to
+# DC/OS, and at the start of a restore, as the responses may no longer hold.
+
+import os
+import time
+import hashlib
+import threading
+import collections
+import requests
+
+#directory in the local buffer directory holding the responses
+CACHE_DIR = '.cache'
+
+class ResponseCache:
+	"""
+	Bodies of the GET responses, one file per URL named after its SHA-256,
+	valid for `ttl` seconds from when they were saved, up to `max_bytes` in
+	total.
+	The files are listed once, when it's created: from then on, the size of
+	each file is kept in `entries`, oldest first, so that removing the oldest
+	doesn't list the directory again.
+	"""
+
+	def __init__( self, config, ttl, max_bytes ):
+		self.directory = os.path.join( os.path.dirname( config['USERS_FILE'] ), CACHE_DIR )
+		self.ttl = ttl
+		self.max_bytes = max_bytes
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.entries = collections.OrderedDict()		#path -> size of the responses saved, oldest first
+		os.makedirs( self.directory, exist_ok=True )
+		#remove what has expired since the last run and measure the rest
+		self.size = 0
+		saved = []
+		for entry in os.scandir( self.directory ):
+			stat = entry.stat()
+			if entry.name.endswith( '.tmp' ) or self.expired( stat ):
+				self.remove( entry.path )
+			else:
+				saved.append( ( stat.st_mtime, entry.path, stat.st_size ) )
+		for mtime, path, size in sorted( saved ):
+			self.entries[path] = size
+			self.size += size
+
+	def path( self, url ):
+		return os.path.join( self.directory, hashlib.sha256( url.encode() ).hexdigest() )
+
+	def expired( self, stat ):
+		return time.time() - stat.st_mtime > self.ttl
+
+	def remove( self, path ):
+		try:
+			os.remove( path )
+		except FileNotFoundError:
+			pass
+
+	def get( self, url ):
+		"""
+		Return the response saved for a URL as a requests.Response, or None
+		if there's none or it has expired.
+		"""
+		path = self.path( url )
+		try:
+			if self.expired( os.stat( path ) ):
+				return None
+			cached_file = open( path, 'rb' )
+		except FileNotFoundError:
+			return None
+		body = cached_file.read()
+		cached_file.close()
+
+		response = requests.Response()
+		response.status_code = 200
+		response.url = url
+		response.encoding = 'utf-8'
+		response._content = body
+		with self.lock:
+			self.hits += 1
+
+		return response
+
+	def put( self, url, response ):
+		"""
+		Save the body of a response, removing the oldest responses if the
+		cache goes over its size.
+		"""
+		path = self.path( url )
+		#write to a temporary file first so that a half-written response is never used
+		temporary_path = '{}.{}.tmp'.format( path, threading.get_ident() )
+		cached_file = open( temporary_path, 'wb' )
+		cached_file.write( response.content )
+		cached_file.close()
+		with self.lock:
+			os.replace( temporary_path, path )
+			#the response replaced, if any, is now the newest
+			self.size -= self.entries.pop( path, 0 )
+			self.entries[path] = len( response.content )
+			self.size += len( response.content )
+			if self.size > self.max_bytes:
+				self.evict()
+
+	def evict( self ):
+		#the caller holds the lock
+		while self.entries and self.size > self.max_bytes:
+			path, size = self.entries.popitem( last=False )
+			self.size -= size
+			self.remove( path )
+
+	def clear( self ):
+		"""
+		Remove every response saved.
+		"""
+		with self.lock:
+			for path in self.entries:
+				self.remove( path )
+			self.entries.clear()
+			self.size = 0
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+#
+# concurrency.py: adaptive limit of the requests in flight to each part of DC/OS
+#
+# With CONCURRENCY_CONTROL=adaptive, the shared client (helpers.DCOSClient)
+# doesn't send more requests at a time to an endpoint family (the ACS, Marathon,
+# each Marathon-on-Marathon instance...) than its current limit, however many
+# workers are sending them. The limit is adjusted as responses arrive, the way
+# TCP adjusts its congestion window (AIMD):
+#   - it starts at 1 and grows by 1 with every response, until the first sign
+#     of pressure or CONCURRENCY is reached,
+#   - then it grows by 1 for every `limit` responses (additive increase),
+#   - and it's halved when a response is a 429 or 5xx, a request times out or
+#     can't connect, or responses get much slower than the fastest seen for the
+#     same endpoint (multiplicative decrease). It's halved at most once for
+#     every `limit` responses, as they are all the same sign of pressure.
+# CONCURRENCY is the ceiling: the limit never goes above it.
+
+import threading
+from urllib.parse import urlparse
+
+#the limit is halved on pressure
+DECREASE_FACTOR = 0.5
+#responses are slow when their average latency is this many times the fastest
+#seen for the endpoint...
+LATENCY_FACTOR = 2.0
+#...or than this many seconds, if it's faster, so that the jitter of
+#responses of a few milliseconds isn't taken for pressure
+LATENCY_FLOOR = 0.02
+#weight of each response in the average latency of its endpoint
+LATENCY_SMOOTHING = 0.2
+
+def endpoint_family( url ):
+	"""
+	Return the endpoint family of a URL: the first component of its path
+	(e.g. '/acs', '/marathon'), or the first two for a Marathon-on-Marathon
+	instance (e.g. '/service/marathon-user').
+	"""
+	components = urlparse( url ).path.split( '/' )
+	if len( components ) > 2 and components[1] == 'service':
+		return '/'.join( components[:3] )
+
+	return '/'.join( components[:2] )
+
+class AdaptiveLimit:
+	"""
+	Limit of the requests in flight to an endpoint family, adjusted with AIMD
+	from the latency and the errors of its responses, up to `ceiling`.
+	"""
+
+	def __init__( self, ceiling ):
+		self.ceiling = ceiling
+		self.limit = 1.0
+		self.slow_start = True			#grow by 1 per response until the first sign of pressure
+		self.in_flight = 0
+		self.condition = threading.Condition()
+		self.fastest = {}				#endpoint template -> lowest latency seen
+		self.average = {}				#endpoint template -> smoothed latency
+		self.since_decrease = 0			#responses since the limit was last decreased
+		#statistics to report
+		self.peak = 1
+		self.decreases = 0
+		self.requests = 0
+		self.limits = 0					#sum of the limit each request was sent with
+
+	def acquire( self ):
+		"""
+		Wait until a request can be sent without going over the limit.
+		"""
+		with self.condition:
+			while self.in_flight >= int( self.limit ):
+				self.condition.wait()
+			self.in_flight += 1
+			self.requests += 1
+			self.limits += int( self.limit )
+
+	def release( self, template, seconds, overloaded ):
+		"""
+		Mark a request to `template` as finished after `seconds`, and adjust the
+		limit: down if the cluster is `overloaded` or the endpoint has become
+		slow, up otherwise.
+		"""
+		with self.condition:
+			self.in_flight -= 1
+			self.since_decrease += 1
+			fastest = min( seconds, self.fastest.get( template, seconds ) )
+			self.fastest[template] = fastest
+			average = self.average.get( template, seconds ) * ( 1 - LATENCY_SMOOTHING ) + seconds * LATENCY_SMOOTHING
+			self.average[template] = average
+
+			if overloaded or average > LATENCY_FACTOR * max( fastest, LATENCY_FLOOR ):
+				self.decrease()
+			elif self.slow_start:
+				self.limit = min( self.ceiling, self.limit + 1 )
+			else:
+				self.limit = min( self.ceiling, self.limit + 1 / self.limit )
+			self.peak = max( self.peak, int( self.limit ) )
+			self.condition.notify_all()
+
+	def pressure( self ):
+		"""
+		Decrease the limit on a sign of pressure that isn't the end of a
+		request, e.g. a 5xx response that is going to be retried.
+		"""
+		with self.condition:
+			self.decrease()
+
+	def decrease( self ):
+		#the caller holds the condition
+		if self.since_decrease >= int( self.limit ):
+			self.slow_start = False
+			self.since_decrease = 0
+			if self.limit > 1:
+				self.limit = max( 1.0, self.limit * DECREASE_FACTOR )
+				self.decreases += 1
+
+	def statistics( self ):
+		"""
+		Return the current, peak and average limit, and how many times it
+		was decreased.
+		"""
+		with self.condition:
+			return {
+				'limit': int( self.limit ),
+				'peak': self.peak,
+				'average': self.limits / self.requests if self.requests else 0,
+				'decreases': self.decreases
+				}
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+#
+# fetch.py: responses shared by the phases of a full GET
+#
+# Some relations in the ACS are listed from both sides: the permissions of a
+# group (/groups/{gid}/permissions) are the grants to that group in the
+# permissions of every ACL (/acls/{rid}/permissions). With FULL_GET_FETCH=shared,
+# a full GET retrieves each relation once: the phase that gets it first adds
+# what it learns about the other side to a SharedFetch, and the phase that
+# would request it later is served from there instead.
+# The groups of a user (/users/{uid}/groups) are also the groups that list that
+# user among their members (/groups/{gid}/users): they are taken from the files
+# of the groups with USERS_GROUPS_SOURCE=groups (see get_users.py).
+# When the phases run at the same time, the phase that needs a relation waits
+# for the phase that provides it to finish, or to give up on providing it.
+
+import threading
+import metrics			#latency and throughput by endpoint in separate module metrics.py
+
+#relations served from another phase
+GROUP_PERMISSIONS = '/acs/api/v1/groups/{gid}/permissions'
+
+class SharedFetch:
+	"""
+	Responses built by one phase for the requests of another, by path, in
+	the same format as DC/OS would return them.
+	"""
+
+	def __init__( self ):
+		self.lock = threading.Lock()
+		self.responses = {}				#path -> response
+		self.complete = set()			#endpoint templates with every response added
+		self.promised = {}				#endpoint template -> event set when its provider is done with it
+		self.served = 0					#requests served without asking DC/OS
+
+	def promise( self, template ):
+		"""
+		Make the requests to an endpoint template wait until the phase that
+		provides it completes it or releases it.
+		"""
+		self.promised[template] = threading.Event()
+
+	def release( self, template ):
+		"""
+		Let the requests to an endpoint template go on, whether it was
+		completed or not.
+		"""
+		if template in self.promised:
+			self.promised[template].set()
+
+	def add( self, path, item ):
+		"""
+		Add an item to the 'array' of the response to `path`.
+		"""
+		with self.lock:
+			self.responses.setdefault( path, { 'array': [] } )['array'].append( item )
+
+	def completed( self, template ):
+		"""
+		Mark that every item of the responses to an endpoint template has been
+		added, so that they can be served, and the paths without any hold an
+		empty array.
+		"""
+		with self.lock:
+			self.complete.add( template )
+		self.release( template )
+
+	def take( self, path ):
+		"""
+		Return the response to `path` and forget it, or None if it has to be
+		requested from DC/OS. Responses to endpoints that weren't completed
+		(e.g. some ACLs couldn't be retrieved) are never served, as they may
+		be missing items.
+		"""
+		template = metrics.endpoint_template( path )
+		if template in self.promised:
+			self.promised[template].wait()
+		with self.lock:
+			if template not in self.complete:
+				return None
+			self.served += 1
+			return self.responses.pop( path, { 'array': [] } )
@@ -13,175 +13,196 @@
 
 import sys
 import os
-import requests
-import json
+import itertools
 import helpers			#helper functions in separate module helpers.py
-
-# Suppress warnings
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-
-#Load configuration if it exists
-#config is stored directly in JSON format in a fixed location
-config_file = os.getcwd()+'/.config.json'
-config = helpers.get_config( config_file )				#returns config as a dictionary
-if len( config ) == 0:
-	sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first' )
-	sys.exit(1)	
-
-#Get list of ACLs from DC/OS. 
-#This will be later used as index to get all ACL-to-user/group relations
-api_endpoint = '/acs/api/v1/acls'
-url = 'http://'+config['DCOS_IP']+api_endpoint
-headers = {
-	'Content-type': 'application/json',
-	'Authorization': 'token='+config['TOKEN'],
-}
-try:
-	request = requests.get(
-		url,
-		headers=headers,
-		verify=False
-		)
-	request.raise_for_status()
-	sys.stdout.write( '** INFO: GET ACLs: {}\r'.format( request.status_code ) )
-	sys.stdout.flush() 
-except (
-    requests.exceptions.ConnectionError ,\
-    requests.exceptions.Timeout ,\
-    requests.exceptions.TooManyRedirects ,\
-    requests.exceptions.RequestException ,\
-    ConnectionRefusedError
-    ) as error:
-	print ('** ERROR: GET ACLs: {}'.format( error ) ) 
-
-#2xx HTTP status code is success
-if str(request.status_code)[0] == '2':
-	acls = request.text	#raw text form requests, in JSON from DC/OS
+import tracing			#spans of the phases in separate module tracing.py
+import fetch			#responses shared by the phases of a full GET in separate module fetch.py
+from concurrent.futures import ThreadPoolExecutor
+
+#number of ACLs crawled and kept in memory at a time, per worker
+BATCH_FACTOR = 4
+
+def get_permissions( client, acl ):
+	"""
+	Get the users and groups with permissions on an ACL from DC/OS.
+	Receives the acl as listed by DC/OS and returns the permissions
+	dictionary as received, or None if the request failed.
+	"""
+	with client.tracer.span( acl['rid'], 'acl' ):
+		request = client.get(
+			'/acs/api/v1/acls/'+helpers.escape( acl['rid'] )+'/permissions',
+			'GET ACL Permissions: {}'.format( acl['rid'] )
+			)
+	if request is None:
+		return None
+
+	return request.json()
+
+def get_action_value( client, rid_principal_action ):
+	"""
+	Get the value of an action granted to a user or group on an ACL from DC/OS.
+	Receives a (rid, 'users'|'groups', uid|gid, action) tuple and returns the
+	value as received, or None if the request failed.
+	"""
+	rid, kind, principal, action = rid_principal_action
+	with client.tracer.span( rid, 'acl action', principal=principal, action=action['name'] ):
+		request = client.get(
+			'/acs/api/v1/acls/'+helpers.escape( rid )+'/'+kind+'/'+principal+'/'+action['name'],
+			'GET ACL Permission Actions: {} {}'.format( principal, action['name'] )
+			)
+	if request is None:
+		return None
+
+	return request.json()
+
+def share_group_permissions( shared, rid, acl_permission ):
+	"""
+	Add the permissions granted to groups on the ACL `rid` to the responses of
+	/groups/{gid}/permissions, for get_groups to take instead of requesting them.
+	"""
+	for group in acl_permission['groups']:
+		shared.add(
+			'/acs/api/v1/groups/'+helpers.escape( group['gid'] )+'/permissions',
+			{
+				'rid' : 		rid,
+				'description' : acl_permission['description'],
+				'aclurl' : 		acl_permission['url'],
+				#without the values added to the actions by this phase
+				'actions' : 	[ { key: value for key, value in action.items() if key != 'value' } for action in group['actions'] ]
+			}
+			)
+
+@tracing.phase
+def get_acls( config, client ):
+	"""
+	Get the list of ACLs and the permissions granted on each of them from
+	DC/OS and save them to ACLS_FILE and ACLS_PERMISSIONS_FILE.
+	The permissions of each ACL are journaled as soon as they are retrieved,
+	so that an interrupted GET resumes from the ACLs not retrieved yet. The
+	files are only saved once the permissions of every ACL have been retrieved.
+	In a full GET that shares responses between phases, the permissions of the
+	groups are taken from those of the ACLs.
+	"""
+
+	#maximum number of requests in flight against the ACS
+	concurrency = int( config.get( 'CONCURRENCY', 8 ) )
+
+	#Get list of ACLs from DC/OS. 
+	#This will be later used as index to get all ACL-to-user/group relations
+	request = client.get( '/acs/api/v1/acls', 'GET ACLs' )
+
+	#None means the request failed, the error has already been shown
+	if request is None:
+		return False
 
 	#save to ACLs file
-	acls_file = open( config['ACLS_FILE'], 'w' )
-	acls_file.write( acls )			#write to file in same raw JSON as obtained from DC/OS
-	acls_file.close()					
-	#change the list of acls loaded from file (or DC/OS) to JSON dictionary
-	acls_json = json.loads( acls )
-
-	#create a dictionary object that will hold all group-to-user memberships
-	acls_permissions = { 'array' : [] }
-
-	#loop through the list of ACLs received and get the permissions
-	# /acls/{rid}/permissions
-	for index, acl in ( enumerate( acls_json['array'] ) ):
-		
-		#append this acl as a dictionary to the list 
-		acls_permissions['array'].append(
-		{
-			'rid' : 		helpers.escape( acl['rid'] ),
-			'url' : 		acl['url'],
-			'description' : acl['description'],
-			'users' : 		[],				#initialize users LIST for this acl
-			'groups':		[]				#initialize groups LIST for this acl
-		}
-		)
-
-		#get permissions for this ACL from DC/OS
-		#GET acls/[rid]/permissions
-		api_endpoint = '/acs/api/v1/acls/'+helpers.escape( acl['rid'] )+'/permissions'
-		url = 'http://'+config['DCOS_IP']+api_endpoint
-		try:
-			request = requests.get(
-				url,
-				headers=headers,
-				verify=False
+	acls_file = open( helpers.partial( config['ACLS_FILE'] ), 'w' )
+	acls_file.write( request.text )			#write to file in same raw JSON as obtained from DC/OS
+	acls_file.close()
+	#the list of acls is read back from the file one ACL at a time
+	del request
+
+	#permissions are written to file as each ACL is completed, in the same
+	#order as received, so that only a batch of ACLs is in memory at any time
+	acls_permissions_file = helpers.ArrayWriter( helpers.partial( config['ACLS_PERMISSIONS_FILE'] ) )
+	#ACLs already retrieved by a previous GET that was interrupted
+	journal = helpers.Journal( config, 'acls' )
+	failed = 0
+
+	#those still listed are written first, read back from the journal one at a time
+	if journal.done:
+		listed_rids = { acl['rid'] for acl in helpers.read_array( helpers.partial( config['ACLS_FILE'] ) ) }
+		for rid, acl_permission in journal.results():
+			if rid in listed_rids:
+				acls_permissions_file.write( acl_permission )
+				if client.shared is not None:
+					share_group_permissions( client.shared, rid, acl_permission )
+		del listed_rids
+
+	#fan out the requests to a bounded pool of workers.
+	#Executor.map() returns results in submission order, so the resulting
+	#file keeps exactly the same ordering as a serial crawl (after the ACLs
+	#retrieved before, when resuming).
+	with ThreadPoolExecutor( max_workers=concurrency ) as pool:
+
+		acls = helpers.read_array( helpers.partial( config['ACLS_FILE'] ) )
+		while True:
+			listed = list( itertools.islice( acls, concurrency * BATCH_FACTOR ) )
+			if not listed:
+				break
+			batch = [ acl for acl in listed if acl['rid'] not in journal.done ]
+
+			#get permissions for every ACL in the batch from DC/OS
+			#GET acls/[rid]/permissions
+			acls_permissions = []
+			#rids of the ACLs with any request failed
+			incomplete = set()
+			for acl, permissions in zip( batch, pool.map( lambda acl: get_permissions( client, acl ), batch ) ):
+				if permissions is None:
+					incomplete.add( acl['rid'] )
+				acls_permissions.append(
+				{
+					'rid' : 		helpers.escape( acl['rid'] ),
+					'url' : 		acl['url'],
+					'description' : acl['description'],
+					'users' : 		permissions['users'] if permissions else [],
+					'groups':		permissions['groups'] if permissions else []
+				}
 				)
-			request.raise_for_status()
-			sys.stdout.write( '** INFO: GET ACL Permissions: {} {:>20} \r'.format( index, request.status_code ) )
-			sys.stdout.flush()
-		except (
-		    requests.exceptions.ConnectionError ,\
-		    requests.exceptions.Timeout ,\
-		    requests.exceptions.TooManyRedirects ,\
-		    requests.exceptions.RequestException ,\
-		    ConnectionRefusedError
-		    ) as error:
-			print ('** ERROR: GET ACL Permission: {} {}\n'.format( index, error ) )
-
-		if str(request.status_code)[0] == '2':
-			permissions = request.json() 	#get memberships from the JSON
-
-			#Loop through the list of user permissions and get their associated actions
-			for index2, user in ( enumerate( permissions['users'] ) ):
-				#get each user that is a member of this acl and append to ['users']
-				acls_permissions['array'][index]['users'].append( user )
-				#Loop through the list of actions for this user and get the action value
-				for index3, action in ( enumerate ( user['actions'] ) ):
-					#get action from DC/OS
-					#GET /acls/{rid}/users/{uid}/{action}
-					api_endpoint = '/acs/api/v1/acls/'+helpers.escape( acl['rid'] )+'/users/'+user['uid']+'/'+action['name']
-					url = 'http://'+config['DCOS_IP']+api_endpoint
-					try:
-						request = requests.get(
-							url,
-							headers=headers,
-							verify=False
-							)
-						request.raise_for_status()
-						sys.stdout.write( '** INFO: GET ACL Permission User Actions: {} : {:>20} \r'.format( index3, request.status_code ) )
-						sys.stdout.flush()
-					except (
-					    requests.exceptions.ConnectionError ,\
-					    requests.exceptions.Timeout ,\
-					    requests.exceptions.TooManyRedirects ,\
-					    requests.exceptions.RequestException ,\
-					    ConnectionRefusedError
-					    ) as error:
-						print ('** ERROR: GET ACL Permission User Actions: {}\n'.format( error ) )
-					
-					if str(request.status_code)[0] == '2':
-						action_value = request.json()
-						#add the value as another field of the action alongside name and url
-						acls_permissions['array'][index]['users'][index2]['actions'][index3]['value'] = action_value	
-
-			#Repeat loop with groups to get all groups and actions
-			for index2, group in ( enumerate( permissions['groups'] ) ):
-				#get each user that is a member of this acl and append to ['users']
-				acls_permissions['array'][index]['groups'].append( group )
-				#Loop through the list of actions for this user and get the action value
-				for index3, action in ( enumerate ( group['actions'] ) ):
-					#get action from DC/OS
-					#GET /acls/{rid}/users/{uid}/{action}
-					api_endpoint = '/acs/api/v1/acls/'+helpers.escape( acl['rid'] )+'/groups/'+group['gid']+'/'+action['name']
-					url = 'http://'+config['DCOS_IP']+api_endpoint
-					try:
-						request = requests.get(
-							url,
-							headers=headers,
-							verify=False
-							)
-						request.raise_for_status()
-						sys.stdout.write( '** INFO: GET ACL Permission Group Actions: {} : {:>20} \r'.format( index3, request.status_code ) )
-						sys.stdout.flush()
-					except (
-					    requests.exceptions.ConnectionError ,\
-					    requests.exceptions.Timeout ,\
-					    requests.exceptions.TooManyRedirects ,\
-					    requests.exceptions.RequestException ,\
-					    ConnectionRefusedError
-					    ) as error: 
-						print ('** ERROR: GET ACL Permission Group Actions: {} {} \n'.format( index3, error ) )
-					
-					if str(request.status_code)[0] == '2':	
-						action_value = request.json()
-						#add the value as another field of the action alongside name and url
-						acls_permissions['array'][index]['groups'][index2]['actions'][index3]['value'] = action_value	
-
-
-	#write dictionary as a JSON object to file
-	acls_permissions_json = json.dumps( acls_permissions ) 		#convert to JSON
-	acls_permissions_file = open( config['ACLS_PERMISSIONS_FILE'], 'w' )
-	acls_permissions_file.write( acls_permissions_json )		#write to file in raw JSON
-	acls_permissions_file.close()		
-
-#debug
-sys.stdout.write( '\n** INFO: GET ACLs: 								Done.\n' )
 
+			#flatten the list of (rid, user/group, action) triplets to get their values
+			#GET /acls/{rid}/users/{uid}/{action}
+			#GET /acls/{rid}/groups/{gid}/{action}
+			actions = []
+			for acl, acl_permission in zip( batch, acls_permissions ):
+				for user in acl_permission['users']:
+					for action in user['actions']:
+						actions.append( ( acl['rid'], 'users', user['uid'], action ) )
+				for group in acl_permission['groups']:
+					for action in group['actions']:
+						actions.append( ( acl['rid'], 'groups', group['gid'], action ) )
+
+			for ( rid, kind, principal, action ), action_value in zip( actions, pool.map( lambda action: get_action_value( client, action ), actions ) ):
+				if action_value is not None:
+					#add the value as another field of the action alongside name and url
+					action['value'] = action_value
+				else:
+					incomplete.add( rid )
+
+			#journal and write the ACLs retrieved completely, in the order listed
+			for acl, acl_permission in zip( batch, acls_permissions ):
+				if acl['rid'] in incomplete:
+					failed += 1
+					continue
+				journal.record( acl['rid'], acl_permission )
+				acls_permissions_file.write( acl_permission )
+				if client.shared is not None:
+					share_group_permissions( client.shared, acl['rid'], acl_permission )
+
+	acls_permissions_file.close()
+	journal.close( failed == 0 )
+	#the groups without permissions in any ACL have none
+	if client.shared is not None and not failed:
+		client.shared.completed( fetch.GROUP_PERMISSIONS )
+
+	if failed:
+		print( '\n** ERROR: GET ACLs: {} ACLs could not be retrieved. Run it again to resume.'.format( failed ) )
+		return False
+	helpers.publish( [ config['ACLS_FILE'], config['ACLS_PERMISSIONS_FILE'] ] )
+
+	#debug
+	sys.stdout.write( '\n** INFO: GET ACLs: 								Done.\n' )
+
+	return True
+
+if __name__ == '__main__':
+
+	#Load configuration if it exists
+	#config is stored directly in JSON format in a fixed location
+	config_file = os.getcwd()+'/.config.json'
+	config = helpers.get_config( config_file )				#returns config as a dictionary
+	if len( config ) == 0:
+		sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first' )
+		sys.exit(1)	
+
+	get_acls( config, helpers.get_client( config ) )
@@ -12,15 +12,10 @@
 
 import sys
 import os
-import requests
 import json
 import helpers			#helper functions in separate module helpers.py
 from time import sleep
 
-# Suppress warnings
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-
 #Load configuration if it exists
 #config is stored directly in JSON format in a fixed location
 config_file = os.getcwd()+'/.config.json'
@@ -31,33 +26,14 @@ if len( config ) == 0:
 
 #Get list of AGENTS with their state from DC/OS. 
 #This will be later used as index to get all user-to-group memberships
-api_endpoint = '/mesos/slaves'
-url = 'http://'+config['DCOS_IP']+api_endpoint
-headers = {
-	'Content-type': 'application/json',
-	'Authorization': 'token='+config['TOKEN'],
-}
-try:
-	request = requests.get(
-		url,
-		headers=headers,
-		verify=False
-		)
-	#show progress after request
-	sys.stdout.write( '** INFO: GET Agents: {0} \n'.format( request.status_code ) )
-	sys.stdout.flush()
-except (
-    requests.exceptions.ConnectionError ,\
-    requests.exceptions.Timeout ,\
-    requests.exceptions.TooManyRedirects ,\
-    requests.exceptions.RequestException ,\
-    ConnectionRefusedError
-    ) as error:
-	print ('** ERROR: GET Agents: {} \n'.format( error ) ) 
+client = helpers.get_client( config )
+request = client.get( '/mesos/slaves', 'GET Agents' )
 
-#2xx HTTP status code is success
-if str(request.status_code)[0] == '2':
+#None means the request failed, the error has already been shown
+if request is not None:
 	
+	sys.stdout.write( '\n' )
+
 	#save to AGENTS file
 	agents_file = open( config['AGENTS_FILE'], 'w' )
 	agents_file.write( request.text )			#write to file in same raw JSON as obtained from DC/OS
@@ -89,9 +65,6 @@ if str(request.status_code)[0] == '2':
 		print ( "Agent #{0}: {1}".format( index, agent['hostname'] ) )
 	sleep(2)
 
-else:
-	print ('** ERROR: GET Agents: {} \n'.format( error ) ) 	
-
 sys.stdout.write( '\n** INFO: GET Agents: 							Done. \n' )
 
 
@@ -15,55 +15,34 @@
 
 import sys
 import os
-import requests
 import json
 import helpers			#helper functions in separate module helpers.py
-
-# Suppress warnings
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-
-#Load configuration if it exists
-#config is stored directly in JSON format in a fixed location
-config_file = os.getcwd()+'/.config.json'
-config = helpers.get_config( config_file )				#returns config as a dictionary
-if len( config ) == 0:
-	sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first' )
-	sys.exit(1)	
-
-#Get list of GROUPS from DC/OS. 
-#This will be later used as index to get all user-to-group memberships
-api_endpoint = '/acs/api/v1/groups'
-url = 'http://'+config['DCOS_IP']+api_endpoint
-headers = {
-	'Content-type': 'application/json',
-	'Authorization': 'token='+config['TOKEN'],
-}
-try:
-	request = requests.get(
-		url,
-		headers=headers,
-		verify=False
-		)
-	request.raise_for_status()
-	sys.stdout.write( '** INFO: GET Groups: {:>20} \r'.format( request.status_code ) ) 
-	sys.stdout.flush()
-except (
-    requests.exceptions.ConnectionError ,\
-    requests.exceptions.Timeout ,\
-    requests.exceptions.TooManyRedirects ,\
-    requests.exceptions.RequestException ,\
-    ConnectionRefusedError
-    ) as error:
-	print ('** GET Groups failed with ERROR: {}\n'.format( error ) ) 
-
-#2xx HTTP status code is success
-if str(request.status_code)[0] == '2':
+import tracing			#spans of the phases in separate module tracing.py
+
+@tracing.phase
+def get_groups( config, client ):
+	"""
+	Get the list of groups and their user memberships from DC/OS
+	and save them to GROUPS_FILE and GROUPS_USERS_FILE.
+	The memberships of each group are journaled as soon as they are retrieved,
+	so that an interrupted GET resumes from the groups not retrieved yet. The
+	files are only saved once the memberships of every group have been retrieved.
+	In a full GET that shares responses between phases, the permissions of the
+	groups are taken from those of the ACLs.
+	"""
+
+	#Get list of GROUPS from DC/OS. 
+	#This will be later used as index to get all user-to-group memberships
+	request = client.get( '/acs/api/v1/groups', 'GET Groups' )
+
+	#None means the request failed, the error has already been shown
+	if request is None:
+		return False
 
 	groups = request.text	#raw text form requests, in JSON from DC/OS
 
 	#save to GROUPS file
-	groups_file = open( config['GROUPS_FILE'], 'w' )
+	groups_file = open( helpers.partial( config['GROUPS_FILE'] ), 'w' )
 	groups_file.write( groups )			#write to file in same raw JSON as obtained from DC/OS
 	groups_file.close()					
 
@@ -71,9 +50,20 @@ if str(request.status_code)[0] == '2':
 	groups_json = json.loads( groups )
 	#create a dictionary object that will hold all group-to-user memberships
 	groups_users = { 'array' : [] }
+	#groups already retrieved by a previous GET that was interrupted
+	journal = helpers.Journal( config, 'groups' )
+	resumed = dict( journal.results() )
+	failed = 0
+
+	#indexes of the groups whose members have been retrieved now
+	retrieved = []
 
 	for index, group in ( enumerate( groups_json['array'] ) ):
-		
+
+		if group['gid'] in resumed:
+			groups_users['array'].append( resumed[group['gid']] )
+			continue
+
 		#append this group as a dictionary to the list 
 		groups_users['array'].append(
 		{
@@ -87,68 +77,66 @@ if str(request.status_code)[0] == '2':
 
 		#get users for this group from DC/OS
 		#GET groups/[gid]/users
-		api_endpoint = '/acs/api/v1/groups/'+helpers.escape( group['gid'] )+'/users'
-		url = 'http://'+config['DCOS_IP']+api_endpoint
-		try:
-			request = requests.get(
-				url,
-				headers=headers,
-				verify=False
-				)
-			request.raise_for_status()
-			sys.stdout.write( '** INFO: GET Groups Memberships: {} : {:>20} \r'.format( index, request.status_code ) )
-			sys.stdout.flush()
-		except (
-		    requests.exceptions.ConnectionError ,\
-		    requests.exceptions.Timeout ,\
-		    requests.exceptions.TooManyRedirects ,\
-		    requests.exceptions.RequestException ,\
-		    ConnectionRefusedError
-		    ) as error:
-			print ('** GET Group/Users failed with ERROR: {:>20}'.format( error ) ) 
-
-		if str(request.status_code)[0] == '2':	
+		request = client.get(
+			'/acs/api/v1/groups/'+helpers.escape( group['gid'] )+'/users',
+			'GET Groups Memberships: {}'.format( index )
+			)
+
+		if request is not None:	
 			memberships = request.json() 	#get memberships from the JSON
-			index2 = 0		#avoid NameError if there are no memberships
 			for index2, membership in ( enumerate( memberships['array'] ) ):
 				#get each user that is a member of this group and append
 				groups_users['array'][index]['users'].append( membership )
-
-			#get permissions for this group from DC/OS
-			#GET groups/[gid]/permissions
-			api_endpoint = '/acs/api/v1/groups/'+helpers.escape( group['gid'] )+'/permissions'
-			url = 'http://'+config['DCOS_IP']+api_endpoint
-			try:
-				request = requests.get(
-					url,
-					headers=headers,
-					verify=False
-					)
-				request.raise_for_status()
-				sys.stdout.write( '** INFO: GET Groups Permissions: {} : {:>20}\r'.format( index2, request.status_code ) )
-				sys.stdout.flush()	
-			except (
-			    requests.exceptions.ConnectionError ,\
-			    requests.exceptions.Timeout ,\
-			    requests.exceptions.TooManyRedirects ,\
-			    requests.exceptions.RequestException ,\
-			    ConnectionRefusedError
-			    ) as error:
-				print ('** ERROR: GET Groups Memberships: {}'.format( error ) )
-
-			if str(request.status_code)[0] == '2':	 
-				permissions = request.json() 	#get memberships from the JSON	
-				for index2, permission in ( enumerate( memberships['array'] ) ):
-					#get each group membership for this user
-					groups_users['array'][index]['permissions'].append( permission )
+			retrieved.append( index )
+		else:
+			failed += 1
+
+	#the permissions are retrieved once all the members have been: in a full GET
+	#that takes them from the ACLs, they wait for the crawl of the ACLs to finish
+	for index in retrieved:
+		group = groups_json['array'][index]
+
+		#get permissions for this group from DC/OS
+		#GET groups/[gid]/permissions
+		permissions = client.get_json(
+			'/acs/api/v1/groups/'+helpers.escape( group['gid'] )+'/permissions',
+			'GET Groups Permissions: {}'.format( index )
+			)
+
+		if permissions is not None:
+			for index2, permission in ( enumerate( permissions['array'] ) ):
+				#get each permission of this group and append
+				groups_users['array'][index]['permissions'].append( permission )
+			journal.record( group['gid'], groups_users['array'][index] )
+		else:
+			failed += 1
 
 	#done.
+	journal.close( failed == 0 )
 
 	#write dictionary as a JSON object to file
 	groups_users_json = json.dumps( groups_users ) 		#convert to JSON
-	groups_users_file = open( config['GROUPS_USERS_FILE'], 'w' )
+	groups_users_file = open( helpers.partial( config['GROUPS_USERS_FILE'] ), 'w' )
 	groups_users_file.write( groups_users_json )		#write to file in raw JSON
 	groups_users_file.close()									#flush
 
-sys.stdout.write( '\n** INFO: GET Groups:							Done.\n' )
+	if failed:
+		print( '\n** ERROR: GET Groups: {} groups could not be retrieved. Run it again to resume.'.format( failed ) )
+		return False
+	helpers.publish( [ config['GROUPS_FILE'], config['GROUPS_USERS_FILE'] ] )
+
+	sys.stdout.write( '\n** INFO: GET Groups:							Done.\n' )
+
+	return True
+
+if __name__ == '__main__':
+
+	#Load configuration if it exists
+	#config is stored directly in JSON format in a fixed location
+	config_file = os.getcwd()+'/.config.json'
+	config = helpers.get_config( config_file )				#returns config as a dictionary
+	if len( config ) == 0:
+		sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first' )
+		sys.exit(1)	
 
+	get_groups( config, helpers.get_client( config ) )
@@ -12,16 +12,10 @@
 
 import sys
 import os
-import requests
 import json
 import helpers			#helper functions in separate module helpers.py
 from time import sleep
 
-
-# Suppress warnings
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-
 #Load configuration if it exists
 #config is stored directly in JSON format in a fixed location
 config_file = os.getcwd()+'/.config.json'
@@ -30,6 +24,8 @@ if len( config ) == 0:
 	sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first\n' )
 	sys.exit(1)	
 
+client = helpers.get_client( config )
+
 #check we've been called with a number of masters as a parameter
 NUM_MASTERS=int(sys.argv[1])
 
@@ -38,19 +34,9 @@ NUM_MASTERS=int(sys.argv[1])
 EXHIBITOR_STATUS_URL = 'http://'+config['DCOS_IP']+':8181/exhibitor/v1/cluster/status'
 print('**INFO: Expected cluster size: {}'.format( NUM_MASTERS ))
 #get the actual cluster size from zookeeper
-try:
-	response = requests.get(EXHIBITOR_STATUS_URL, verify=False)
-except (
-    requests.exceptions.ConnectionError ,\
-    requests.exceptions.Timeout ,\
-    requests.exceptions.TooManyRedirects ,\
-    requests.exceptions.RequestException ,\
-    ConnectionRefusedError
-    ) as error:
-	print('**ERROR: Could not connect to exhibitor: {}'.format( error ))
-	sys.exit(1)
-if str(response.status_code)[0] != '2':
-	print('**ERROR: Could not get exhibitor status: {}, Status code: {}'.format( EXHIBITOR_STATUS_URL, response.status_code ) )
+response = client.get( EXHIBITOR_STATUS_URL, 'GET Exhibitor status' )
+if response is None:
+	print('**ERROR: Could not get exhibitor status: {}'.format( EXHIBITOR_STATUS_URL ) )
 	sys.exit(1)
 data = response.json()
 #parseable output
@@ -76,30 +62,10 @@ sleep(2)
 #https://docs.mesosphere.com/1.8/administration/installing/cloud/aws/upgrading/
 #METRICS: "registrar" has the metric/registrar/log recovered with a value of 1
 #http://<dcos_master_private_ip>:5050/metrics/snapshot
-api_endpoint=':5050/metrics/snapshot'
-url = 'http://'+config['DCOS_IP']+api_endpoint
-headers = {
-	'Content-type': 'application/json',
-	'Authorization': 'token='+config['TOKEN']
-}
-try:
-	response = requests.get(
-		url,
-		headers=headers,
-		verify=False
-		)
-	#show progress after request
-	print( '**INFO: GET Metrics: {0} \n'.format( response.status_code ) )
-except (
-    requests.exceptions.ConnectionError ,\
-    requests.exceptions.Timeout ,\
-    requests.exceptions.TooManyRedirects ,\
-    requests.exceptions.RequestException ,\
-    ConnectionRefusedError
-    ) as error:
-	print ('**ERROR: GET Metrics: {} \n'.format( response.text ) )
-
-if str(response.status_code)[0] == '2':	#2xx HTTP status code is success
+url = 'http://'+config['DCOS_IP']+':5050/metrics/snapshot'
+response = client.get( url, 'GET Metrics' )
+
+if response is not None:	#None means the request failed, the error has already been shown
 	#parseable output
 	data=response.json()
 	metrics={'metrics': data }
@@ -113,37 +79,14 @@ if str(response.status_code)[0] == '2':	#2xx HTTP status code is success
 			print('**ERROR: Log NOT recovered. Value is {0}'.format( data['registrar/log/recovered'] ) )
 	else:
 		print('**ERROR: Registrar Log not found in response' )
-else:
-	print ('**ERROR: GET Health: {} \n'.format( response.text ) ) 	
 sleep(2)
 
 #CHECK #3
 #Get health report of the system and make sure EVERYTHING is Healthy. 
 #Display where it's Unhealthy otherwise.
-api_endpoint = '/system/health/v1/report'
-url = 'http://'+config['DCOS_IP']+api_endpoint
-headers = {
-	'Content-type': 'application/json',
-	'Authorization': 'token='+config['TOKEN'],
-}
-try:
-	response = requests.get(
-		url,
-		headers=headers,
-		verify=False
-		)
-	#show progress after request
-	print( '**INFO: GET Health Report: {0} \n'.format( response.status_code ) )
-except (
-    requests.exceptions.ConnectionError ,\
-    requests.exceptions.Timeout ,\
-    requests.exceptions.TooManyRedirects ,\
-    requests.exceptions.RequestException ,\
-    ConnectionRefusedError
-    ) as error:
-	print ('**ERROR: GET Health Report: {} \n'.format( response.text ) ) 
-
-if str(response.status_code)[0] == '2':	#2xx HTTP status code is success
+response = client.get( '/system/health/v1/report', 'GET Health Report' )
+
+if response is not None:	#None means the request failed, the error has already been shown
 	#parseable output
 	data=response.json()
 	health_report={'health_report': data}
@@ -157,8 +100,6 @@ if str(response.status_code)[0] == '2':	#2xx HTTP status code is success
 				print('Name: {0:48}			IP: {1}		State: {2}'.format( \
 					data['Units:'][unit]['UnitName'], response_dict['Units'][unit][node]['IP'], \
 					data['Units'][unit][node]['Health'] ) )
-else:
-	print ('**ERROR: GET Health: {} \n'.format( response.text ) ) 	
 
 
 sys.stdout.write( '\n** INFO: GET Masters: 							Done. \n' )
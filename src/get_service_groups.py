@@ -14,223 +14,197 @@
 
 import sys
 import os
-import requests
 import json
 import helpers			#helper functions in separate module helpers.py
-
-# Suppress warnings
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-
-#Load configuration if it exists
-#config is stored directly in JSON format in a fixed location
-config_file = os.getcwd()+'/.config.json'
-config = helpers.get_config( config_file )				#returns config as a dictionary
-if len( config ) == 0:
-	sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first' )
-	sys.exit(1)	
-
-#Get list of SERVICE_GROUPS from DC/OS. 
-#Regular Marathon: "Services" tab
-#################################
-
-api_endpoint = '/marathon/v2/groups'
-url = 'http://'+config['DCOS_IP']+api_endpoint
-headers = {
-	'Content-type': 'application/json',
-	'Authorization': 'token='+config['TOKEN'],
-}
-try:
-	request = requests.get(
-		url,
-		headers=headers,
-		verify=False
-		)
-	request.raise_for_status()
-	sys.stdout.write( '** INFO: GET Service Groups: {:>20} \r'.format( request.status_code ) ) 
-	sys.stdout.flush()
-except (
-	requests.exceptions.ConnectionError ,\
-	requests.exceptions.Timeout ,\
-	requests.exceptions.TooManyRedirects ,\
-	requests.exceptions.RequestException ,\
-	ConnectionRefusedError
-	) as error:
-	print ('**ERROR: GET Service Groups failed with: {}'.format( error ) ) 
-
-#2xx HTTP status code is success
-if str(request.status_code)[0] == '2':
-
-	service_groups = request.text	#raw text form requests, in JSON from DC/OS
-	service_groups_json = json.loads( service_groups )
-
-	#save to SERVICE_GROUPS file
-	service_groups_file = open( config['SERVICE_GROUPS_FILE'], 'w' )
-	service_groups_file.write( json.dumps( service_groups_json ) )			#write to file in same raw JSON as obtained from DC/OS
-	service_groups_file.close()					
-
-	#change the list of service groups loaded from file (or DC/OS) to JSON dictionary
-	helpers.walk_and_print( service_groups_json, 'Service Group', 'groups' )
-
-else:
-	print('**ERROR: GET Service Groups failed with: {}'.format( request.text ) ) 
-
-#Marathon-on-Marathon and Apps
-##############################
-
-#get all apps from DC/OS
-api_endpoint = '/marathon/v2/apps'
-url = 'http://'+config['DCOS_IP']+api_endpoint
-headers = {
-	'Content-type': 'application/json',
-	'Authorization': 'token='+config['TOKEN'],
-}
-try:
-	request = requests.get(
-		url,
-		headers=headers,
-		verify=False
-		)
-	request.raise_for_status()
-	sys.stdout.write( '** INFO: GET Apps: {:>20} \r'.format( request.status_code ) ) 
-	sys.stdout.flush()
-except (
-	requests.exceptions.ConnectionError ,\
-	requests.exceptions.Timeout ,\
-	requests.exceptions.TooManyRedirects ,\
-	requests.exceptions.RequestException ,\
-	ConnectionRefusedError
-	) as error:
-	print ('**ERROR: GET Apps failed with: {}\n'.format( error ) ) 
-
-#2xx HTTP status code is success
-if str(request.status_code)[0] == '2':
-
-	#save all apps from DC/OS
-	apps_file = open( config['APPS_FILE'], 'w' )
-	apps_file.write( request.text )
-	apps_file.close()	
-
-	marathons = {'marathons':[]}	#marathons: list of MoM instances 
-	apps_store = {'apps':[]}		#apps_store: list of all apps 
-	apps = request.text				#raw text form requests, in JSON from DC/OS
-	apps_dict = json.loads( apps )
-	for index,app in enumerate( apps_dict['apps'] ):
-		apps_store['apps'].append( app )   
-		if 'DCOS_PACKAGE_NAME' in app['labels']:
-			if app['labels']['DCOS_PACKAGE_NAME']=='marathon':
-				marathons['marathons'].append( app )
-
-	#Get the group of each marathon
-	api_endpoint = '/v2/groups'		#to form /service/$SERVICE_NAME/v2/groups
-	api_endpoint_apps = '/v2/apps'	#to form /service/$SERVICE_NAME/v2/apps
-	mom_groups = {'mom_groups':[]}	#A list of all MoM instances, each with its service groups
-	mom_apps = {'mom_apps':[]} 			#A list of all MoM instances, each with its apps.
-
-	#Go through the marathons, connect to them and repeat the above
-	for marathon in marathons['marathons']:
-		#get their service name
-		service_name = marathon['labels']['DCOS_SERVICE_NAME']
-
-		#Get the *****GROUPS***** for that MoM instance
-		url='http://'+config['DCOS_IP']+'/service/'+service_name+api_endpoint
-		#connect to that MoM instance
-		headers = {
-			'Content-type': 'application/json',
-			'Authorization': 'token='+config['TOKEN'],
-		}
-		try:
-			response = requests.get(
-				url,
-				headers=headers,
-				verify=False
-				)
-			request.raise_for_status()
-			sys.stdout.write( '** INFO: GET MoM Service Groups: {:>20} \r'.format( request.status_code ) ) 
-			sys.stdout.flush()
-		except (
-			requests.exceptions.ConnectionError ,\
-			requests.exceptions.Timeout ,\
-			requests.exceptions.TooManyRedirects ,\
-			requests.exceptions.RequestException ,\
-			ConnectionRefusedError
-			) as error:
-			print ('**ERROR: GET MoM Service Groups failed with: {}'.format( error ) ) 
-
-		if str(response.status_code)[0] == '2':
-
-			service_groups = response.text	#raw text form requests, in JSON from DC/OS
-			service_groups_json = json.loads( service_groups )
-			#create a new entry for this MoM instances holding its name, definition and groups.
-			entry = { 'DCOS_SERVICE_NAME': service_name,
-					'app' : marathon,        #save the entire JSON so that we can post it later easily
-											#'App' is saved as received -- upon posting, the offending fields are removed
-					'groups': service_groups_json
-					}
-			mom_groups['mom_groups'].append( entry )
-
-		else:
-			print('**ERROR: GET MoM Service Groups failed with: {}'.format( response.text ) ) 
-
-		#Get the *****APPS***** of that MoM instance
-		url='http://'+config['DCOS_IP']+'/service/'+service_name+api_endpoint_apps
-		#connect to that MoM instance
-		headers = {
-			'Content-type': 'application/json',
-			'Authorization': 'token='+config['TOKEN'],
-		}
-		try:
-			response = requests.get(
-				url,
-				headers=headers,
-				verify=False
-				)
-			request.raise_for_status()
-			sys.stdout.write( '** INFO: GET MoM Apps: {:>20} \r'.format( request.status_code ) ) 
-			sys.stdout.flush()
-		except (
-			requests.exceptions.ConnectionError ,\
-			requests.exceptions.Timeout ,\
-			requests.exceptions.TooManyRedirects ,\
-			requests.exceptions.RequestException ,\
-			ConnectionRefusedError
-			) as error:
-			print ('**ERROR: GET MoM Apps failed with: {}'.format( error ) ) 
-
-		if str(response.status_code)[0] == '2':
-
-			running_mom_apps = response.text	#raw text form requests, in JSON from DC/OS:
-			running_mom_apps_json = json.loads( running_mom_apps )
-			#create a new entry for this MoM instances holding its name, definition and Apps.
-			entry = { 'DCOS_SERVICE_NAME': service_name,
-					'app' : marathon,        #save the entire JSON so that we can post it later easily
-											#'App' is saved as received -- upon posting, the offending fields are removed
-					'apps': running_mom_apps_json
-					}
-			mom_apps['mom_apps'].append( entry )
+import tracing			#spans of the phases in separate module tracing.py
+from concurrent.futures import ThreadPoolExecutor
+
+def get_marathon( client, base, name, fetch ):
+	"""
+	Get the service groups and apps of the Marathon instance at `base`
+	('/marathon' or '/service/[name]'). `name` identifies it in the progress
+	messages. With `fetch` 'embedded', a single request gets the tree of groups
+	with their apps embedded, and the list of apps is taken from it.
+	With `fetch` 'separate', groups and apps are requested one after the other.
+	Returns a tuple with the root service group and the apps as dictionaries,
+	each None if its request failed.
+	"""
+	if fetch == 'embedded':
+		#GET /v2/groups with apps (and their task counts) embedded
+		request = client.get( base+'/v2/groups'+helpers.EMBED_GROUP_APPS, 'GET {}Service Groups and Apps'.format( name ) )
+		if request is None:
+			return None, None
+		service_groups_json = request.json()
+
+		return service_groups_json, { 'apps': helpers.group_apps( service_groups_json ) }
+
+	#GET /v2/groups
+	request = client.get( base+'/v2/groups', 'GET {}Service Groups'.format( name ) )
+	service_groups_json = json.loads( request.text ) if request is not None else None
+
+	#GET /v2/apps
+	request = client.get( base+'/v2/apps', 'GET {}Apps'.format( name ) )
+	apps_json = json.loads( request.text ) if request is not None else None
+
+	return service_groups_json, apps_json
+
+def get_mom( client, marathon, fetch ):
+	"""
+	Get the service groups and apps of a Marathon-on-Marathon instance.
+	Receives its app definition as listed by DC/OS and returns a tuple with
+	the service groups and the apps as received, each None if its request failed.
+	"""
+	#get their service name
+	service_name = marathon['labels']['DCOS_SERVICE_NAME']
+
+	#Get the *****GROUPS***** and *****APPS***** for that MoM instance
+	#GET /service/$SERVICE_NAME/v2/groups
+	#GET /service/$SERVICE_NAME/v2/apps
+	with client.tracer.span( 'MoM '+service_name, 'mom' ):
+		return get_marathon( client, '/service/'+service_name, 'MoM ', fetch )
+
+@tracing.phase
+def get_service_groups( config, client ):
+	"""
+	Get the service groups and apps from Marathon and from every
+	Marathon-on-Marathon instance and save them to SERVICE_GROUPS_FILE,
+	APPS_FILE, SERVICE_GROUPS_MOM_FILE and APPS_MOM_FILE.
+	The service groups and apps of each Marathon instance are journaled as soon
+	as they are retrieved, so that an interrupted GET resumes from the instances
+	not retrieved yet. The files are only saved once all of them have been retrieved.
+	"""
+
+	#maximum number of MoM instances crawled at a time
+	concurrency = int( config.get( 'CONCURRENCY', 8 ) )
+	#get groups with their apps in one request ("embedded") or groups and apps separately ("separate")
+	fetch = config.get( 'MARATHON_FETCH', 'embedded' )
+	#Marathon instances already retrieved by a previous GET that was interrupted
+	journal = helpers.Journal( config, 'service_groups' )
+	resumed = dict( journal.results() )
+	failed = 0
+
+	#Get list of SERVICE_GROUPS and APPS from DC/OS. 
+	#Regular Marathon: "Services" tab
+	#################################
+
+	if '/marathon' in resumed:
+		service_groups_json, apps_dict = resumed['/marathon']
+	else:
+		with client.tracer.span( 'Marathon', 'marathon' ):
+			service_groups_json, apps_dict = get_marathon( client, '/marathon', '', fetch )
+		if service_groups_json is not None and apps_dict is not None:
+			journal.record( '/marathon', [ service_groups_json, apps_dict ] )
 		else:
-			print('**ERROR: GET MoM Apps failed with: {}'.format( response.text ) ) 
-
-	#save to SERVICE_GROUPS_MOM file
-	service_groups_file = open( config['SERVICE_GROUPS_MOM_FILE'], 'w' ) 		#append
-	service_groups_file.write( json.dumps( mom_groups ) )			#write to file in same raw JSON as obtained from DC/OS
-	service_groups_file.close()
-
-	#save to APPS_MOM file
-	apps_mom_file = open( config['APPS_MOM_FILE'], 'w' )
-	apps_mom_file.write( json.dumps ( mom_apps ) )
-	apps_mom_file.close()					
-
-	#If there are any groups, walk them
-	for service_group in mom_groups['mom_groups']:
-		helpers.walk_and_print( service_group['groups'], 'Service Group '+service_name, 'groups' )
-
-	#TODO: could also print the apps, but the walk_and_print function needs review
-	#for app in mom_apps['apps']:
-	#	helpers.walk_and_print( app, 'App '+service_name, 'apps' )
-
-else:
-	print('**ERROR: GET Apps failed with: {}'.format( request.text ) ) 
-
-sys.stdout.write( '\n** INFO: GET Service Groups:							Done.\n' )
-
+			failed += 1
+
+	#None means the request failed, the error has already been shown
+	if service_groups_json is not None:
+
+		#save to SERVICE_GROUPS file
+		service_groups_file = open( helpers.partial( config['SERVICE_GROUPS_FILE'] ), 'w' )
+		service_groups_file.write( json.dumps( service_groups_json ) )			#write to file in same raw JSON as obtained from DC/OS
+		service_groups_file.close()					
+
+		#change the list of service groups loaded from file (or DC/OS) to JSON dictionary
+		#(not listed while the phases of a full GET show their progress in a single line)
+		if client.progress:
+			helpers.walk_and_print( service_groups_json, 'Service Group', 'groups' )
+
+	#Marathon-on-Marathon and Apps
+	##############################
+
+	#None means the request failed, the error has already been shown
+	if apps_dict is not None:
+
+		#save all apps from DC/OS
+		apps_file = open( helpers.partial( config['APPS_FILE'] ), 'w' )
+		apps_file.write( json.dumps( apps_dict ) )
+		apps_file.close()	
+
+		marathons = {'marathons':[]}	#marathons: list of MoM instances 
+		apps_store = {'apps':[]}		#apps_store: list of all apps 
+		for index,app in enumerate( apps_dict['apps'] ):
+			apps_store['apps'].append( app )   
+			if 'DCOS_PACKAGE_NAME' in app['labels']:
+				if app['labels']['DCOS_PACKAGE_NAME']=='marathon':
+					marathons['marathons'].append( app )
+
+		mom_groups = {'mom_groups':[]}	#A list of all MoM instances, each with its service groups
+		mom_apps = {'mom_apps':[]} 			#A list of all MoM instances, each with its apps.
+
+		#Go through the marathons not retrieved yet, connect to them and repeat the above.
+		#Executor.map() returns results in the same order as the marathons,
+		#so the files are the same as with a serial crawl.
+		pending = [ marathon for marathon in marathons['marathons'] if '/service/'+marathon['labels']['DCOS_SERVICE_NAME'] not in resumed ]
+		with ThreadPoolExecutor( max_workers=concurrency ) as pool:
+			retrieved = dict( zip( [ marathon['labels']['DCOS_SERVICE_NAME'] for marathon in pending ], pool.map( lambda marathon: get_mom( client, marathon, fetch ), pending ) ) )
+
+		for marathon in marathons['marathons']:
+			service_name = marathon['labels']['DCOS_SERVICE_NAME']
+			if service_name in retrieved:
+				service_groups_json, running_mom_apps_json = retrieved[service_name]
+				if service_groups_json is not None and running_mom_apps_json is not None:
+					journal.record( '/service/'+service_name, [ service_groups_json, running_mom_apps_json ] )
+				else:
+					failed += 1
+			else:
+				service_groups_json, running_mom_apps_json = resumed['/service/'+service_name]
+
+			if service_groups_json is not None:
+				#create a new entry for this MoM instances holding its name, definition and groups.
+				entry = { 'DCOS_SERVICE_NAME': service_name,
+						'app' : marathon,        #save the entire JSON so that we can post it later easily
+												#'App' is saved as received -- upon posting, the offending fields are removed
+						'groups': service_groups_json
+						}
+				mom_groups['mom_groups'].append( entry )
+
+			if running_mom_apps_json is not None:
+				#create a new entry for this MoM instances holding its name, definition and Apps.
+				entry = { 'DCOS_SERVICE_NAME': service_name,
+						'app' : marathon,        #save the entire JSON so that we can post it later easily
+												#'App' is saved as received -- upon posting, the offending fields are removed
+						'apps': running_mom_apps_json
+						}
+				mom_apps['mom_apps'].append( entry )
+
+		#save to SERVICE_GROUPS_MOM file
+		service_groups_file = open( helpers.partial( config['SERVICE_GROUPS_MOM_FILE'] ), 'w' ) 		#append
+		service_groups_file.write( json.dumps( mom_groups ) )			#write to file in same raw JSON as obtained from DC/OS
+		service_groups_file.close()
+
+		#save to APPS_MOM file
+		apps_mom_file = open( helpers.partial( config['APPS_MOM_FILE'] ), 'w' )
+		apps_mom_file.write( json.dumps ( mom_apps ) )
+		apps_mom_file.close()					
+
+		#If there are any groups, walk them
+		for service_group in mom_groups['mom_groups']:
+			if client.progress:
+				helpers.walk_and_print( service_group['groups'], 'Service Group '+service_group['DCOS_SERVICE_NAME'], 'groups' )
+
+		#TODO: could also print the apps, but the walk_and_print function needs review
+		#for app in mom_apps['apps']:
+		#	helpers.walk_and_print( app, 'App '+service_name, 'apps' )
+
+	journal.close( failed == 0 )
+	if failed:
+		print( '\n** ERROR: GET Service Groups: {} Marathon instances could not be retrieved. Run it again to resume.'.format( failed ) )
+		return False
+	helpers.publish( [ config['SERVICE_GROUPS_FILE'], config['APPS_FILE'], config['SERVICE_GROUPS_MOM_FILE'], config['APPS_MOM_FILE'] ] )
+
+	sys.stdout.write( '\n** INFO: GET Service Groups:							Done.\n' )
+
+	return True
+
+if __name__ == '__main__':
+
+	#Load configuration if it exists
+	#config is stored directly in JSON format in a fixed location
+	config_file = os.getcwd()+'/.config.json'
+	config = helpers.get_config( config_file )				#returns config as a dictionary
+	if len( config ) == 0:
+		sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first' )
+		sys.exit(1)	
+
+	get_service_groups( config, helpers.get_client( config ) )
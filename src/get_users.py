@@ -14,55 +14,86 @@
 
 import sys
 import os
-import requests
 import json
 import helpers			#helper functions in separate module helpers.py
+import tracing			#spans of the phases in separate module tracing.py
+
+def memberships_from_groups( config ):
+	"""
+	Build the group memberships of each user by inverting the user-to-group
+	memberships in GROUPS_USERS_FILE, as retrieved by get_groups.
+	Returns a dictionary of uid -> list of memberships, in the same format as
+	received from /users/{uid}/groups, for the users that are members of any
+	group; or None if the groups haven't been retrieved, or the last GET of
+	the groups didn't complete (its partial files or its journal are left),
+	as the files would be those of an earlier GET.
+	"""
+	if not ( os.path.isfile( config['GROUPS_FILE'] ) and os.path.isfile( config['GROUPS_USERS_FILE'] ) ):
+		return None
+	if os.path.isfile( helpers.partial( config['GROUPS_USERS_FILE'] ) ) or os.path.isfile( helpers.journal_path( config, 'groups' ) ):
+		return None
+
+	groups_file = open( config['GROUPS_FILE'], 'r' )
+	groups = json.loads( groups_file.read() )
+	groups_file.close()
+	groups_users_file = open( config['GROUPS_USERS_FILE'], 'r' )
+	groups_users = json.loads( groups_users_file.read() )
+	groups_users_file.close()
+
+	#groups_users holds the gids escaped: find each group as received from DC/OS
+	groups_by_gid = { helpers.escape( group['gid'] ): group for group in groups['array'] }
+
+	memberships = {}
+	for group_user in groups_users['array']:
+		group = groups_by_gid.get( group_user['gid'] )
+		if group is None:
+			continue
+		for membership in group_user['users']:
+			memberships.setdefault( membership['user']['uid'], [] ).append(
+			{
+				'membershipurl' :		membership['membershipurl'],
+				'group' : {
+					'gid' : 			group['gid'],
+					'url' : 			group['url'],
+					'description' : 	group['description']
+				}
+			}
+			)
+
+	return memberships
+
+@tracing.phase
+def get_users( config, client, from_groups=False ):
+	"""
+	Get the list of users and their group memberships from DC/OS
+	and save them to USERS_FILE and USERS_GROUPS_FILE.
+	With `from_groups`, the memberships of every user are taken from the groups
+	already retrieved by get_groups: as every group was retrieved, a user that
+	isn't a member of any has none. They are only requested one by one if the
+	groups weren't retrieved completely.
+	The memberships requested for each user are journaled as soon as they are
+	retrieved, so that an interrupted GET resumes from the users not retrieved
+	yet. The files are only saved once the memberships of every user have
+	been retrieved.
+	"""
+
+	#memberships already known from the groups side, if requested
+	known_memberships = memberships_from_groups( config ) if from_groups else None
+	if from_groups and known_memberships is None:
+		print( '** WARNING: GET Users: groups not retrieved completely, getting memberships for every user.' )
+
+	#Get list of USERS from DC/OS. 
+	#This will be later used as index to get all user-to-group memberships
+	request = client.get( '/acs/api/v1/users', 'GET User' )
+
+	#None means the request failed, the error has already been shown
+	if request is None:
+		return False
 
-# Suppress warnings
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-
-#Load configuration if it exists
-#config is stored directly in JSON format in a fixed location
-config_file = os.getcwd()+'/.config.json'
-config = helpers.get_config( config_file )				#returns config as a dictionary
-if len( config ) == 0:
-	sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first\n' )
-	sys.exit(1)	
-
-#Get list of USERS from DC/OS. 
-#This will be later used as index to get all user-to-group memberships
-api_endpoint = '/acs/api/v1/users'
-url = 'http://'+config['DCOS_IP']+api_endpoint
-headers = {
-	'Content-type': 'application/json',
-	'Authorization': 'token='+config['TOKEN'],
-}
-try:
-	request = requests.get(
-		url,
-		headers=headers,
-		verify=False
-		)
-	#show progress after request
-	sys.stdout.write( '** INFO: GET User: {0} \r'.format( request.status_code ) )
-	sys.stdout.flush()
-except (
-    requests.exceptions.ConnectionError ,\
-    requests.exceptions.Timeout ,\
-    requests.exceptions.TooManyRedirects ,\
-    requests.exceptions.RequestException ,\
-    ConnectionRefusedError
-    ) as error:
-	print ('** ERROR: GET User: {} \n'.format( error ) ) 
-
-#2xx HTTP status code is success
-if str(request.status_code)[0] == '2':
-	
 	users = request.text				#raw text form requests, comes in JSON form from DC/OS
 
 	#save to USERS file
-	users_file = open( config['USERS_FILE'], 'w' )
+	users_file = open( helpers.partial( config['USERS_FILE'] ), 'w' )
 	users_file.write( users )			#write to file in same raw JSON as obtained from DC/OS
 	users_file.close()					
 
@@ -72,6 +103,10 @@ if str(request.status_code)[0] == '2':
 
 	#create a dictionary object that will hold all user-to-group memberships
 	users_groups = { 'array' : [] }
+	#users already retrieved by a previous GET that was interrupted
+	journal = helpers.Journal( config, 'users' )
+	resumed = dict( journal.results() )
+	failed = 0
 
 	#change the list of users loaded from file (or DC/OS) to JSON dictionary
 	users_json = json.loads( users )
@@ -100,31 +135,23 @@ if str(request.status_code)[0] == '2':
 		}
 		)
 		#ONLY if it's not remote
-		if user['is_remote'] == False:
-			print("**DEBUG: this user is not remote")
+		if user['is_remote'] == False and known_memberships is not None:
+			#memberships already retrieved from the groups side, none if it isn't in any group
+			users_groups['array'][index]['groups'].extend( known_memberships.get( user['uid'], [] ) )
+		elif user['is_remote'] == False and user['uid'] in resumed:
+			#memberships already retrieved by a previous GET
+			users_groups['array'][index]['groups'].extend( resumed[user['uid']] )
+		elif user['is_remote'] == False:
+			#debug output is left out of the single progress line of a full GET
+			if client.progress:
+				print("**DEBUG: this user is not remote")
 			#get groups for this user from DC/OS
-			api_endpoint = '/acs/api/v1/users/'+user['uid']+'/groups'
-			url = 'http://'+config['DCOS_IP']+api_endpoint
-			try:
-				request = requests.get(
-					url,
-					headers=headers,
-					verify=False
-					)
-				#show progress after request
-				sys.stdout.write( '** INFO: GET User Group {}: {}: {}\r'.format( index, user['uid'], request.status_code ) )
-				sys.stdout.flush()
-			except (
-			    requests.exceptions.ConnectionError ,\
-			    requests.exceptions.Timeout ,\
-			    requests.exceptions.TooManyRedirects ,\
-			    requests.exceptions.RequestException ,\
-			    ConnectionRefusedError
-			    ) as error:
-				print ('** ERROR: GET User Group {}: {}: {} \n'.format( index, user['uid'], error ) ) 
-
-			if str(request.status_code)[0] == '2':		
-				memberships = request.json() 	#get memberships from the JSON
+			memberships = client.get_json(
+				'/acs/api/v1/users/'+user['uid']+'/groups',
+				'GET User Group {}: {}'.format( index, user['uid'] )
+				)
+
+			if memberships is not None:
 				#memberships is another list, store as an array
 				for index2, membership in ( enumerate( memberships['array'] ) ):
 					#users_groups['array'] may be empty here.
@@ -140,8 +167,11 @@ if str(request.status_code)[0] == '2':
 						}
 					}
 					)
+				journal.record( user['uid'], users_groups['array'][index]['groups'] )
 			else:
-				echo ("**DEBUG: connection failed -- group membership for that user is created empty")
+				failed += 1
+				if client.progress:
+					print ("**DEBUG: connection failed -- group membership for that user is created empty")
 				#create empty entry
 				users_groups['array'][index]['groups'].append( {} )		
 		else:
@@ -149,16 +179,37 @@ if str(request.status_code)[0] == '2':
 			users_groups['array'][index]['groups'].append( {} )		
 
 	#done.
+	journal.close( failed == 0 )
 
 	#write dictionary as a JSON object to file
 	users_groups_json = json.dumps( users_groups ) 		#convert to JSON
-	users_groups_file = open( config['USERS_GROUPS_FILE'], 'w' )
+	users_groups_file = open( helpers.partial( config['USERS_GROUPS_FILE'] ), 'w' )
 	users_groups_file.write( users_groups_json )		#write to file in raw JSON
 	users_groups_file.close()									#flush
 
-sys.stdout.write( '\n** INFO: GET Users: 							Done. \n' )
+	if failed:
+		print( '\n** ERROR: GET Users: {} users could not be retrieved. Run it again to resume.'.format( failed ) )
+		return False
+	helpers.publish( [ config['USERS_FILE'], config['USERS_GROUPS_FILE'] ] )
+
+	sys.stdout.write( '\n** INFO: GET Users: 							Done. \n' )
 
+	return True
 
+def get_users_from_groups( config, client ):
+	"""
+	Get the users, taking their memberships from the groups retrieved by get_groups.
+	"""
+	return get_users( config, client, from_groups=True )
 
+if __name__ == '__main__':
 
+	#Load configuration if it exists
+	#config is stored directly in JSON format in a fixed location
+	config_file = os.getcwd()+'/.config.json'
+	config = helpers.get_config( config_file )				#returns config as a dictionary
+	if len( config ) == 0:
+		sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first\n' )
+		sys.exit(1)	
 
+	get_users( config, helpers.get_client( config ) )
@@ -8,7 +8,68 @@
 # Put on a separate module for clarity and readability.
 
 import os
+import re
+import sys
 import json
+import copy
+import time
+import hashlib
+import atexit
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+import metrics			#latency and throughput by endpoint in separate module metrics.py
+import tracing			#spans of the phases in separate module tracing.py
+import concurrency		#adaptive limit of requests in flight in separate module concurrency.py
+import cache			#responses to GETs kept on disk in separate module cache.py
+
+# Suppress warnings
+from requests.packages.urllib3.exceptions import InsecureRequestWarning
+requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+
+#HTTP status codes that are retried with backoff before giving up
+RETRY_STATUS_CODES = ( 500, 502, 503, 504 )
+
+#a create (PUT or POST) of a user, group, ACL or their relations answered
+#with 409 Conflict by the IAM API found the object already there, e.g.
+#restored by a previous run whose response was lost: it succeeded.
+#Any other 409 (e.g. Marathon's app locked by a deployment, or a group that
+#exists) is an error.
+CONFLICT = 409
+CREATE_METHODS = ( 'PUT', 'POST' )
+CONFLICT_CREATE_PATHS = ( '/acs/api/v1/users/', '/acs/api/v1/groups/', '/acs/api/v1/acls/' )
+
+#query string to get Marathon service groups with their apps, and the apps' task counts, embedded
+EMBED_GROUP_APPS = '?embed=group.groups&embed=group.apps&embed=group.apps.counts'
+
+#whitespace and commas between the elements of a JSON list
+ARRAY_SEPARATORS = re.compile( r'[ \t\n\r,]*' )
+
+#configuration parameters holding the location of each file in the local buffer
+#that makes up a saved configuration
+BUFFER_FILES = [
+	'USERS_FILE',
+	'USERS_GROUPS_FILE',
+	'GROUPS_FILE',
+	'GROUPS_USERS_FILE',
+	'ACLS_FILE',
+	'ACLS_PERMISSIONS_FILE',
+	'SERVICE_GROUPS_FILE',
+	'SERVICE_GROUPS_MOM_FILE',
+	'APPS_FILE',
+	'APPS_MOM_FILE'
+]
+
+#directory in the local buffer holding the journals of the GETs in progress
+CHECKPOINT_DIR = '.checkpoints'
+#suffix of the files being written by a GET, until they are complete
+PARTIAL_SUFFIX = '.part'
+#name of the journal of the writes sent to DC/OS by a full restore. Each
+#post_* script run on its own keeps its own journal, named after it
+RESTORE_JOURNAL = 'restore'
 
 # FUNCTION get_conf
 def get_config ( config_path ) :
@@ -25,6 +86,533 @@ def get_config ( config_path ) :
 
 	return config
 
+class ArrayWriter:
+	"""
+	Writes a JSON file holding a dictionary with a single list, like
+	{"array": [...]}, one element at a time, so that the whole list never
+	needs to be in memory. Each element is written (and flushed) as soon as it's
+	received. The result is byte for byte what json.dumps() would produce for the
+	full dictionary.
+	"""
+
+	def __init__( self, path, field='array' ):
+		self.file = open( path, 'w' )
+		self.file.write( '{'+json.dumps( field )+': [' )
+		self.count = 0
+
+	def write( self, item ):
+		if self.count:
+			self.file.write( ', ' )
+		self.file.write( json.dumps( item ) )
+		self.file.flush()
+		self.count += 1
+
+	def close( self ):
+		self.file.write( ']}' )
+		self.file.close()
+
+def read_array( path, field='array', chunk_size=64*1024 ):
+	"""
+	Read a JSON file holding a dictionary with a list, like {"array": [...]},
+	and yield the elements of the list one at a time, reading the file in chunks
+	so that the whole list never needs to be in memory.
+	Files in any other layout are loaded whole and the elements of `field` yielded.
+	If the file ends before the list is closed (e.g. it was being written when
+	the process was interrupted), the complete elements are yielded and a
+	warning is shown.
+	"""
+	decoder = json.JSONDecoder()
+	whitespace = ' \t\n\r'
+	array_file = open( path, 'r' )
+	buffer = array_file.read( chunk_size )
+	eof = False
+
+	#check the file starts with {"[field]": [
+	position = len( buffer ) - len( buffer.lstrip( whitespace ) )
+	streamable = buffer[position:position+1] == '{'
+	if streamable:
+		try:
+			key, position = decoder.raw_decode( buffer, position+1 )
+			remainder = buffer[position:].lstrip( whitespace )
+			streamable = key == field and remainder[:1] == ':' and remainder[1:].lstrip( whitespace )[:1] == '['
+		except ValueError:
+			streamable = False
+	if not streamable:
+		buffer += array_file.read()
+		array_file.close()
+		for item in json.loads( buffer ).get( field, [] ):
+			yield item
+		return
+	position = buffer.index( '[', position )+1
+
+	#the elements are decoded from `position` on, and the buffer is only cut
+	#down to the element not decoded yet when the next chunk is read
+	while True:
+		position = ARRAY_SEPARATORS.match( buffer, position ).end()
+		if buffer[position:position+1] == ']':
+			break
+		try:
+			item, end = decoder.raw_decode( buffer, position )
+			#an element at the very end of the buffer may continue in the next chunk
+			complete = eof or end < len( buffer )
+		except ValueError:
+			complete = False
+		if not complete:
+			#incomplete element: read more of the file, unless there's no more
+			if eof:
+				print( '** WARNING: {} is incomplete, only the elements before the end of the file were read.'.format( os.path.basename( path ) ) )
+				break
+			chunk = array_file.read( chunk_size )
+			eof = not chunk
+			buffer = buffer[position:] + chunk
+			position = 0
+			continue
+		position = end
+		yield item
+	array_file.close()
+
+def journal_path( config, name ):
+	"""
+	Return the location of the journal called `name` in the local buffer.
+	"""
+	return os.path.join( os.path.dirname( config['USERS_FILE'] ), CHECKPOINT_DIR, name+'.journal' )
+
+class Journal:
+	"""
+	Journal of the units of work (e.g. each ACL retrieved by a GET, or each
+	write sent by a restore) completed by a process, so that if it's interrupted
+	the next run resumes where it stopped instead of starting over. Each unit
+	is appended with its result to a file in the CHECKPOINT_DIR of the local
+	buffer as soon as it's completed, as a line of JSON. The journal is resumed
+	if it's for the same cluster and `identity` (e.g. the contents of the
+	buffer being restored) and was last written less than CHECKPOINT_MAX_AGE
+	seconds ago, otherwise it starts empty.
+	Only the keys of the units already completed are kept in memory, in
+	`done`: their results are read back from the file with results().
+	"""
+
+	def __init__( self, config, name, identity=None ):
+		self.path = journal_path( config, name )
+		os.makedirs( os.path.dirname( self.path ), exist_ok=True )
+		self.done = set()
+		self.lock = threading.Lock()
+		max_age = float( config.get( 'CHECKPOINT_MAX_AGE', 3600 ) )
+
+		self.header = { 'DCOS_IP': config['DCOS_IP'], 'identity': identity }
+		if os.path.isfile( self.path ) and time.time() - os.path.getmtime( self.path ) < max_age:
+			for key, result in self.entries():
+				self.done.add( key )
+			if self.done:
+				print( '** INFO: {}: resuming, {} already done.'.format( name, len( self.done ) ) )
+
+		if self.done:
+			self.file = open( self.path, 'a' )
+			#end the line left incomplete by an interruption, if any
+			self.file.write( '\n' )
+			self.file.flush()
+		else:
+			self.file = open( self.path, 'w' )
+			self.file.write( json.dumps( self.header )+'\n' )
+			self.file.flush()
+
+	def entries( self ):
+		"""
+		Yield the units in the journal file as ( key, result ), one line at a
+		time, if it's for the same cluster and identity.
+		"""
+		journal_file = open( self.path, 'r' )
+		try:
+			header = json.loads( journal_file.readline() )
+		except ValueError:
+			header = None
+		if header == self.header:
+			for line in journal_file:
+				#the last line is incomplete if the process was interrupted while writing it
+				try:
+					key, result = json.loads( line )
+				except ValueError:
+					continue
+				yield key, result
+		journal_file.close()
+
+	def results( self ):
+		"""
+		Yield ( key, result ) for each unit in the journal so far, reading them
+		from the file one at a time.
+		"""
+		with self.lock:
+			self.file.flush()
+
+		return self.entries()
+
+	def record( self, key, result ):
+		"""
+		Add a completed unit of work to the journal.
+		"""
+		with self.lock:
+			self.file.write( json.dumps( [ key, result ] )+'\n' )
+			self.file.flush()
+			self.done.add( key )
+
+	def close( self, complete ):
+		"""
+		Close the journal. If the work is `complete` the journal is removed,
+		otherwise it's kept for the next run to resume from.
+		"""
+		self.file.close()
+		if complete:
+			os.remove( self.path )
+
+def partial( path ):
+	"""
+	Return the path a buffer file is written to until the GET is complete.
+	"""
+	return path+PARTIAL_SUFFIX
+
+def publish( paths ):
+	"""
+	Replace each of the buffer files in `paths` with the partial file
+	written by a GET, once all of them are complete.
+	"""
+	for path in paths:
+		os.replace( partial( path ), path )
+
+def buffer_digest( config ):
+	"""
+	Return the SHA-256 of the contents of all the files in the local buffer,
+	to identify the configuration it holds.
+	"""
+	digest = hashlib.sha256()
+	for key in BUFFER_FILES:
+		if os.path.isfile( config[key] ):
+			buffer_file = open( config[key], 'rb' )
+			for chunk in iter( lambda: buffer_file.read( 64*1024 ), b'' ):
+				digest.update( chunk )
+			buffer_file.close()
+		digest.update( b'\0' )
+
+	return digest.hexdigest()
+
+class ObservedRetry( Retry ):
+	"""
+	Retry policy that calls `observer( url, response, error )` with every
+	response or error that is retried, so that they can be seen as pressure.
+	"""
+
+	def __init__( self, *args, observer=None, **kwargs ):
+		Retry.__init__( self, *args, **kwargs )
+		self.observer = observer
+
+	def new( self, **kwargs ):
+		retry = Retry.new( self, **kwargs )
+		retry.observer = self.observer
+		return retry
+
+	def increment( self, method=None, url=None, response=None, error=None, *args, **kwargs ):
+		if self.observer is not None:
+			self.observer( url, response, error )
+		return Retry.increment( self, method, url, response, error, *args, **kwargs )
+
+class DCOSClient:
+	"""
+	HTTP client shared by all the scripts to talk to a DC/OS cluster.
+	Keeps one persistent, pooled session per host (so that connections are
+	reused across requests), sends the authentication token with every request,
+	applies a timeout and retries with backoff on 5xx and connection errors.
+	Errors are reported in one place: the request methods print them and return
+	None, or the response if the request succeeded.
+	While restoring, writes can be journaled with journal_writes(), so that a
+	restore that is run again skips the writes that already succeeded.
+	If HTTP_RECORD is set to a file, every request and its response are
+	appended to it, to be served by bench/replay.py.
+	Every request sent is timed and counted by endpoint in `metrics`, and
+	the phases using the client record their spans with `tracer`.
+	With CONCURRENCY_CONTROL=adaptive, the requests in flight to each endpoint
+	family are limited by a concurrency.AdaptiveLimit, up to CONCURRENCY.
+	With RESPONSE_CACHE_TTL set, GETs are answered from the cache.ResponseCache
+	if they were sent less than that many seconds ago, and any write empties it.
+	"""
+
+	def __init__( self, config ):
+		self.dcos_ip = config['DCOS_IP']
+		self.pool_size = int( config.get( 'POOL_SIZE', 16 ) )
+		self.timeout = float( config.get( 'HTTP_TIMEOUT', 30 ) )
+		self.retries = int( config.get( 'HTTP_RETRIES', 3 ) )
+		self.backoff = float( config.get( 'HTTP_BACKOFF', 0.5 ) )
+		self.record_path = config.get( 'HTTP_RECORD', '' )
+		self.record_file = None
+		self.headers = {
+			'Content-type': 'application/json',
+			'Authorization': 'token='+config['TOKEN'],
+		}
+		self.sessions = {}				#host -> requests.Session
+		self.lock = threading.Lock()
+		self.journal = None				#journal of the writes that succeeded, while restoring
+		self.skipped = 0				#writes not sent because they were in the journal
+		self.remaining = []				#labels of the journaled writes that failed
+		self.metrics = metrics.Metrics()
+		self.tracer = tracing.Tracer( config.get( 'TRACE_FILE', '' ) )
+		self.adaptive = config.get( 'CONCURRENCY_CONTROL', 'adaptive' ) == 'adaptive'
+		self.ceiling = int( config.get( 'CONCURRENCY', 8 ) )
+		self.limits = {}				#endpoint family -> concurrency.AdaptiveLimit
+		self.shared = None				#fetch.SharedFetch of a full GET, if its phases share responses
+		self.cache = None				#cache.ResponseCache of the GETs, if enabled
+		self.progress = True			#show each request as it succeeds
+		cache_ttl = float( config.get( 'RESPONSE_CACHE_TTL', 0 ) )
+		if cache_ttl > 0:
+			self.cache = cache.ResponseCache( config, cache_ttl, float( config.get( 'RESPONSE_CACHE_SIZE', 100 ) ) * 1024 * 1024 )
+
+	def session( self, host ):
+		"""
+		Return the pooled session for a host, creating it on first use.
+		"""
+		with self.lock:
+			if host not in self.sessions:
+				retry = ObservedRetry(
+					total=self.retries,
+					backoff_factor=self.backoff,
+					status_forcelist=RETRY_STATUS_CODES,
+					raise_on_status=False,
+					observer=self.retried
+					)
+				adapter = HTTPAdapter(
+					pool_connections=self.pool_size,
+					pool_maxsize=self.pool_size,
+					max_retries=retry
+					)
+				session = requests.Session()
+				session.headers.update( self.headers )
+				session.verify = False
+				session.mount( 'http://', adapter )
+				session.mount( 'https://', adapter )
+				self.sessions[host] = session
+			return self.sessions[host]
+
+	def limit( self, url ):
+		"""
+		Return the adaptive limit of the endpoint family of a URL, creating it
+		on first use, or None if concurrency isn't adaptive.
+		"""
+		if not self.adaptive:
+			return None
+		family = concurrency.endpoint_family( url )
+		with self.lock:
+			if family not in self.limits:
+				self.limits[family] = concurrency.AdaptiveLimit( self.ceiling )
+			return self.limits[family]
+
+	def retried( self, url, response, error ):
+		"""
+		Called by the retry policy before retrying a request that got a 5xx
+		response or a connection error: lower the limit of its endpoint family.
+		"""
+		limit = self.limit( url )
+		if limit is not None:
+			limit.pressure()
+
+	def request( self, method, path, label, data=None, quiet=False ):
+		"""
+		Send a request to DC/OS and return the response if it succeeded (2xx, or
+		409 Conflict to an IAM create, as the object exists already).
+		`path` is either an API endpoint, like '/acs/api/v1/users', that is sent
+		to DCOS_IP, or a full URL for endpoints on other hosts or ports.
+		`label` identifies the request in the progress and error messages.
+		`data` is serialized to JSON as the body of the request if present.
+		Prints the error and returns None if the request failed. With `quiet`,
+		errors are not printed, for requests that are expected to fail (e.g.
+		polling a service until it's up).
+		Writes found in the journal are not sent again and return True.
+		GETs are answered from the response cache if they are in it, except
+		`quiet` ones, which check something that is expected to change.
+		"""
+		if '://' in path:
+			url = path
+		else:
+			url = 'http://'+self.dcos_ip+path
+		cacheable = self.cache is not None and method == 'GET' and not quiet
+		if cacheable:
+			response = self.cache.get( url )
+			if response is not None:
+				return response
+		elif self.cache is not None and method != 'GET':
+			#what was read before may no longer be true
+			self.cache.clear()
+		if data is not None:
+			data = json.dumps( data )
+
+		#writes are journaled by method, URL and body: the same entity
+		#restored with different contents is sent again
+		journal_key = None
+		if self.journal is not None and method != 'GET':
+			journal_key = method+' '+url+' '+hashlib.sha256( ( data or '' ).encode() ).hexdigest()
+			if journal_key in self.journal.done:
+				with self.lock:
+					self.skipped += 1
+				return True
+		limit = self.limit( url )
+		if limit is not None:
+			limit.acquire()
+		start = time.monotonic()
+		response = None
+		failed = True
+		#the request is observed and released from its limit however it ends,
+		#so that an unexpected exception doesn't keep its slot
+		try:
+			response = self.session( urlparse( url ).netloc ).request(
+				method,
+				url,
+				data=data,
+				timeout=self.timeout
+				)
+			if self.record_path:
+				self.record( method, url, response )
+			if not ( response.status_code == CONFLICT and method in CREATE_METHODS
+				and urlparse( url ).path.startswith( CONFLICT_CREATE_PATHS ) ):
+				response.raise_for_status()
+			failed = False
+		except requests.exceptions.HTTPError as error:
+			if not quiet:
+				print( '** ERROR: {}: {} {}'.format( label, error, error.response.text ) )
+			self.failed_write( journal_key, label )
+			return None
+		except requests.exceptions.RequestException as error:
+			if not quiet:
+				print( '** ERROR: {}: {}'.format( label, error ) )
+			self.failed_write( journal_key, label )
+			return None
+		finally:
+			self.observe( method, url, start, response, failed, limit )
+
+		if journal_key is not None:
+			self.journal.record( journal_key, label )
+		if cacheable:
+			self.cache.put( url, response )
+
+		#show progress after request
+		if self.progress:
+			sys.stdout.write( '** INFO: {}: {:>20} \r'.format( label, response.status_code ) )
+			sys.stdout.flush()
+
+		return response
+
+	def observe( self, method, url, start, response, error, limit ):
+		"""
+		Add a request sent at `start` (time.monotonic()) to the metrics, with the
+		size of its response if there was one, and release it from its
+		adaptive `limit` (None if not adaptive). A 429 or 5xx response, or no
+		response at all (e.g. a timeout) is pressure on the cluster.
+		"""
+		seconds = time.monotonic() - start
+		if limit is not None:
+			overloaded = response is None or response.status_code == 429 or response.status_code >= 500
+			limit.release( metrics.endpoint_template( url ), seconds, overloaded )
+		size = len( response.content ) if response is not None else 0
+		self.metrics.observe( method, url, seconds, size, error )
+
+	def record( self, method, url, response ):
+		"""
+		Append a request and its response to the HTTP_RECORD file, as a line of
+		JSON. Only the path and query of the URL are kept, so that they can be
+		replayed on any host, and neither the headers (with the authentication
+		token) nor the body of the request are recorded.
+		"""
+		parsed = urlparse( url )
+		exchange = json.dumps( {
+			'method': method,
+			'path': parsed.path + ( '?'+parsed.query if parsed.query else '' ),
+			'status': response.status_code,
+			'elapsed': response.elapsed.total_seconds(),
+			'body': response.text
+			} )
+		with self.lock:
+			if self.record_file is None:
+				self.record_file = open( self.record_path, 'a' )
+			self.record_file.write( exchange+'\n' )
+			self.record_file.flush()
+
+	def failed_write( self, journal_key, label ):
+		"""
+		Keep the label of a journaled write that failed, to report it.
+		"""
+		if journal_key is not None:
+			with self.lock:
+				self.remaining.append( label )
+
+	def journal_writes( self, config, name ):
+		"""
+		Start journaling every write that succeeds in the journal `name`, and
+		skipping the writes already journaled there by a previous run of the
+		same restore of the same local buffer to the same cluster.
+		"""
+		self.journal = Journal( config, name, buffer_digest( config ) )
+		self.skipped = 0
+		self.remaining = []
+
+	def close_journal( self, complete ):
+		"""
+		Stop journaling writes and report the writes that were skipped and
+		those that remain to be restored. The journal is only removed if the
+		restore is `complete` (every write was sent, which the failed writes
+		kept in `remaining` don't tell) and none of them failed, otherwise it's
+		kept so that the restore can be run again to send only the rest.
+		Returns True if none remain.
+		"""
+		self.journal.close( complete and not self.remaining )
+		self.journal = None
+		if self.skipped:
+			print( '** INFO: {} writes already restored were skipped.'.format( self.skipped ) )
+		for label in self.remaining:
+			print( '** ERROR: remaining: {}'.format( label ) )
+		if self.remaining:
+			print( '** ERROR: {} writes remain to be restored. Run the restore again to send only those.'.format( len( self.remaining ) ) )
+			return False
+
+		return True
+
+	def report_cache( self ):
+		if self.cache.hits:
+			print( '** INFO: {} GETs answered from the response cache.'.format( self.cache.hits ) )
+
+	def get( self, path, label, quiet=False ):
+		return self.request( 'GET', path, label, quiet=quiet )
+
+	def get_json( self, path, label ):
+		"""
+		Return the JSON response to a GET, or None if the request failed.
+		In a full GET whose phases share responses, it's served from what
+		another phase already retrieved if possible.
+		"""
+		if self.shared is not None:
+			response = self.shared.take( path )
+			if response is not None:
+				return response
+		request = self.get( path, label )
+
+		return request.json() if request is not None else None
+
+	def put( self, path, label, data=None ):
+		return self.request( 'PUT', path, label, data )
+
+	def post( self, path, label, data=None ):
+		return self.request( 'POST', path, label, data )
+
+#client shared by everything running in this process
+_client = None
+
+def get_client( config ):
+	"""
+	Return the client shared by the whole process, creating it on first use.
+	The metrics of the requests it sent are reported when the process exits.
+	"""
+	global _client
+	if _client is None:
+		_client = DCOSClient( config )
+		if _client.cache is not None:
+			atexit.register( _client.report_cache )
+		atexit.register( metrics.report, _client.metrics, config, _client.limits )
+
+	return _client
+
 def escape ( a_string ) :
 	"""
 	Escape characters that create issues for URLs
@@ -94,4 +682,46 @@ def format_app( app ):
 	if 'deployments' in app: del app['deployments']
 
 	return app
-	
\ No newline at end of file
+	
+
+def build_group_tree( root_service_group, apps ):
+	"""
+	Build the full tree of service groups with their apps, ready to be posted.
+	Receives the root service group ('/') and the list of apps as received from
+	DC/OS, and returns a formatted copy of the tree where each app is placed
+	in the group it belongs to, adding the groups missing in the tree.
+	The objects passed as parameters are not modified.
+	"""
+	root = format_service_group( copy.deepcopy( root_service_group ) )
+
+	#index all the groups in the tree by id
+	groups = {}
+	pending = [ root ]
+	while pending:
+		group = pending.pop()
+		groups[group['id'].rstrip( '/' ) or '/'] = group
+		pending.extend( group['groups'] )
+
+	def get_group( group_id ):
+		if group_id not in groups:
+			group = { 'id': group_id, 'apps': [], 'groups': [] }
+			get_group( group_id.rsplit( '/', 1 )[0] or '/' )['groups'].append( group )
+			groups[group_id] = group
+		return groups[group_id]
+
+	for app in apps:
+		app = format_app( copy.deepcopy( app ) )
+		get_group( app['id'].rsplit( '/', 1 )[0] or '/' )['apps'].append( app )
+
+	return root
+
+def group_apps( service_group ):
+	"""
+	Return the list of all apps embedded in a (potentially recursive tree-like
+	structure of) service group, each group's apps before those of its children.
+	"""
+	apps = list( service_group.get( 'apps', [] ) )
+	for group in service_group.get( 'groups', [] ):
+		apps.extend( group_apps( group ) )
+
+	return apps
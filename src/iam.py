@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+#
+# iam.py: query the users, groups and permissions in the local buffer
+#
+# Usage:
+#   iam.py summary                  - number of users, groups, ACLs and permissions
+#   iam.py user [uid]               - what a user can do: its groups and the actions it has on each ACL
+#   iam.py group [gid]              - the members of a group and the actions it has on each ACL
+#   iam.py rid [rid] [action]       - who can do an action (or anything) on an ACL
+#   iam.py check [uid] [rid] [action] - whether a user can do an action on an ACL, directly
+#                                     or through a group. Exits with 1 if it can't.
+#
+# The buffer files are loaded into indexes (user -> groups, group -> users,
+# principal -> ACLs, ACL -> principals) that are saved next to them in JSON,
+# so that later queries only read the indexes instead of scanning the buffer
+# files again. The indexes are rebuilt whenever any of the buffer files changes.
+
+import sys
+import os
+import json
+import helpers			#helper functions in separate module helpers.py
+
+#file in the local buffer directory holding the indexes
+INDEX_FILE = 'iam_index.json'
+#buffer files the indexes are built from
+INDEX_SOURCES = [ 'USERS_FILE', 'GROUPS_FILE', 'GROUPS_USERS_FILE', 'ACLS_PERMISSIONS_FILE' ]
+#action that grants every other action on an ACL
+FULL_ACTION = 'full'
+
+def unescape( a_string ):
+	"""
+	Undo helpers.escape(), to show rids and gids as they are in DC/OS.
+	"""
+	return a_string.replace( '%252F', '/' )
+
+class IAMGraph:
+	"""
+	Indexes of the users, groups and permissions in the local buffer.
+	Groups and ACLs are indexed by gid and rid as they are in DC/OS (not escaped).
+	"""
+
+	def __init__( self ):
+		self.users = set()							#uids
+		self.groups = set()							#gids
+		self.group_users = {}						#gid -> set of uids
+		self.user_groups = {}						#uid -> set of gids
+		self.acls = {}								#rid -> { ( 'users'|'groups', uid|gid ): set of actions }
+		self.principal_acls = {}					#( 'users'|'groups', uid|gid ) -> { rid: set of actions }
+
+	def load( self, config ):
+		"""
+		Build the indexes from the files in the local buffer.
+		"""
+		users_file = open( config['USERS_FILE'], 'r' )
+		for user in json.loads( users_file.read() )['array']:
+			self.users.add( user['uid'] )
+		users_file.close()
+
+		groups_file = open( config['GROUPS_FILE'], 'r' )
+		for group in json.loads( groups_file.read() )['array']:
+			self.groups.add( group['gid'] )
+		groups_file.close()
+
+		groups_users_file = open( config['GROUPS_USERS_FILE'], 'r' )
+		for group_user in json.loads( groups_users_file.read() )['array']:
+			gid = unescape( group_user['gid'] )
+			for membership in group_user.get( 'users', [] ):
+				uid = membership['user']['uid']
+				self.group_users.setdefault( gid, set() ).add( uid )
+				self.user_groups.setdefault( uid, set() ).add( gid )
+		groups_users_file.close()
+
+		for acl_permission in helpers.read_array( config['ACLS_PERMISSIONS_FILE'] ):
+			rid = unescape( acl_permission['rid'] )
+			self.acls.setdefault( rid, {} )
+			for kind, field in ( ( 'users', 'uid' ), ( 'groups', 'gid' ) ):
+				for principal in acl_permission.get( kind, [] ):
+					key = ( kind, unescape( principal[field] ) )
+					actions = { action['name'] for action in principal.get( 'actions', [] ) }
+					self.acls[rid].setdefault( key, set() ).update( actions )
+					self.principal_acls.setdefault( key, {} ).setdefault( rid, set() ).update( actions )
+
+		return self
+
+	def to_json( self ):
+		"""
+		Return the indexes as a dictionary that can be serialized to JSON, with
+		the sets as sorted lists. The ACLs of each principal are not included,
+		as they are the same permissions as the principals of each ACL.
+		"""
+		return {
+			'users':		sorted( self.users ),
+			'groups':		sorted( self.groups ),
+			'group_users':	{ gid: sorted( uids ) for gid, uids in self.group_users.items() },
+			'user_groups':	{ uid: sorted( gids ) for uid, gids in self.user_groups.items() },
+			'acls':			{ rid: [ [ kind, principal, sorted( actions ) ] for ( kind, principal ), actions in principals.items() ]
+								for rid, principals in self.acls.items() }
+		}
+
+	def from_json( self, indexes ):
+		"""
+		Load the indexes from a dictionary returned by to_json().
+		"""
+		self.users = set( indexes['users'] )
+		self.groups = set( indexes['groups'] )
+		self.group_users = { gid: set( uids ) for gid, uids in indexes['group_users'].items() }
+		self.user_groups = { uid: set( gids ) for uid, gids in indexes['user_groups'].items() }
+		for rid, principals in indexes['acls'].items():
+			self.acls[rid] = {}
+			for kind, principal, actions in principals:
+				self.acls[rid][( kind, principal )] = set( actions )
+				self.principal_acls.setdefault( ( kind, principal ), {} )[rid] = set( actions )
+
+		return self
+
+	def user_permissions( self, uid ):
+		"""
+		Return the actions a user has on each ACL, as a dictionary of
+		rid -> { action: set of sources }, where a source is 'direct' or the
+		gid of the group the action comes from.
+		"""
+		permissions = {}
+		sources = [ ( ( 'users', uid ), 'direct' ) ]
+		sources += [ ( ( 'groups', gid ), gid ) for gid in sorted( self.user_groups.get( uid, () ) ) ]
+		for key, source in sources:
+			for rid, actions in self.principal_acls.get( key, {} ).items():
+				for action in actions:
+					permissions.setdefault( rid, {} ).setdefault( action, set() ).add( source )
+
+		return permissions
+
+	def allowed( self, uid, rid, action ):
+		"""
+		Return whether a user can do an action on an ACL, directly or
+		through any of its groups.
+		"""
+		actions = self.user_permissions( uid ).get( rid, {} )
+
+		return action in actions or FULL_ACTION in actions
+
+	def principals( self, rid, action=None ):
+		"""
+		Return the users and groups with an action (or any action if None) on an
+		ACL, as a tuple of dictionaries uid -> actions and gid -> actions, and a
+		dictionary with every user that has it through a group: uid -> gids.
+		"""
+		users = {}
+		groups = {}
+		for ( kind, principal ), actions in self.acls.get( rid, {} ).items():
+			if action is not None and action not in actions and FULL_ACTION not in actions:
+				continue
+			if kind == 'users':
+				users[principal] = actions
+			else:
+				groups[principal] = actions
+
+		#expand the groups to their members
+		through_groups = {}
+		for gid in groups:
+			for uid in self.group_users.get( gid, () ):
+				through_groups.setdefault( uid, set() ).add( gid )
+
+		return users, groups, through_groups
+
+def index_signature( config ):
+	"""
+	Identify the current contents of the buffer files the indexes are built
+	from, by their size and modification time.
+	"""
+	signature = []
+	for key in INDEX_SOURCES:
+		stat = os.stat( config[key] )
+		signature.append( [ config[key], stat.st_size, stat.st_mtime_ns ] )
+
+	return signature
+
+def get_graph( config ):
+	"""
+	Return the indexes of the local buffer, loading them from the index file
+	if the buffer hasn't changed since it was saved, or building and saving
+	them otherwise. Returns None if the buffer is incomplete.
+	"""
+	for key in INDEX_SOURCES:
+		if not os.path.isfile( config[key] ):
+			print( '** ERROR: Buffer is empty. Please LOAD or GET {} first.'.format( os.path.basename( config[key] ) ) )
+			return None
+
+	signature = index_signature( config )
+	index_path = os.path.join( os.path.dirname( config['USERS_FILE'] ), INDEX_FILE )
+	if os.path.isfile( index_path ):
+		index_file = open( index_path, 'r' )
+		try:
+			saved = json.loads( index_file.read() )
+			if saved['signature'] == signature:
+				return IAMGraph().from_json( saved['indexes'] )
+		except ( ValueError, KeyError, TypeError ):
+			#not a valid index: it's built again
+			pass
+		finally:
+			index_file.close()
+
+	graph = IAMGraph().load( config )
+	#write to a temporary file first so that a half-written index is never used
+	index_file = open( index_path+'.tmp', 'w' )
+	index_file.write( json.dumps( { 'signature': signature, 'indexes': graph.to_json() } ) )
+	index_file.close()
+	os.replace( index_path+'.tmp', index_path )
+
+	return graph
+
+def format_actions( actions ):
+	return ', '.join( sorted( actions ) )
+
+if __name__ == '__main__':
+
+	#Load configuration if it exists
+	#config is stored directly in JSON format in a fixed location
+	config_file = os.getcwd()+'/.config.json'
+	config = helpers.get_config( config_file )				#returns config as a dictionary
+	if len( config ) == 0:
+		sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first\n' )
+		sys.exit(1)
+
+	#minimum and maximum number of arguments of each command
+	commands = { 'summary': ( 0, 0 ), 'user': ( 1, 1 ), 'group': ( 1, 1 ), 'rid': ( 1, 2 ), 'check': ( 3, 3 ) }
+	if len( sys.argv ) < 2 or sys.argv[1] not in commands \
+		or not commands[sys.argv[1]][0] <= len( sys.argv ) - 2 <= commands[sys.argv[1]][1]:
+		print( '** ERROR: usage: iam.py [summary|user [uid]|group [gid]|rid [rid] [action]|check [uid] [rid] [action]]' )
+		sys.exit(1)
+
+	graph = get_graph( config )
+	if graph is None:
+		sys.exit(1)
+	command = sys.argv[1]
+
+	if command == 'summary':
+		print( '** Users: {}'.format( len( graph.users ) ) )
+		print( '** Groups: {}'.format( len( graph.groups ) ) )
+		print( '** ACLs with permissions: {}'.format( len( graph.acls ) ) )
+		print( '** Permissions: {}'.format( sum( len( actions ) for principals in graph.acls.values() for actions in principals.values() ) ) )
+
+	elif command == 'user':
+		uid = sys.argv[2]
+		if uid not in graph.users:
+			print( '** ERROR: user [ {} ] not found in local buffer.'.format( uid ) )
+			sys.exit(1)
+		print( '** User [ {} ] is a member of: {}'.format( uid, ', '.join( sorted( graph.user_groups.get( uid, () ) ) ) or 'no groups' ) )
+		for rid, actions in sorted( graph.user_permissions( uid ).items() ):
+			print( '{}: {}'.format( rid, ', '.join(
+				'{} ({})'.format( action, ', '.join( sorted( sources ) ) ) for action, sources in sorted( actions.items() ) ) ) )
+
+	elif command == 'group':
+		gid = sys.argv[2]
+		if gid not in graph.groups:
+			print( '** ERROR: group [ {} ] not found in local buffer.'.format( gid ) )
+			sys.exit(1)
+		print( '** Group [ {} ] members: {}'.format( gid, ', '.join( sorted( graph.group_users.get( gid, () ) ) ) or 'none' ) )
+		for rid, actions in sorted( graph.principal_acls.get( ( 'groups', gid ), {} ).items() ):
+			print( '{}: {}'.format( rid, format_actions( actions ) ) )
+
+	elif command == 'rid':
+		rid = sys.argv[2]
+		action = sys.argv[3] if len( sys.argv ) > 3 else None
+		if rid not in graph.acls:
+			print( '** ERROR: ACL [ {} ] not found in local buffer.'.format( rid ) )
+			sys.exit(1)
+		users, groups, through_groups = graph.principals( rid, action )
+		for uid, actions in sorted( users.items() ):
+			print( 'user {}: {}'.format( uid, format_actions( actions ) ) )
+		for gid, actions in sorted( groups.items() ):
+			print( 'group {}: {}'.format( gid, format_actions( actions ) ) )
+		for uid, gids in sorted( through_groups.items() ):
+			print( 'user {} through group {}'.format( uid, ', '.join( sorted( gids ) ) ) )
+
+	else:
+		uid, rid, action = sys.argv[2:5]
+		if graph.allowed( uid, rid, action ):
+			print( '** ALLOWED: user [ {} ] can [ {} ] on [ {} ].'.format( uid, action, rid ) )
+		else:
+			print( '** DENIED: user [ {} ] can not [ {} ] on [ {} ].'.format( uid, action, rid ) )
+			sys.exit(1)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+#
+# metrics.py: latency and throughput of the requests sent to DC/OS, by endpoint
+#
+# Every request sent by the shared client (helpers.DCOSClient) is timed and
+# counted under its endpoint template, e.g. '/acs/api/v1/acls/{rid}/permissions',
+# so that the requests for every user, group or ACL add up in the same bucket.
+# At the end of each run a summary is printed with the count, the latency
+# percentiles, the bytes received and the errors of each endpoint, and if
+# METRICS_FILE is set the same metrics are written in the Prometheus text format
+# to a file of its own for each operation, named after METRICS_FILE (e.g.
+# metrics.pipeline_get.prom), for the node exporter's textfile collector to
+# scrape. With adaptive concurrency (see concurrency.py), the limit chosen for
+# each endpoint family is reported along with them.
+
+import os
+import re
+import sys
+import time
+import threading
+from urllib.parse import urlparse
+
+#endpoint templates, matched in order against the path of each request
+ENDPOINT_TEMPLATES = [ ( re.compile( pattern ), template ) for pattern, template in [
+	( r'^/acs/api/v1/users$', '/acs/api/v1/users' ),
+	( r'^/acs/api/v1/users/[^/]+$', '/acs/api/v1/users/{uid}' ),
+	( r'^/acs/api/v1/users/[^/]+/groups$', '/acs/api/v1/users/{uid}/groups' ),
+	( r'^/acs/api/v1/groups$', '/acs/api/v1/groups' ),
+	( r'^/acs/api/v1/groups/[^/]+$', '/acs/api/v1/groups/{gid}' ),
+	( r'^/acs/api/v1/groups/[^/]+/users$', '/acs/api/v1/groups/{gid}/users' ),
+	( r'^/acs/api/v1/groups/[^/]+/users/[^/]+$', '/acs/api/v1/groups/{gid}/users/{uid}' ),
+	( r'^/acs/api/v1/groups/[^/]+/permissions$', '/acs/api/v1/groups/{gid}/permissions' ),
+	( r'^/acs/api/v1/acls$', '/acs/api/v1/acls' ),
+	( r'^/acs/api/v1/acls/[^/]+$', '/acs/api/v1/acls/{rid}' ),
+	( r'^/acs/api/v1/acls/[^/]+/permissions$', '/acs/api/v1/acls/{rid}/permissions' ),
+	( r'^/acs/api/v1/acls/[^/]+/users/[^/]+/[^/]+$', '/acs/api/v1/acls/{rid}/users/{uid}/{action}' ),
+	( r'^/acs/api/v1/acls/[^/]+/groups/[^/]+/[^/]+$', '/acs/api/v1/acls/{rid}/groups/{gid}/{action}' ),
+	( r'^/marathon/v2/(groups|apps|info)$', r'/marathon/v2/\1' ),
+	( r'^/marathon/v2/(groups|apps)/.+$', r'/marathon/v2/\1/{id}' ),
+	( r'^/service/[^/]+/v2/(groups|apps|info)$', r'/service/{name}/v2/\1' ),
+	( r'^/service/[^/]+/v2/(groups|apps)/.+$', r'/service/{name}/v2/\1/{id}' ),
+	( r'^/mesos/slaves$', '/mesos/slaves' ),
+] ]
+#percentiles shown in the summary and exported
+QUANTILES = [ 0.5, 0.95, 0.99 ]
+
+def endpoint_template( url ):
+	"""
+	Return the endpoint template of a URL or path, without its query.
+	Paths that don't match any known endpoint are kept up to their
+	third component, to keep the number of buckets bounded.
+	"""
+	path = urlparse( url ).path
+	for pattern, template in ENDPOINT_TEMPLATES:
+		match = pattern.match( path )
+		if match:
+			return match.expand( template )
+
+	return '/'.join( path.split( '/' )[:4] )+'/...'
+
+def percentile( ordered, quantile ):
+	"""
+	Return the quantile of a sorted list of values, by the nearest rank.
+	"""
+	if not ordered:
+		return 0
+	return ordered[min( len( ordered ) - 1, max( 0, int( round( quantile * len( ordered ) + 0.5 ) ) - 1 ) )]
+
+class Metrics:
+	"""
+	Durations, bytes received and errors of the requests sent, by method and
+	endpoint template.
+	"""
+
+	def __init__( self ):
+		self.lock = threading.Lock()
+		self.started = time.time()
+		self.durations = {}			#( method, template ) -> list of seconds
+		self.bytes = {}				#( method, template ) -> bytes received
+		self.errors = {}			#( method, template ) -> requests that failed
+
+	def observe( self, method, url, seconds, size, error ):
+		"""
+		Add a request that took `seconds`, received `size` bytes, and failed
+		if `error`.
+		"""
+		key = ( method, endpoint_template( url ) )
+		with self.lock:
+			self.durations.setdefault( key, [] ).append( seconds )
+			self.bytes[key] = self.bytes.get( key, 0 ) + size
+			self.errors[key] = self.errors.get( key, 0 ) + ( 1 if error else 0 )
+
+	def count( self ):
+		"""
+		Return the number of requests sent so far.
+		"""
+		with self.lock:
+			return sum( len( durations ) for durations in self.durations.values() )
+
+	def endpoints( self ):
+		"""
+		Return the statistics of each endpoint as a list of dictionaries,
+		the endpoints that took the most time first.
+		"""
+		with self.lock:
+			statistics = []
+			for ( method, template ), durations in self.durations.items():
+				ordered = sorted( durations )
+				statistics.append( {
+					'method': method,
+					'endpoint': template,
+					'count': len( ordered ),
+					'seconds': sum( ordered ),
+					'quantiles': [ percentile( ordered, quantile ) for quantile in QUANTILES ],
+					'bytes': self.bytes[( method, template )],
+					'errors': self.errors[( method, template )]
+					} )
+
+		return sorted( statistics, key=lambda endpoint: -endpoint['seconds'] )
+
+	def summary( self ):
+		"""
+		Print the statistics of each endpoint and the totals.
+		"""
+		endpoints = self.endpoints()
+		if not endpoints:
+			return
+		elapsed = time.time() - self.started
+		print( '\n** INFO: HTTP requests by endpoint:' )
+		print( '{:<6} {:<50} {:>8} {:>10} {:>9} {:>9} {:>9} {:>12} {:>7}'.format( 'method', 'endpoint', 'count', 'total s', 'p50 ms', 'p95 ms', 'p99 ms', 'bytes', 'errors' ) )
+		for endpoint in endpoints:
+			print( '{:<6} {:<50} {:>8} {:>10.2f} {:>9.1f} {:>9.1f} {:>9.1f} {:>12} {:>7}'.format(
+				endpoint['method'], endpoint['endpoint'], endpoint['count'], endpoint['seconds'],
+				*[ quantile * 1000 for quantile in endpoint['quantiles'] ],
+				endpoint['bytes'], endpoint['errors'] ) )
+		count = sum( endpoint['count'] for endpoint in endpoints )
+		print( '** INFO: {} requests in {:.1f} seconds ({:.1f} per second), {} bytes received, {} errors.'.format(
+			count, elapsed, count / elapsed if elapsed else 0,
+			sum( endpoint['bytes'] for endpoint in endpoints ), sum( endpoint['errors'] for endpoint in endpoints ) ) )
+
+	def write_prometheus( self, path, run, limits ):
+		"""
+		Write the metrics and the concurrency `limits` to `path` in the
+		Prometheus text format, labeled with the `run` (the script, e.g.
+		'get_acls'). All of them only cover this run, so they are gauges.
+		The file is replaced at once, so that it's never scraped half-written.
+		"""
+		lines = []
+		def metric( name, kind, description ):
+			lines.append( '# HELP dcos_backup_{} {}'.format( name, description ) )
+			lines.append( '# TYPE dcos_backup_{} {}'.format( name, kind ) )
+
+		endpoints = self.endpoints()
+		labels = [ 'run="{}",method="{}",endpoint="{}"'.format( run, endpoint['method'], endpoint['endpoint'] ) for endpoint in endpoints ]
+
+		metric( 'http_request_duration_seconds', 'gauge', 'Percentiles of the duration of the requests to DC/OS in the last run, by endpoint.' )
+		for endpoint, label in zip( endpoints, labels ):
+			for quantile, value in zip( QUANTILES, endpoint['quantiles'] ):
+				lines.append( 'dcos_backup_http_request_duration_seconds{{{},quantile="{}"}} {}'.format( label, quantile, value ) )
+		metric( 'http_request_time_seconds', 'gauge', 'Time spent in requests to DC/OS in the last run, by endpoint.' )
+		for endpoint, label in zip( endpoints, labels ):
+			lines.append( 'dcos_backup_http_request_time_seconds{{{}}} {}'.format( label, endpoint['seconds'] ) )
+		metric( 'http_requests', 'gauge', 'Requests sent to DC/OS in the last run, by endpoint.' )
+		for endpoint, label in zip( endpoints, labels ):
+			lines.append( 'dcos_backup_http_requests{{{}}} {}'.format( label, endpoint['count'] ) )
+		metric( 'http_response_bytes', 'gauge', 'Bytes received from DC/OS in the last run, by endpoint.' )
+		for endpoint, label in zip( endpoints, labels ):
+			lines.append( 'dcos_backup_http_response_bytes{{{}}} {}'.format( label, endpoint['bytes'] ) )
+		metric( 'http_request_errors', 'gauge', 'Requests to DC/OS that failed in the last run, by endpoint.' )
+		for endpoint, label in zip( endpoints, labels ):
+			lines.append( 'dcos_backup_http_request_errors{{{}}} {}'.format( label, endpoint['errors'] ) )
+		if limits:
+			metric( 'concurrency_limit', 'gauge', 'Requests in flight allowed at the end of the run, by endpoint family.' )
+			for family, statistics in sorted( limits.items() ):
+				lines.append( 'dcos_backup_concurrency_limit{{run="{}",family="{}"}} {}'.format( run, family, statistics['limit'] ) )
+			metric( 'concurrency_limit_average', 'gauge', 'Average requests in flight allowed when each request was sent, by endpoint family.' )
+			for family, statistics in sorted( limits.items() ):
+				lines.append( 'dcos_backup_concurrency_limit_average{{run="{}",family="{}"}} {}'.format( run, family, statistics['average'] ) )
+			metric( 'concurrency_limit_decreases', 'gauge', 'Times the limit was decreased on pressure in the last run, by endpoint family.' )
+			for family, statistics in sorted( limits.items() ):
+				lines.append( 'dcos_backup_concurrency_limit_decreases{{run="{}",family="{}"}} {}'.format( run, family, statistics['decreases'] ) )
+		metric( 'run_duration_seconds', 'gauge', 'Duration of the last run.' )
+		lines.append( 'dcos_backup_run_duration_seconds{{run="{}"}} {}'.format( run, time.time() - self.started ) )
+		metric( 'run_timestamp_seconds', 'gauge', 'Time the last run finished.' )
+		lines.append( 'dcos_backup_run_timestamp_seconds{{run="{}"}} {}'.format( run, time.time() ) )
+
+		metrics_file = open( path+'.tmp', 'w' )
+		metrics_file.write( '\n'.join( lines )+'\n' )
+		metrics_file.close()
+		os.replace( path+'.tmp', path )
+
+def run_path( path, run ):
+	"""
+	Return the file to write the metrics of a run to: METRICS_FILE with the
+	name of the run before its extension (e.g. 'dcos_backup.pipeline_get.prom'),
+	so that each operation keeps its own and a POST doesn't replace the
+	metrics of the last GET.
+	"""
+	root, extension = os.path.splitext( path )
+	return '{}.{}{}'.format( root, run, extension )
+
+def run_name():
+	"""
+	Return the name of the run: the script, and its command if it has one
+	(e.g. 'pipeline_get').
+	"""
+	name = os.path.splitext( os.path.basename( sys.argv[0] ) )[0]
+	if len( sys.argv ) > 1 and sys.argv[1].isalpha():
+		name += '_'+sys.argv[1]
+
+	return name
+
+def report( metrics, config, limits ):
+	"""
+	Print the summary of the requests sent in this run and the concurrency
+	chosen for them (`limits`: endpoint family -> concurrency.AdaptiveLimit),
+	and write them to METRICS_FILE if it's set.
+	"""
+	metrics.summary()
+	statistics = { family: limit.statistics() for family, limit in limits.items() }
+	if statistics:
+		print( '** INFO: Concurrency by endpoint family (ceiling {}):'.format( config.get( 'CONCURRENCY', 8 ) ) )
+		print( '{:<40} {:>6} {:>6} {:>8} {:>10}'.format( 'family', 'limit', 'peak', 'average', 'decreases' ) )
+		for family, family_statistics in sorted( statistics.items() ):
+			print( '{:<40} {limit:>6} {peak:>6} {average:>8.1f} {decreases:>10}'.format( family, **family_statistics ) )
+
+	path = config.get( 'METRICS_FILE', '' )
+	if path and metrics.durations:
+		run = run_name()
+		metrics.write_prometheus( run_path( path, run ), run, statistics )
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+#
+# pipeline.py: full backup or restore of a DC/OS cluster in a single process
+#
+# Receives a parameter as CLI argument (argv[1]): "get" to retrieve the full
+# configuration from DC/OS into the local buffer, or "post" to restore the full
+# configuration in the local buffer to DC/OS.
+#
+# Runs the same phases as the get_* scripts in the same interpreter, so that
+# the configuration, the authentication token and the pooled connections to
+# the cluster are shared by all of them. With FULL_GET_PHASES=concurrent, the
+# phases of a full GET run at the same time, with a single line showing the
+# progress of all of them, so that it takes as long as the slowest one instead
+# of all of them added up; with "sequential", one after the other. A full POST
+# is run by restore.py, which sends the same requests as the post_* scripts
+# concurrently, each as soon as what it depends on has been restored.
+# With FULL_GET_FETCH=shared, each phase serves the others the relations it has
+# already retrieved (see fetch.py), so that they are not requested again: run
+# one after the other, the ACLs are retrieved before the groups; run at the
+# same time, the groups wait for the permissions of the ACLs. The memberships
+# of the users are then taken from the groups, as with USERS_GROUPS_SOURCE=groups.
+
+import sys
+import os
+import time
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait
+import helpers			#helper functions in separate module helpers.py
+import fetch			#responses shared by the phases of a full GET in separate module fetch.py
+from get_users import get_users, get_users_from_groups
+from get_groups import get_groups
+from get_acls import get_acls
+from get_service_groups import get_service_groups
+from restore import restore
+from sync import SYNC_PHASES
+
+#phases of a full GET, in the order they are run
+GET_PHASES = [ get_users, get_groups, get_acls, get_service_groups ]
+#with USERS_GROUPS_SOURCE=groups, the groups are retrieved first and the
+#memberships of the users are taken from them
+GET_PHASES_FROM_GROUPS = [ get_groups, get_users_from_groups, get_acls, get_service_groups ]
+#phases that only run once another one succeeded, as they use its files
+PHASE_REQUIREMENTS = { get_users_from_groups: get_groups }
+#with FULL_GET_FETCH=shared, each phase runs after those it takes responses from,
+#and the memberships of the users are taken from the groups
+GET_PHASES_SHARED = [ get_acls, get_groups, get_users_from_groups, get_service_groups ]
+#relations each phase provides to the others with FULL_GET_FETCH=shared
+SHARED_PROVIDERS = { get_acls: [ fetch.GROUP_PERMISSIONS ] }
+#seconds between updates of the progress of phases running at the same time
+PROGRESS_INTERVAL = 1
+
+def run_phases( config, client, phases ):
+	"""
+	Run each phase with the shared configuration and client, but those whose
+	required phase (see PHASE_REQUIREMENTS) failed.
+	Returns True if all of them succeeded.
+	"""
+	failed = set()
+	for phase in phases:
+		required = PHASE_REQUIREMENTS.get( phase )
+		if required in failed:
+			print( '** ERROR: {} skipped, as {} did not complete.'.format( phase.__name__, required.__name__ ) )
+			failed.add( phase )
+		elif not phase( config, client ):
+			print( '** ERROR: {} did not complete.'.format( phase.__name__ ) )
+			failed.add( phase )
+
+	return not failed
+
+def show_progress( client, states, start ):
+	elapsed = time.time() - start
+	count = client.metrics.count()
+	sys.stdout.write( '** INFO: FULL GET: {:.0f}s, {} requests ({:.0f}/s) | {} \r'.format(
+		elapsed, count, count / elapsed if elapsed else 0,
+		' | '.join( '{}: {}'.format( name, state ) for name, state in states.items() ) ) )
+	sys.stdout.flush()
+
+def run_concurrently( config, client, phases ):
+	"""
+	Run all the phases at the same time, each in a thread of its own, showing
+	the progress of all of them in a single line instead of each request.
+	A phase with a required phase (see PHASE_REQUIREMENTS) waits for it to
+	finish, and is skipped if it failed.
+	The relations a phase provides to the others are released when it
+	finishes, whether it succeeded or not.
+	Returns True if all of them succeeded.
+	"""
+	states = collections.OrderedDict( ( phase.__name__, 'running' ) for phase in phases )
+	#set when each phase finishes, for the phases that require it
+	finished = { phase: threading.Event() for phase in phases }
+	start = time.time()
+
+	def run( phase ):
+		ok = False
+		required = PHASE_REQUIREMENTS.get( phase )
+		try:
+			if required in finished:
+				states[phase.__name__] = 'waiting'
+				finished[required].wait()
+			if required in finished and states[required.__name__] != 'done':
+				print( '\n** ERROR: {} skipped, as {} did not complete.'.format( phase.__name__, required.__name__ ) )
+			else:
+				states[phase.__name__] = 'running'
+				ok = phase( config, client )
+		except Exception as error:
+			print( '\n** ERROR: {}: {}'.format( phase.__name__, error ) )
+		finally:
+			if client.shared is not None:
+				for template in SHARED_PROVIDERS.get( phase, [] ):
+					client.shared.release( template )
+			states[phase.__name__] = 'done' if ok else 'FAILED'
+			finished[phase].set()
+		return ok
+
+	client.progress = False
+	with ThreadPoolExecutor( max_workers=len( phases ) ) as pool:
+		futures = [ pool.submit( run, phase ) for phase in phases ]
+		while wait( futures, timeout=PROGRESS_INTERVAL )[1]:
+			show_progress( client, states, start )
+	client.progress = True
+	show_progress( client, states, start )
+
+	failed = [ name for name, state in states.items() if state != 'done' ]
+	if failed:
+		print( '\n** ERROR: FULL GET: {} of {} phases did not complete: {}.'.format( len( failed ), len( states ), ', '.join( failed ) ) )
+		return False
+	print( '\n** INFO: FULL GET: all {} phases completed in {:.1f} seconds.'.format( len( states ), time.time() - start ) )
+
+	return True
+
+def full_get( config, client ):
+	"""
+	Get the full configuration from DC/OS into the local buffer.
+	"""
+	concurrent = config.get( 'FULL_GET_PHASES', 'concurrent' ) == 'concurrent'
+	shared = config.get( 'FULL_GET_FETCH', 'shared' ) == 'shared'
+	source = config.get( 'USERS_GROUPS_SOURCE', 'groups' )
+	#sharing retrieves each membership once, from the groups
+	if shared and source != 'groups':
+		print( '** ERROR: FULL GET: FULL_GET_FETCH=shared takes the memberships of the users from the groups and can\'t be used with USERS_GROUPS_SOURCE={}. Set USERS_GROUPS_SOURCE=groups or FULL_GET_FETCH=separate in env.sh.'.format( source ) )
+		return False
+	if shared:
+		phases = GET_PHASES_SHARED
+		client.shared = fetch.SharedFetch()
+		if concurrent:
+			for phase in phases:
+				for template in SHARED_PROVIDERS.get( phase, [] ):
+					client.shared.promise( template )
+	elif source == 'groups':
+		phases = GET_PHASES_FROM_GROUPS
+	else:
+		phases = GET_PHASES
+
+	if concurrent:
+		ok = run_concurrently( config, client, phases )
+	else:
+		ok = run_phases( config, client, phases )
+	if shared:
+		print( '** INFO: GET: {} requests taken from other phases instead of DC/OS.'.format( client.shared.served ) )
+		client.shared = None
+
+	return ok
+
+def full_post( config, client ):
+	"""
+	Restore the full configuration in the local buffer to DC/OS.
+	With RESTORE_MODE=diff, only what is missing or changed in DC/OS is sent.
+	"""
+	#what is in DC/OS now is compared with the buffer, not what was there before
+	if client.cache is not None:
+		client.cache.clear()
+	if config.get( 'RESTORE_MODE', 'full' ) == 'diff':
+		return run_phases( config, client, SYNC_PHASES )
+	return restore( config, client )
+
+if __name__ == '__main__':
+
+	#Load configuration if it exists
+	#config is stored directly in JSON format in a fixed location
+	config_file = os.getcwd()+'/.config.json'
+	config = helpers.get_config( config_file )				#returns config as a dictionary
+	if len( config ) == 0:
+		sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first\n' )
+		sys.exit(1)
+
+	if len( sys.argv ) != 2 or sys.argv[1] not in ( 'get', 'post' ):
+		print( '** ERROR: usage: pipeline.py [get|post]' )
+		sys.exit(1)
+
+	client = helpers.get_client( config )
+	if sys.argv[1] == 'get':
+		ok = full_get( config, client )
+	else:
+		ok = full_post( config, client )
+	#run.sh only saves the configuration retrieved if the GET succeeded
+	sys.exit( 0 if ok else 1 )
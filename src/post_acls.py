@@ -15,167 +15,148 @@
 
 import sys
 import os
-import requests
-import json
+import itertools
 import helpers      #helper functions in separate module helpers.py
-
-# Suppress warnings
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-
-#Load configuration if it exists
-#config is stored directly in JSON format in a fixed location
-config_file = os.getcwd()+'/.config.json'
-config = helpers.get_config( config_file )        #returns config as a dictionary
-if len( config ) == 0:
-	sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first' )
-	sys.exit(1)  
-
-#check that there's a USERS file created (buffer loaded)
-if not ( os.path.isfile( config['ACLS_FILE'] ) ):
-	sys.stdout.write('** ERROR: Buffer is empty. Please LOAD or GET ACLs before POSTing them.')
-	sys.exit(1)
-
-#open the ACLS file and load the LIST of ACLs from JSON
-acls_file = open( config['ACLS_FILE'], 'r' )
-#load entire text file and convert to JSON - dictionary
-acls = json.loads( acls_file.read() )
-acls_file.close()
-
-#loop through the list of ACL Rules and create the ACLS in the system
-#PUT /acls/{rid}
-for index, acl in ( enumerate( acls['array'] ) ): 
-
-	rid = helpers.escape( acl['rid'] )
-	#build the request
-	api_endpoint = '/acs/api/v1/acls/'+rid
-	url = 'http://'+config['DCOS_IP']+api_endpoint
-	headers = {
-	'Content-type': 'application/json',
-	'Authorization': 'token='+config['TOKEN'],
-	}
-	data = {
-	'description': acl['description'],
-	}
-	#send the request to PUT the new USER
-	try:
-		request = requests.put(
-		url,
-		verify=False,
-	 	data = json.dumps( data ),
-	 	headers = headers
-		)
-		request.raise_for_status()
-		#show progress after request
-		sys.stdout.write( '** INFO: PUT ACL: {} : {}: {:>20} \r'.format( index, rid, request.status_code ) ) 
-		sys.stdout.flush()
-	except (
-	    requests.exceptions.ConnectionError ,\
-	    requests.exceptions.Timeout ,\
-	    requests.exceptions.TooManyRedirects ,\
-	    requests.exceptions.RequestException ,\
-	    ConnectionRefusedError
-	    ) as error:
-		print ('** ERROR: PUT ACL: {}: {}'.format( rid, error ) ) 
-
-
-#loop through the list of ACL permission rules and create the ACLS in the system
-#/acls/{rid}/groups/{gid}/{action}
-#/acls/{rid}/users/{uid}/{action}
-
-#check that there's a ACLS_PERMISSIONS file created (buffer loaded)
-if not ( os.path.isfile( config['ACLS_PERMISSIONS_FILE'] ) ):
-	sys.stdout.write('** ERROR: Buffer is empty. Please LOAD or GET ACL-Permission information before POSTing it.')
-	sys.exit(1)
-
-#open the ACLS file and load the LIST of acls from JSON
-acls_permissions_file = open( config['ACLS_PERMISSIONS_FILE'], 'r' )
-#load entire text file and convert to JSON - dictionary
-acls_permissions = json.loads( acls_permissions_file.read() )
-acls_permissions_file.close()
-
-for index, acl_permission in ( enumerate( acls_permissions['array'] ) ): 
+import tracing      #spans of the phases in separate module tracing.py
+from concurrent.futures import ThreadPoolExecutor
+
+#number of requests queued at a time, per worker
+BATCH_FACTOR = 4
+
+def acl_requests( acls_path ):
+	"""
+	Yield the ( path, label, data ) of the request to create each ACL
+	in the ACLS file, reading them from the file one at a time.
+	"""
+	#PUT /acls/{rid}
+	for index, acl in ( enumerate( helpers.read_array( acls_path ) ) ): 
+
+		rid = helpers.escape( acl['rid'] )
+		data = {
+		'description': acl['description'],
+		}
+		yield ( '/acs/api/v1/acls/'+rid, 'PUT ACL: {} : {}'.format( index, rid ), data )
+
+def permission_requests( acls_permissions_path ):
+	"""
+	Yield the ( path, label, data ) of the request to grant each action to each
+	user and group in the ACLS_PERMISSIONS file, reading it one ACL at a time.
+	"""
+	for index, acl_permission in ( enumerate( helpers.read_array( acls_permissions_path ) ) ): 
 	
-	if 'rid' in acl_permission:
+		if 'rid' not in acl_permission:
+			continue
 		rid = helpers.escape( acl_permission['rid']	)
 
-		#test if this acl_permission has users
-		if 'users' in acl_permission:
-			#array of users for this acl_permission
-			for index2, user in ( enumerate( acl_permission['users'] ) ): 
-			#PUT  /acls/{rid}/users/{uid}/{action}
-				if 'uid' in user:
-					uid = user['uid']
-					#array of actions for this user_acl_permission
-					for index3, action in ( enumerate( user['actions'] ) ): 
-
-						if 'name' in action:
-							name = action['name']
-							#build the request
-							api_endpoint = '/acs/api/v1/acls/'+helpers.escape( rid )+'/users/'+uid+'/'+name
-							url = 'http://'+config['DCOS_IP']+api_endpoint
-							headers = {
-							'Content-type': 'application/json',
-							'Authorization': 'token='+config['TOKEN'],
-							}
-							#send the request to PUT the new USER
-							try:
-								request = requests.put(
-								url,
-								verify=False,
-								headers = headers
-								)
-								request.raise_for_status()
-								#show progress after request
-								sys.stdout.write( '** INFO: PUT Action: {} : {} User: {} ACL: {} : {:>20} \r'.format(index2,  name, uid, rid, request.status_code ) ) 
-								sys.stdout.flush()
-							except (
-							    requests.exceptions.ConnectionError ,\
-							    requests.exceptions.Timeout ,\
-							    requests.exceptions.TooManyRedirects ,\
-							    requests.exceptions.RequestException ,\
-							    ConnectionRefusedError
-							    ) as error:
-								print ('** ERROR: PUT Action: {} : {} User: {} ACL: {} : {}\n'.format( index2, name, uid, rid, error ) ) 
-
-	if 'groups' in acl_permission:
+		#array of users for this acl_permission
+		#PUT  /acls/{rid}/users/{uid}/{action}
+		for index2, user in ( enumerate( acl_permission.get( 'users', [] ) ) ): 
+			if 'uid' in user:
+				uid = user['uid']
+				#array of actions for this user_acl_permission
+				for index3, action in ( enumerate( user['actions'] ) ): 
+					if 'name' in action:
+						name = action['name']
+						yield (
+							'/acs/api/v1/acls/'+helpers.escape( rid )+'/users/'+uid+'/'+name,
+							'PUT Action: {} : {} User: {} ACL: {}'.format( index2, name, uid, rid ),
+							None
+							)
+
 		#array of groups for this acl_permission
-		for index2, group in ( enumerate( acl_permission['groups'] ) ): 
 		#PUT  /acls/{rid}/groups/{gid}/{action}
+		for index2, group in ( enumerate( acl_permission.get( 'groups', [] ) ) ): 
 			if 'gid' in group:
 				gid = helpers.escape( group['gid'] )
 				#array of actions for this group_acl_permission
 				for index3, action in ( enumerate( group['actions'] ) ): 
-
 					if 'name' in action:
 						name = helpers.escape( action['name'] )
-						#build the request
-						api_endpoint = '/acs/api/v1/acls/'+helpers.escape( rid )+'/groups/'+gid+'/'+name
-						url = 'http://'+config['DCOS_IP']+api_endpoint
-						headers = {
-						'Content-type': 'application/json',
-						'Authorization': 'token='+config['TOKEN'],
-						}
-						#send the request to PUT the new USER
-						try:
-							request = requests.put(
-							url,
-							verify=False,
-							headers = headers
+						yield (
+							'/acs/api/v1/acls/'+helpers.escape( rid )+'/groups/'+gid+'/'+name,
+							'PUT Action: {} : {} Group: {} ACL: {}'.format( index2, name, gid, rid ),
+							None
 							)
-							request.raise_for_status()
-							#show progress after request
-							sys.stdout.write( '** INFO: PUT Action: {} : {} Group: {} ACL: {} : {:>20} \r'.format( index2, name, gid, rid, request.status_code ) )
-							sys.stdout.flush() 
-						except (
-						    requests.exceptions.ConnectionError ,\
-						    requests.exceptions.Timeout ,\
-						    requests.exceptions.TooManyRedirects ,\
-						    requests.exceptions.RequestException ,\
-						    ConnectionRefusedError
-						    ) as error:
-							print ('** ERROR: PUT Action: {} : {} Group: {} ACL: {} : {}\n'.format( index2, name, gid, rid, error ) ) 
-	
-sys.stdout.write('\n** INFO: PUT ACLs: 							Done.\n')
-
 
+def put( client, request ):
+	"""
+	Send a PUT for a ( path, label, data ) request, traced as a span.
+	"""
+	path, label, data = request
+	with client.tracer.span( label, 'acl' ):
+		return client.put( path, label, data )
+
+def put_all( client, pool, requests, batch_size ):
+	"""
+	Send a PUT for every ( path, label, data ) in `requests` through the pool
+	of workers, queueing `batch_size` of them at a time.
+	Returns the number of requests that failed: the client keeps their labels
+	in `remaining`, listed when the journal is closed.
+	"""
+	failed = 0
+	while True:
+		batch = list( itertools.islice( requests, batch_size ) )
+		if not batch:
+			break
+		failed += sum( 1 for response in pool.map( lambda request: put( client, request ), batch ) if response is None )
+
+	return failed
+
+@tracing.phase
+def post_acls( config, client ):
+	"""
+	Restore the ACLs in ACLS_FILE and the permissions granted on them
+	in ACLS_PERMISSIONS_FILE to DC/OS.
+	Requests are sent by a pool of up to CONCURRENCY workers. All ACLs are
+	created before any permission is granted on them.
+	"""
+
+	#maximum number of requests in flight against the ACS
+	concurrency = int( config.get( 'CONCURRENCY', 8 ) )
+
+	#check that there's a USERS file created (buffer loaded)
+	if not ( os.path.isfile( config['ACLS_FILE'] ) ):
+		sys.stdout.write('** ERROR: Buffer is empty. Please LOAD or GET ACLs before POSTing them.')
+		return False
+
+	#check that there's a ACLS_PERMISSIONS file created (buffer loaded)
+	if not ( os.path.isfile( config['ACLS_PERMISSIONS_FILE'] ) ):
+		sys.stdout.write('** ERROR: Buffer is empty. Please LOAD or GET ACL-Permission information before POSTing it.')
+		return False
+
+	with ThreadPoolExecutor( max_workers=concurrency ) as pool:
+
+		#create all the ACLs in the system first
+		with client.tracer.span( 'create ACLs', 'stage' ):
+			failed_acls = put_all( client, pool, acl_requests( config['ACLS_FILE'] ), concurrency * BATCH_FACTOR )
+
+		#then grant the permissions on them
+		#/acls/{rid}/groups/{gid}/{action}
+		#/acls/{rid}/users/{uid}/{action}
+		with client.tracer.span( 'grant permissions', 'stage' ):
+			failed_permissions = put_all( client, pool, permission_requests( config['ACLS_PERMISSIONS_FILE'] ), concurrency * BATCH_FACTOR )
+
+	sys.stdout.write('\n** INFO: PUT ACLs: 							Done.\n')
+
+	#the requests that failed are listed when the journal is closed
+	if failed_acls or failed_permissions:
+		print( '** ERROR: PUT ACLs: {} ACLs and {} permissions could not be restored.'.format( failed_acls, failed_permissions ) )
+		return False
+
+	return True
+
+if __name__ == '__main__':
+
+	#Load configuration if it exists
+	#config is stored directly in JSON format in a fixed location
+	config_file = os.getcwd()+'/.config.json'
+	config = helpers.get_config( config_file )        #returns config as a dictionary
+	if len( config ) == 0:
+		sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first' )
+		sys.exit(1)  
+
+	client = helpers.get_client( config )
+	#skip what a previous run already restored
+	client.journal_writes( config, 'post_acls' )
+	ok = post_acls( config, client )
+	client.close_journal( ok )
@@ -14,279 +14,237 @@
 
 import sys
 import os
-import requests
 import json
+import time
 import helpers      #helper functions in separate module helpers.py
+import tracing      #spans of the phases in separate module tracing.py
 from time import sleep
-
-# Suppress warnings
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-
-#Load configuration if it exists
-#config is stored directly in JSON format in a fixed location
-config_file = os.getcwd()+'/.config.json'
-config = helpers.get_config( config_file )        #returns config as a dictionary
-if len( config ) == 0:
-  sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first' )
-  sys.exit(1)  
-
-#check that there's a SERVICE_GROUPS file created (buffer loaded)
-if not ( os.path.isfile( config['SERVICE_GROUPS_FILE'] ) ):
-  sys.stdout.write('** ERROR: Buffer is empty. Please LOAD or GET Service Groups before POSTing them.')
-  sys.exit(1)
-
-#open the service groups file and load the LIST of Service Groups from JSON
-service_groups_file = open( config['SERVICE_GROUPS_FILE'], 'r' )
-#load entire text file and convert to JSON - dictionary
-root_service_group = json.loads( service_groups_file.read() )
-service_groups_file.close()
-
-#***** Service groups ******
-#'/' is a service group itself but it does not need to be posted.
-#Need to POST the groups under it (one level) that don't exist yet.
-#https://mesosphere.github.io/marathon/docs/rest-api.html#post-v2-groups
-
-for index, service_group in enumerate( root_service_group['groups'] ):   #don't post `/` but only his 'groups'
-  helpers.format_service_group( service_group )
-  #build the request
-  api_endpoint = '/marathon/v2/groups'
-  url = 'http://'+config['DCOS_IP']+api_endpoint
-  headers = {
-    'Content-type': 'application/json',
-    'Authorization': 'token='+config['TOKEN']
-  }
-
-  #send the request to PUT the new Service Group
-  try:
-    request = requests.post(
-      url,
-      verify=False,
-      headers = headers,
-      data = json.dumps( service_group )
+from concurrent.futures import ThreadPoolExecutor
+
+#first and longest wait between checks of a MoM instance's status, in seconds
+MOM_POLL_MIN = 1
+MOM_POLL_MAX = 15
+
+def wait_for_mom( client, app_id, service_name, timeout ):
+  """
+  Wait until the Marathon-on-Marathon instance launched as app `app_id` is
+  healthy and its API at /service/[service_name] answers. Checks only that app,
+  doubling the wait between checks up to MOM_POLL_MAX seconds.
+  Returns False if it isn't ready after `timeout` seconds.
+  """
+  deadline = time.time() + timeout
+  delay = MOM_POLL_MIN
+  with client.tracer.span( 'wait for MoM '+service_name, 'mom wait' ):
+    while True:
+      #GET /v2/apps/{app_id} to see if its tasks are healthy
+      request = client.get( '/marathon/v2/apps'+app_id, 'GET MoM Instance: {}'.format( service_name ), quiet=True )
+      if request is not None and request.json()['app'].get( 'tasksHealthy', 0 ) > 0:
+        #healthy tasks don't mean Marathon has finished starting: check that it answers
+        if client.get( '/service/'+service_name+'/v2/info', 'GET MoM Info: {}'.format( service_name ), quiet=True ) is not None:
+          print( '** INFO: MoM instance {} is up.'.format( service_name ) )
+          return True
+
+      if time.time() + delay > deadline:
+        print( '** ERROR: MoM instance {} not ready after {} seconds.'.format( service_name, timeout ) )
+        return False
+      sleep( delay )
+      delay = min( delay * 2, MOM_POLL_MAX )
+
+def post_marathon( client, base, prefix, root_service_group, apps, deploy ):
+  """
+  Post a tree of service groups and a list of apps to the Marathon instance at
+  `base` ('/marathon' or '/service/[name]'). `prefix` identifies the instance
+  in the label of each request.
+  With `deploy` 'apps', the groups are posted without their apps and then each
+  app on its own, which starts a Marathon deployment per app.
+  With `deploy` 'tree', the apps are put back in their groups and each
+  top-level group is put whole, creating it or updating it if it exists, with
+  the apps directly under '/' sent in a single batch, so that Marathon only
+  plans one deployment per request.
+  Returns True if every group and app was posted.
+  """
+  #result of each write sent
+  results = []
+  if deploy == 'tree':
+    root = helpers.build_group_tree( root_service_group, apps )
+    for index, service_group in enumerate( root['groups'] ):
+      #PUT /v2/groups/{group_id} creates the group or updates it with the apps
+      #it's missing, where a POST gets a 409 Conflict if the group exists
+      request = client.put(
+        base+'/v2/groups'+service_group['id'],
+        'PUT {}Service Group Tree: {} {}'.format( prefix, index, service_group['id'] ),
+        service_group
+      )
+      results.append( request is not None )
+    if root['apps']:
+      #PUT /v2/apps creates or updates a list of apps in one deployment
+      request = client.put(
+        base+'/v2/apps',
+        'PUT {}Apps: {} apps'.format( prefix, len( root['apps'] ) ),
+        root['apps']
+      )
+      results.append( request is not None )
+    return all( results )
+
+  #'/' is a service group itself but it does not need to be posted.
+  #Need to POST the groups under it (one level) that don't exist yet.
+  #https://mesosphere.github.io/marathon/docs/rest-api.html#post-v2-groups
+  for index, service_group in enumerate( root_service_group['groups'] ):   #don't post `/` but only his 'groups'
+    #format the groups to remove offending fields
+    helpers.format_service_group( service_group )
+    #send the request to POST the new Service Group
+    request = client.post(
+      base+'/v2/groups',
+      'POST {}Service Group: {} {}'.format( prefix, index, service_group['id'] ),
+      service_group
     )
-    request.raise_for_status()
-    #show progress after request
-    sys.stdout.write( '** INFO: POST Service Group: {} : {:>20} \r'.format( index, request.status_code ) )
-    sys.stdout.flush() 
-  except (
-    requests.exceptions.ConnectionError ,\
-    requests.exceptions.Timeout ,\
-    requests.exceptions.TooManyRedirects ,\
-    requests.exceptions.RequestException ,\
-    ConnectionRefusedError
-    ) as error:
-    print ('** ERROR: POST Service Group: {0} {1}: {2}'.format( index, service_group['id'], request.text ) ) 
-
-#***** Apps ******
-#check that there's an APPS file created (buffer loaded)
-if not ( os.path.isfile( config['APPS_FILE'] ) ):
-  sys.stdout.write('** ERROR: Buffer is empty. Please LOAD or GET Apps before POSTing them.')
-  sys.exit(1)
-
-#open the apps file and load the LIST of Apps from JSON
-apps_file = open( config['APPS_FILE'], 'r' )
-#load entire text file and convert to JSON - dictionary
-apps = json.loads( apps_file.read() )
-apps_file.close()
-
-#Post apps
-for index, app in enumerate( apps['apps'] ): 
-  helpers.format_app( app )
-  #build the request
-  api_endpoint = '/marathon/v2/apps'
-  url = 'http://'+config['DCOS_IP']+api_endpoint
-  headers = {
-    'Content-type': 'application/json',
-    'Authorization': 'token='+config['TOKEN']
-  }
-  #send the request to PUT the new Service Group
-  try:
-    request = requests.post(
-      url,
-      verify=False,
-      headers = headers,
-      data = json.dumps( app )
+    results.append( request is not None )
+
+  for index, app in enumerate( apps ): 
+    helpers.format_app( app )
+    #send the request to POST the new App
+    request = client.post(
+      base+'/v2/apps',
+      'POST {}App: {} {}'.format( prefix, index, app['id'] ),
+      app
     )
-    request.raise_for_status()
-    #show progress after request
-    sys.stdout.write( '** INFO: POST App: {} : {:>20} \r'.format( index, request.status_code ) )
-    sys.stdout.flush() 
-  except (
-    requests.exceptions.ConnectionError ,\
-    requests.exceptions.Timeout ,\
-    requests.exceptions.TooManyRedirects ,\
-    requests.exceptions.RequestException ,\
-    ConnectionRefusedError
-    ) as error:
-    print ('** ERROR: POST App: {0} {1}: {2}'.format( index, app['id'], request.text ) ) 
-
-#***** Marathon-on-Marathon service groups ******
-
-#open the service groups mom file and load the dict of SGs_MOM from JSON
-service_groups_mom_file = open( config['SERVICE_GROUPS_MOM_FILE'], 'r' )
-#load entire text file and convert to JSON - dictionary
-service_groups_mom = json.loads( service_groups_mom_file.read() )
-service_groups_mom_file.close()
-
-#***For each Marathon-on-Marathon instance on file***
-#***Launch it, inside the appropriate service group
-for service_group_mom in service_groups_mom['mom_groups']:
+    results.append( request is not None )
+
+  return all( results )
+
+def post_mom( client, service_group_mom, mom_apps, timeout, deploy ):
+  """
+  Wait for a Marathon-on-Marathon instance to be ready, then post its
+  service groups and apps to it.
+  """
+  service_name = service_group_mom['DCOS_SERVICE_NAME']
+  with client.tracer.span( 'MoM '+service_name, 'mom' ):
+    if not wait_for_mom( client, service_group_mom['app']['id'], service_name, timeout ):
+      return False
+
+    with client.tracer.span( 'post to MoM '+service_name, 'mom post', apps=len( mom_apps ) ):
+      return post_marathon( client, '/service/'+service_name, 'MoM '+service_name+' ', service_group_mom['groups'], mom_apps, deploy )
+
+def read_buffer( config ):
+  """
+  Load the service groups and apps of Marathon and of each Marathon-on-Marathon
+  instance from the buffer. Returns ( root_service_group, apps, moms, mom_apps ),
+  with `mom_apps` the apps of each MoM instance by service name, or None if
+  the buffer is empty.
+  """
+
+  #check that there's a SERVICE_GROUPS file created (buffer loaded)
+  if not ( os.path.isfile( config['SERVICE_GROUPS_FILE'] ) ):
+    sys.stdout.write('** ERROR: Buffer is empty. Please LOAD or GET Service Groups before POSTing them.')
+    return None
+
+  #open the service groups file and load the LIST of Service Groups from JSON
+  service_groups_file = open( config['SERVICE_GROUPS_FILE'], 'r' )
+  #load entire text file and convert to JSON - dictionary
+  root_service_group = json.loads( service_groups_file.read() )
+  service_groups_file.close()
+
+  #***** Apps ******
+  #check that there's an APPS file created (buffer loaded)
+  if not ( os.path.isfile( config['APPS_FILE'] ) ):
+    sys.stdout.write('** ERROR: Buffer is empty. Please LOAD or GET Apps before POSTing them.')
+    return None
+
+  #open the apps file and load the LIST of Apps from JSON
+  apps_file = open( config['APPS_FILE'], 'r' )
+  #load entire text file and convert to JSON - dictionary
+  apps = json.loads( apps_file.read() )
+  apps_file.close()
+
+  #open the service groups mom file and load the dict of SGs_MOM from JSON
+  service_groups_mom_file = open( config['SERVICE_GROUPS_MOM_FILE'], 'r' )
+  #load entire text file and convert to JSON - dictionary
+  service_groups_mom = json.loads( service_groups_mom_file.read() )
+  service_groups_mom_file.close()
+
+  #*---- APPS -----*
+  #Load MoM apps to post them along with the MoM service groups
+  apps_mom_file = open( config['APPS_MOM_FILE'], 'r' )
+  #load entire text file and convert to JSON - dictionary
+  apps_mom = json.loads( apps_mom_file.read() )
+  apps_mom_file.close()
+  mom_apps = { mom['DCOS_SERVICE_NAME']: mom['apps']['apps'] for mom in apps_mom['mom_apps'] }
+
+  return root_service_group, apps['apps'], service_groups_mom['mom_groups'], mom_apps
+
+def launch_mom( client, index, service_group_mom ):
+  """
+  Launch a Marathon-on-Marathon instance as an app of Marathon, inside the
+  appropriate service group.
+  """
   #reformat app to remove superfluous fields: 'version', tasksHealhty, etc.
   helpers.format_app( service_group_mom['app']  )
-  #build the request
-  api_endpoint = '/marathon/v2/apps'
-  url = 'http://'+config['DCOS_IP']+api_endpoint
-  headers = {
-    'Content-type': 'application/json',
-    'Authorization': 'token='+config['TOKEN'],
-  }
-
-  try:
-    request = requests.post(
-      url,
-      verify=False,
-      headers = headers,
-      data = json.dumps( service_group_mom['app'] )
-    )
-    request.raise_for_status()
-    sys.stdout.write( '** INFO: POST MoM Instance: {} : {:>20} \r'.format( index, request.status_code ) )
-    sys.stdout.flush() 
-  except (
-    requests.exceptions.ConnectionError ,\
-    requests.exceptions.Timeout ,\
-    requests.exceptions.TooManyRedirects ,\
-    requests.exceptions.RequestException ,\
-    ConnectionRefusedError
-    ) as error:
-    print ('** ERROR: POST MoM Instance: {0} {1}: {2}'.format( index, service_group_mom['DCOS_SERVICE_NAME'], request.text ) ) 
-
-#**** wait until all MoM instances are running so that we can post groups and apps to them ****
-while True:
-  #Get the list of Marathon apps on the system, store in dictionary
-  api_endpoint = '/marathon/v2/apps'
-  url = 'http://'+config['DCOS_IP']+api_endpoint
-  headers = {
-    'Content-type': 'application/json',
-    'Authorization': 'token='+config['TOKEN'],
-  }
-  try:
-    request = requests.get(
-      url,
-      headers=headers,
-		  verify=False
-      )
-    request.raise_for_status()
-    sys.stdout.write( '** INFO: GET Apps looking for MoM instances: {:>20} \r'.format( request.status_code ) ) 
-    sys.stdout.flush()
-  except (
-    requests.exceptions.ConnectionError ,\
-    requests.exceptions.Timeout ,\
-    requests.exceptions.TooManyRedirects ,\
-    requests.exceptions.RequestException ,\
-    ConnectionRefusedError
-    ) as error:
-    print ('**ERROR: GET Apps failed with: {}\n'.format( error ) )
-
-  #2xx HTTP status code is success
-  if str(request.status_code)[0] == '2':
-
-    running_marathons = {"marathons":[]} #list of dictionaries with the app definition for each MoM instance
-    running_apps = request.text #raw text form requests, in JSON from DC/OS
-    running_apps_dict = json.loads( running_apps )
-    for index,running_app in enumerate( running_apps_dict['apps'] ):
-      if 'DCOS_PACKAGE_NAME' in running_app['labels']:
-        if running_app['labels']['DCOS_PACKAGE_NAME']=='marathon':
-          running_marathons['marathons'].append( running_app )
-  else:
-    print('**ERROR: GET Apps failed with: {}'.format( request.text ) )
-    
-  healthy_marathons = [ loaded_marathon for loaded_marathon in running_marathons['marathons'] if loaded_marathon['tasksHealthy']>0 ]
-  print('** INFO: Detected {0} healthy MoM instances. Waiting until all {1} MoM instances are running.'.format( \
-    len( healthy_marathons ), len( service_groups_mom['mom_groups'] ) ), end='\r' )
-  if len( healthy_marathons ) == len ( service_groups_mom['mom_groups'] ): #ALL MARATHONS ARE RUNNING
-    break
-  sleep(10)
-
-#FOR EACH MARATHON-ON MARATHON INSTANCE ON FILE
-#Post all service groups as loaded at the beginning, now that those MoM instances are running.
-#Then, post the apps.
-
-#sleep 10 seconds for Marathons to REALLY come up
-print('** INFO: All MoM instances are up! Waiting a grace period for them to start...')
-sleep(10)
-
-for index, mom in enumerate( service_groups_mom['mom_groups'] ):
-  
-  for index2,mom_groups in enumerate( mom['groups']['groups'] ): #skip "/" group -- go straight to children.
-  
-    #format the groups in the marathon instance to remove offending fields
-    helpers.format_service_group( mom_groups )
-    #build the request
-    service_name = mom['DCOS_SERVICE_NAME']
-    api_endpoint = '/v2/groups'
-    url = 'http://'+config['DCOS_IP']+'/service/'+service_name+api_endpoint
-    headers = {
-      'Content-type': 'application/json',
-      'Authorization': 'token='+config['TOKEN'],
-    }
-    try:
-      request = requests.post(
-        url,
-				verify=False,
-        headers = headers, 
-        data = json.dumps( mom_groups )
-      )
-      request.raise_for_status()
-      #show progress after request
-      sys.stdout.write( '** INFO: POST MoM Service Groups : {} : {:>20} \r'.format( index, request.status_code ) )
-      sys.stdout.flush() 
-    except (
-      requests.exceptions.ConnectionError ,\
-      requests.exceptions.Timeout ,\
-      requests.exceptions.TooManyRedirects ,\
-      requests.exceptions.RequestException ,\
-      ConnectionRefusedError
-      ) as error:
-      print ('** ERROR: POST Mom Service Groups: {0} {1}: {2}'.format( index, mom['DCOS_SERVICE_NAME'], request.text ) ) 
-
-#*---- APPS -----*
-#Load MoM apps to post them along with the MoM service groups
-apps_mom_file = open( config['APPS_MOM_FILE'], 'r' )
-#load entire text file and convert to JSON - dictionary
-apps_mom = json.loads( apps_mom_file.read() )
-apps_mom_file.close()
-
-for index,mom in enumerate( apps_mom['mom_apps'] ):
-
-  for index2, mom_app in enumerate( mom['apps']['apps'] ):
-
-    helpers.format_app( mom_app )
-    service_name = mom['DCOS_SERVICE_NAME']
-    api_endpoint = '/v2/apps'
-    url = 'http://'+config['DCOS_IP']+'/service/'+service_name+api_endpoint
-    headers = {
-      'Content-type': 'application/json',
-      'Authorization': 'token='+config['TOKEN'],
-    }
-    try:
-      request = requests.post(
-        url,
-				verify=False,
-        headers = headers, 
-        data = json.dumps( mom_app )
-      )
-      request.raise_for_status()
-      #show progress after request
-      sys.stdout.write( '** INFO: POST MoM App : {} : {:>20} \r'.format( index, request.status_code ) )
-      sys.stdout.flush() 
-    except (
-      requests.exceptions.ConnectionError ,\
-      requests.exceptions.Timeout ,\
-      requests.exceptions.TooManyRedirects ,\
-      requests.exceptions.RequestException ,\
-      ConnectionRefusedError
-    ) as error:
-      print ('** ERROR: POST Mom App: {0} {1}: {2}'.format( index, mom['DCOS_SERVICE_NAME'], request.text ) ) 
-
-sys.stdout.write('\n** INFO: PUT Service Groups and Apps:                         Done.\n')
+  #the instance is also among the apps of Marathon, which may have created it
+  #already (e.g. posting whole group trees): PUT creates it or leaves it as is,
+  #where a POST would get a 409 Conflict
+  request = client.put(
+    '/marathon/v2/apps'+service_group_mom['app']['id'],
+    'PUT MoM Instance: {} {}'.format( index, service_group_mom['DCOS_SERVICE_NAME'] ),
+    service_group_mom['app']
+  )
+
+  return request is not None
+
+@tracing.phase
+def post_service_groups( config, client ):
+  """
+  Restore the service groups and apps in the buffer to Marathon, then
+  launch the Marathon-on-Marathon instances and restore their own service
+  groups and apps as soon as each of them is running.
+  """
+
+  #maximum number of MoM instances restored at a time, and seconds to wait for each to start
+  concurrency = int( config.get( 'CONCURRENCY', 8 ) )
+  timeout = float( config.get( 'MOM_TIMEOUT', 600 ) )
+  #post each app on its own ("apps") or whole group trees ("tree")
+  deploy = config.get( 'MARATHON_DEPLOY', 'apps' )
+
+  buffer = read_buffer( config )
+  if buffer is None:
+    return False
+  root_service_group, apps, moms, mom_apps = buffer
+
+  #***** Service groups and apps ******
+  with client.tracer.span( 'Marathon', 'marathon', apps=len( apps ) ):
+    ok = post_marathon( client, '/marathon', '', root_service_group, apps, deploy )
+
+  #***** Marathon-on-Marathon service groups ******
+
+  #***For each Marathon-on-Marathon instance on file***
+  #***Launch it, inside the appropriate service group
+  for index, service_group_mom in enumerate( moms ):
+    ok = launch_mom( client, index, service_group_mom ) and ok
+
+  #FOR EACH MARATHON-ON MARATHON INSTANCE ON FILE
+  #Post its service groups and then its apps as soon as that instance is running,
+  #without waiting for the others.
+  if moms:
+    with ThreadPoolExecutor( max_workers=min( len( moms ), concurrency ) ) as pool:
+      futures = [ pool.submit( post_mom, client, mom, mom_apps.get( mom['DCOS_SERVICE_NAME'], [] ), timeout, deploy )
+        for mom in moms ]
+      ok = all( [ future.result() for future in futures ] ) and ok
+
+  sys.stdout.write('\n** INFO: PUT Service Groups and Apps:                         Done.\n')
+
+  return ok
+
+if __name__ == '__main__':
+
+  #Load configuration if it exists
+  #config is stored directly in JSON format in a fixed location
+  config_file = os.getcwd()+'/.config.json'
+  config = helpers.get_config( config_file )        #returns config as a dictionary
+  if len( config ) == 0:
+    sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first' )
+    sys.exit(1)  
+
+  client = helpers.get_client( config )
+  #skip what a previous run already restored
+  client.journal_writes( config, 'post_service_groups' )
+  ok = post_service_groups( config, client )
+  client.close_journal( ok )
@@ -13,72 +13,64 @@
 
 import sys
 import os
-import requests
 import json
 import helpers      #helper functions in separate module helpers.py
+import tracing      #spans of the phases in separate module tracing.py
 
-# Suppress warnings
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+@tracing.phase
+def post_users( config, client ):
+  """
+  Restore the users in USERS_FILE to DC/OS.
+  All users are created with DEFAULT_USER_PASSWORD.
+  """
 
-#Load configuration if it exists
-#config is stored directly in JSON format in a fixed location
-config_file = os.getcwd()+'/.config.json'
-config = helpers.get_config( config_file )        #returns config as a dictionary
-if len( config ) == 0:
-  sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first' )
-  sys.exit(1)  
+  #check that there's a USERS file created (buffer loaded)
+  if not ( os.path.isfile( config['USERS_FILE'] ) ):
+    sys.stdout.write('** ERROR: Buffer is empty. Please LOAD or GET Users before POSTing them.')
+    return False
 
-#check that there's a USERS file created (buffer loaded)
-if not ( os.path.isfile( config['USERS_FILE'] ) ):
-  sys.stdout.write('** ERROR: Buffer is empty. Please LOAD or GET Users before POSTing them.')
-  sys.exit(1)
+  #open the users file and load the LIST of Users from JSON
+  users_file = open( config['USERS_FILE'], 'r' )
+  #load entire text file and convert to JSON - dictionary
+  users = json.loads( users_file.read() )
+  users_file.close()
 
-#open the users file and load the LIST of Users from JSON
-users_file = open( config['USERS_FILE'], 'r' )
-#load entire text file and convert to JSON - dictionary
-users = json.loads( users_file.read() )
-users_file.close()
+  #loop through the list of users and
+  #PUT /users/{uid}
+  for index, user in ( enumerate( users['array'] ) ): 
 
-#loop through the list of users and
-#PUT /users/{uid}
-for index, user in ( enumerate( users['array'] ) ): 
+    uid = user['uid']
 
-  uid = user['uid']
-
-  #Post only if it's not remote
-  if user['is_remote'] == False:
-    #build the request
-    api_endpoint = '/acs/api/v1/users/'+uid
-    url = 'http://'+config['DCOS_IP']+api_endpoint
-    headers = {
-    'Content-type': 'application/json',
-    'Authorization': 'token='+config['TOKEN'],
-    }
-    data = {
-    'description': user['description'],
-    'password': config['DEFAULT_USER_PASSWORD']
-    }
-    #send the request to PUT the new USER
-    try:
-      request = requests.put(
-        url,
-				verify=False,
-        headers = headers,
-        data = json.dumps( data )
+    #Post only if it's not remote
+    if user['is_remote'] == False:
+      data = {
+      'description': user['description'],
+      'password': config['DEFAULT_USER_PASSWORD']
+      }
+      #send the request to PUT the new USER
+      client.put(
+        '/acs/api/v1/users/'+uid,
+        'PUT User: {} : {}'.format( index, uid ),
+        data
       )
-      request.raise_for_status()
-      #show progress after request
-      sys.stdout.write( '** INFO: PUT User: {} : {:>20} \r'.format( index, request.status_code ) )
-      sys.stdout.flush() 
-    except (
-      requests.exceptions.ConnectionError ,\
-      requests.exceptions.Timeout ,\
-      requests.exceptions.TooManyRedirects ,\
-      requests.exceptions.RequestException ,\
-      ConnectionRefusedError
-      ) as error:
-      print ('** ERROR: PUT User: {}: {}'.format( uid, error ) ) 
 
 
-sys.stdout.write('\n** INFO: PUT Users:                         Done.\n')
+  sys.stdout.write('\n** INFO: PUT Users:                         Done.\n')
+
+  return True
+
+if __name__ == '__main__':
+
+  #Load configuration if it exists
+  #config is stored directly in JSON format in a fixed location
+  config_file = os.getcwd()+'/.config.json'
+  config = helpers.get_config( config_file )        #returns config as a dictionary
+  if len( config ) == 0:
+    sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first' )
+    sys.exit(1)  
+
+  client = helpers.get_client( config )
+  #skip what a previous run already restored
+  client.journal_writes( config, 'post_users' )
+  ok = post_users( config, client )
+  client.close_journal( ok )
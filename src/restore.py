@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+#
+# restore.py: restore the full configuration in the local buffer to a DC/OS cluster,
+# running independent requests concurrently
+#
+# Instead of running post_users, post_groups, post_acls and post_service_groups
+# one after the other, the buffer is turned into a graph of requests that only
+# depend on what they really need:
+#   - a user-to-group membership waits for its user and its group,
+#   - a permission granted on an ACL waits for the ACL and its user or group,
+#   - users, groups and ACLs don't wait for anything,
+#   - Marathon service groups and apps don't depend on IAM, and are restored
+#     alongside everything else,
+#   - each Marathon-on-Marathon instance is launched after the service groups
+#     and apps of Marathon, and its own are restored as soon as it's running.
+# Up to CONCURRENCY requests are in flight at any time, plus one worker for
+# each MoM instance (up to CONCURRENCY) as it waits for the instance to start.
+# The permissions granted on the ACLs, which can number many times the users,
+# groups and ACLs, are read from ACLS_PERMISSIONS_FILE as they are restored
+# instead of all at once.
+
+import sys
+import os
+import json
+import helpers			#helper functions in separate module helpers.py
+import tracing			#spans of the phases in separate module tracing.py
+from scheduler import Scheduler
+from post_service_groups import read_buffer, post_marathon, launch_mom, post_mom
+
+def put_task( client, kind, path, label, data=None ):
+	"""
+	Return a task sending a PUT to DC/OS, that returns True if it succeeded.
+	The request is traced as a span in the `kind` category (e.g. 'users').
+	"""
+	def task():
+		with client.tracer.span( label, kind ):
+			return client.put( path, label, data ) is not None
+
+	return task
+
+def marathon_task( client, root_service_group, apps, deploy ):
+	"""
+	Return a task posting the service groups and apps of Marathon.
+	"""
+	def task():
+		with client.tracer.span( 'Marathon', 'marathon', apps=len( apps ) ):
+			return post_marathon( client, '/marathon', '', root_service_group, apps, deploy )
+
+	return task
+
+def build_graph( config, client, scheduler ):
+	"""
+	Add the requests to restore the configuration in the local buffer to the
+	scheduler, with their dependencies, but for the permissions granted on the
+	ACLs (see grant_tasks()).
+	Returns the number of MoM instances, or None if the buffer is incomplete.
+	"""
+	for key in ( 'USERS_FILE', 'GROUPS_FILE', 'GROUPS_USERS_FILE', 'ACLS_FILE', 'ACLS_PERMISSIONS_FILE', 'SERVICE_GROUPS_FILE' ):
+		if not os.path.isfile( config[key] ):
+			sys.stdout.write( '** ERROR: Buffer is empty. Please LOAD or GET {} before POSTing it.\n'.format( os.path.basename( config[key] ) ) )
+			return None
+
+	#Marathon doesn't depend on anything in IAM
+	timeout = float( config.get( 'MOM_TIMEOUT', 600 ) )
+	deploy = config.get( 'MARATHON_DEPLOY', 'apps' )
+	buffer = read_buffer( config )
+	if buffer is None:
+		return None
+	root_service_group, apps, moms, mom_apps = buffer
+	scheduler.add( ( 'marathon', ), marathon_task( client, root_service_group, apps, deploy ), 'POST Service Groups and Apps' )
+
+	#PUT /marathon/v2/apps/{app_id} for each MoM instance, after the service groups it's in,
+	#then its service groups and apps as soon as it's running
+	for index, mom in enumerate( moms ):
+		name = mom['DCOS_SERVICE_NAME']
+		scheduler.add(
+			( 'mom', name ),
+			lambda index=index, mom=mom: launch_mom( client, index, mom ),
+			'PUT MoM Instance: {} {}'.format( index, name ),
+			[ ( 'marathon', ) ]
+			)
+		scheduler.add(
+			( 'mom apps', name ),
+			lambda mom=mom, name=name: post_mom( client, mom, mom_apps.get( name, [] ), timeout, deploy ),
+			'POST MoM Service Groups and Apps: {}'.format( name ),
+			[ ( 'mom', name ) ]
+			)
+
+	#PUT /users/{uid}
+	users_file = open( config['USERS_FILE'], 'r' )
+	users = json.loads( users_file.read() )
+	users_file.close()
+	for index, user in enumerate( users['array'] ):
+		#Post only if it's not remote
+		if user['is_remote'] == False:
+			uid = user['uid']
+			label = 'PUT User: {} : {}'.format( index, uid )
+			data = { 'description': user['description'], 'password': config['DEFAULT_USER_PASSWORD'] }
+			scheduler.add( ( 'users', uid ), put_task( client, 'users', '/acs/api/v1/users/'+uid, label, data ), label )
+
+	#PUT /groups/{gid}
+	groups_file = open( config['GROUPS_FILE'], 'r' )
+	groups = json.loads( groups_file.read() )
+	groups_file.close()
+	for index, group in enumerate( groups['array'] ):
+		if 'gid' in group:
+			gid = helpers.escape( group['gid'] )
+			label = 'PUT Group: {} {}'.format( index, gid )
+			scheduler.add( ( 'groups', gid ), put_task( client, 'groups', '/acs/api/v1/groups/'+gid, label, { 'description': group['description'] } ), label )
+
+	#PUT /acls/{rid}
+	for index, acl in enumerate( helpers.read_array( config['ACLS_FILE'] ) ):
+		rid = helpers.escape( acl['rid'] )
+		label = 'PUT ACL: {} : {}'.format( index, rid )
+		scheduler.add( ( 'acls', rid ), put_task( client, 'acls', '/acs/api/v1/acls/'+rid, label, { 'description': acl['description'] } ), label )
+
+	#PUT /groups/{gid}/users/{uid}, after the group and the user
+	groups_users_file = open( config['GROUPS_USERS_FILE'], 'r' )
+	groups_users = json.loads( groups_users_file.read() )
+	groups_users_file.close()
+	for index, group_user in enumerate( groups_users['array'] ):
+		if 'gid' in group_user:
+			gid = helpers.escape( group_user['gid'] )
+			for user in group_user.get( 'users', [] ):
+				uid = user['user']['uid']
+				label = 'PUT Group: {} : {} User: {}'.format( index, gid, uid )
+				scheduler.add(
+					( 'memberships', gid, uid ),
+					put_task( client, 'memberships', '/acs/api/v1/groups/'+gid+'/users/'+uid, label ),
+					label,
+					[ ( 'groups', gid ), ( 'users', uid ) ]
+					)
+
+	return len( moms )
+
+def grant_tasks( config, client ):
+	"""
+	Yield the requests to restore the permissions granted on the ACLs, as
+	( task, label, dependencies ) for the scheduler, reading them from
+	ACLS_PERMISSIONS_FILE one ACL at a time.
+	"""
+	#PUT /acls/{rid}/users/{uid}/{action}
+	#PUT /acls/{rid}/groups/{gid}/{action}, after the ACL and the user or group
+	for acl_permission in helpers.read_array( config['ACLS_PERMISSIONS_FILE'] ):
+		if 'rid' not in acl_permission:
+			continue
+		rid = helpers.escape( acl_permission['rid'] )
+		for kind, field in ( ( 'users', 'uid' ), ( 'groups', 'gid' ) ):
+			for index, principal in enumerate( acl_permission.get( kind, [] ) ):
+				if field not in principal:
+					continue
+				principal_id = principal[field] if kind == 'users' else helpers.escape( principal[field] )
+				for action in principal['actions']:
+					if 'name' in action:
+						label = 'PUT Action: {} : {} {}: {} ACL: {}'.format( index, action['name'], kind, principal_id, rid )
+						yield (
+							put_task( client, 'permissions', '/acs/api/v1/acls/'+rid+'/'+kind+'/'+principal_id+'/'+action['name'], label ),
+							label,
+							[ ( 'acls', rid ), ( kind, principal_id ) ]
+							)
+
+@tracing.phase
+def restore( config, client ):
+	"""
+	Restore the full configuration in the local buffer to DC/OS.
+	"""
+
+	#maximum number of requests in flight against the cluster
+	concurrency = int( config.get( 'CONCURRENCY', 8 ) )
+
+	scheduler = Scheduler()
+	moms = build_graph( config, client, scheduler )
+	if moms is None:
+		return False
+
+	#every write that succeeds is journaled, and those journaled by a previous
+	#restore of the same buffer are skipped
+	client.journal_writes( config, helpers.RESTORE_JOURNAL )
+	#waiting for a MoM instance to start takes up a worker that sends no requests
+	failed = scheduler.run( concurrency + min( moms, concurrency ), grant_tasks( config, client ) )
+	sys.stdout.write( '\n** INFO: Restore: {} requests: 							Done.\n'.format( scheduler.count ) )
+
+	#report every request that failed, and what remains to be restored
+	complete = client.close_journal( not failed )
+	if failed:
+		print( '** ERROR: Restore: {} of {} requests failed.'.format( len( failed ), scheduler.count ) )
+		return False
+
+	return complete
+
+if __name__ == '__main__':
+
+	#Load configuration if it exists
+	#config is stored directly in JSON format in a fixed location
+	config_file = os.getcwd()+'/.config.json'
+	config = helpers.get_config( config_file )				#returns config as a dictionary
+	if len( config ) == 0:
+		sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first\n' )
+		sys.exit(1)
+
+	restore( config, helpers.get_client( config ) )
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+# scheduler.py: run a graph of dependent tasks concurrently
+#
+# Each task is a function that returns True if it succeeded, and can depend on
+# other tasks. A pool of workers runs every task as soon as all the tasks it
+# depends on have finished, so independent work runs concurrently and a task
+# never waits for more than its own dependencies.
+# Tasks that nothing depends on ("leaves", e.g. each permission granted on an
+# ACL) can be given as an iterator instead, which is read as the tasks run, so
+# that only a bounded number of them are in memory however many there are.
+
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+#leaves read ahead of those running, per worker
+LEAF_BACKLOG = 64
+
+class Scheduler:
+	"""
+	Graph of tasks and their dependencies. Tasks are added with add() after the
+	tasks they depend on, and run with run().
+	"""
+
+	def __init__( self ):
+		self.tasks = collections.OrderedDict()		#task id -> ( function, label ), until it finishes
+		self.pending = {}							#task id -> number of dependencies not finished
+		self.dependents = collections.defaultdict( list )	#task id -> tasks that depend on it
+		self.finished = set()						#ids of the tasks finished, but leaves
+		self.count = 0								#tasks added, leaves included
+
+	def add( self, task_id, function, label, dependencies=() ):
+		"""
+		Add a task identified by `task_id`, that runs `function` once all
+		`dependencies` (ids of other tasks) have finished. Dependencies on
+		tasks that haven't been added are ignored: the objects they would
+		create are expected to exist already. `label` identifies the task in
+		the list of failures.
+		"""
+		if task_id in self.tasks or task_id in self.finished:
+			return
+		self.tasks[task_id] = ( function, label )
+		self.pending[task_id] = 0
+		self.count += 1
+		for dependency in set( dependencies ):
+			if dependency in self.tasks:
+				self.dependents[dependency].append( task_id )
+				self.pending[task_id] += 1
+
+	def run( self, concurrency, leaves=() ):
+		"""
+		Run all tasks with up to `concurrency` of them at a time, and the
+		`leaves`, an iterator of ( function, label, dependencies ) for tasks
+		that nothing depends on, read as they can be run.
+		Tasks run after their dependencies finish, whether these succeeded or
+		not (e.g. an object that already exists fails to be created, but what
+		depends on it can still be restored). Tasks that were made ready by
+		another one finishing run before the rest, so that dependent work
+		starts as soon as possible.
+		Returns the labels of the tasks that failed.
+		"""
+		ready = collections.deque( task_id for task_id, count in self.pending.items() if count == 0 )
+		running = {}
+		failed = []
+		leaves = iter( leaves )
+		waiting = set()			#ids of the leaves read and not started yet
+
+		with ThreadPoolExecutor( max_workers=concurrency ) as pool:
+			while True:
+				#read leaves while there's room for them
+				while leaves is not None and len( waiting ) < concurrency * LEAF_BACKLOG:
+					try:
+						function, label, dependencies = next( leaves )
+					except StopIteration:
+						leaves = None
+						break
+					task_id = ( 'leaf', self.count )
+					self.add( task_id, function, label, dependencies )
+					waiting.add( task_id )
+					if self.pending[task_id] == 0:
+						ready.append( task_id )
+				if not ( ready or running ):
+					break
+
+				while ready and len( running ) < concurrency:
+					task_id = ready.popleft()
+					waiting.discard( task_id )
+					running[pool.submit( self.tasks[task_id][0] )] = task_id
+
+				done, not_done = wait( running, return_when=FIRST_COMPLETED )
+				for future in done:
+					task_id = running.pop( future )
+					function, label = self.tasks.pop( task_id )
+					del self.pending[task_id]
+					try:
+						ok = future.result()
+					except Exception as error:
+						print( '** ERROR: {}: {}'.format( label, error ) )
+						ok = False
+					if not ok:
+						failed.append( label )
+					if task_id[0] != 'leaf':
+						self.finished.add( task_id )
+					for dependent in self.dependents.pop( task_id, [] ):
+						self.pending[dependent] -= 1
+						if self.pending[dependent] == 0:
+							ready.appendleft( dependent )
+
+		return failed
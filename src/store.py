@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+#
+# store.py: save and load configurations as deduplicated, content-addressed objects
+#
+# Receives two parameters as CLI arguments: "save" or "load" (argv[1]) and the
+# name of the configuration (argv[2]); or "gc" alone, to remove the objects
+# that no configuration uses any longer (e.g. after deleting one).
+#
+# Each JSON file in the local buffer is split into objects: every element of
+# its top-level lists (every user, group, ACL, app...) and the rest of the file
+# as a "skeleton". Each object is stored once under backup/.objects, named after
+# the SHA-256 of its contents, and a configuration is just a small manifest in
+# backup/[name]/manifest.json listing the objects that make up each file.
+# Objects that didn't change since a previous backup are not stored again.
+
+import sys
+import os
+import json
+import hashlib
+import helpers			#helper functions in separate module helpers.py
+
+#directory under backup/ holding the objects shared by all configurations
+OBJECTS_DIR = '.objects'
+#file in each configuration's directory listing its objects
+MANIFEST_FILE = 'manifest.json'
+
+def put_object( objects_dir, an_object ):
+	"""
+	Store an object serialized as JSON in the objects directory, unless it's
+	already there. Returns the hash identifying it.
+	"""
+	data = json.dumps( an_object ).encode( 'utf-8' )
+	digest = hashlib.sha256( data ).hexdigest()
+	object_path = os.path.join( objects_dir, digest[:2], digest[2:] )
+	if not os.path.isfile( object_path ):
+		os.makedirs( os.path.dirname( object_path ), exist_ok=True )
+		#write to a temporary file first so that a half-written object is never visible
+		tmp_path = object_path+'.tmp'
+		object_file = open( tmp_path, 'wb' )
+		object_file.write( data )
+		object_file.close()
+		os.replace( tmp_path, object_path )
+
+	return digest
+
+def get_object( objects_dir, digest ):
+	"""
+	Load an object from the objects directory given its hash.
+	"""
+	object_file = open( os.path.join( objects_dir, digest[:2], digest[2:] ), 'r' )
+	an_object = json.loads( object_file.read() )
+	object_file.close()
+
+	return an_object
+
+def save( config, name ):
+	"""
+	Save the files in the local buffer as a configuration called `name`.
+	Returns False if any of them is missing or can't be read: the others are
+	saved anyway.
+	"""
+	backup_dir = os.path.join( config['WORKING_DIR'], 'backup' )
+	objects_dir = os.path.join( backup_dir, OBJECTS_DIR )
+	manifest = { 'files': {} }
+	ok = True
+
+	for key in helpers.BUFFER_FILES:
+		if not os.path.isfile( config[key] ):
+			print( '**ERROR: save configuration: {} not retrieved before save. Please GET or LOAD and save again.'.format( os.path.basename( config[key] ) ) )
+			ok = False
+			continue
+
+		try:
+			buffer_file = open( config[key], 'r' )
+			content = json.loads( buffer_file.read() )
+			buffer_file.close()
+		except ( OSError, ValueError ) as error:
+			print( '**ERROR: save configuration: {} could not be read: {}'.format( os.path.basename( config[key] ), error ) )
+			ok = False
+			continue
+
+		#split the top-level lists into one object per element,
+		#and keep the rest of the file (with those lists empty) as the skeleton
+		lists = {}
+		if isinstance( content, dict ):
+			skeleton = {}
+			for field, value in content.items():
+				if isinstance( value, list ):
+					lists[field] = [ put_object( objects_dir, item ) for item in value ]
+					skeleton[field] = []
+				else:
+					skeleton[field] = value
+		else:
+			skeleton = content
+
+		manifest['files'][os.path.basename( config[key] )] = {
+			'skeleton':	put_object( objects_dir, skeleton ),
+			'lists':	lists
+		}
+
+	os.makedirs( os.path.join( backup_dir, name ), exist_ok=True )
+	manifest_file = open( os.path.join( backup_dir, name, MANIFEST_FILE ), 'w' )
+	manifest_file.write( json.dumps( manifest ) )
+	manifest_file.close()
+
+	return ok
+
+def load( config, name ):
+	"""
+	Rebuild the files in the local buffer from the configuration called `name`.
+	Returns False if any of them is missing from it or can't be read.
+	"""
+	backup_dir = os.path.join( config['WORKING_DIR'], 'backup' )
+	objects_dir = os.path.join( backup_dir, OBJECTS_DIR )
+	manifest_path = os.path.join( backup_dir, name, MANIFEST_FILE )
+	if not os.path.isfile( manifest_path ):
+		print( '** ERROR: configuration [ {} ] not found.'.format( name ) )
+		return False
+
+	try:
+		manifest_file = open( manifest_path, 'r' )
+		manifest = json.loads( manifest_file.read() )
+		manifest_file.close()
+	except ( OSError, ValueError ) as error:
+		print( '** ERROR: configuration [ {} ] could not be read: {}'.format( name, error ) )
+		return False
+	ok = True
+
+	for key in helpers.BUFFER_FILES:
+		entry = manifest['files'].get( os.path.basename( config[key] ) )
+		if entry is None:
+			print( '**ERROR: load configuration: {} not found in [ {} ].'.format( os.path.basename( config[key] ), name ) )
+			ok = False
+			continue
+
+		try:
+			content = get_object( objects_dir, entry['skeleton'] )
+			for field, digests in entry['lists'].items():
+				content[field] = [ get_object( objects_dir, digest ) for digest in digests ]
+		except ( OSError, ValueError ) as error:
+			print( '**ERROR: load configuration: {} could not be read from [ {} ]: {}'.format( os.path.basename( config[key] ), name, error ) )
+			ok = False
+			continue
+
+		buffer_file = open( config[key], 'w' )
+		buffer_file.write( json.dumps( content ) )
+		buffer_file.close()
+
+	return ok
+
+def gc( config ):
+	"""
+	Remove the objects that aren't listed in the manifest of any configuration.
+	Nothing is removed if a manifest can't be read, as its objects are unknown.
+	Returns False in that case.
+	"""
+	backup_dir = os.path.join( config['WORKING_DIR'], 'backup' )
+	objects_dir = os.path.join( backup_dir, OBJECTS_DIR )
+	if not os.path.isdir( objects_dir ):
+		return True
+
+	#objects used by every configuration saved
+	used = set()
+	for entry in os.scandir( backup_dir ):
+		manifest_path = os.path.join( entry.path, MANIFEST_FILE )
+		if entry.name == OBJECTS_DIR or not os.path.isfile( manifest_path ):
+			continue
+		try:
+			manifest_file = open( manifest_path, 'r' )
+			manifest = json.loads( manifest_file.read() )
+			manifest_file.close()
+		except ( OSError, ValueError ) as error:
+			print( '** ERROR: configuration [ {} ] could not be read, no objects removed: {}'.format( entry.name, error ) )
+			return False
+		for files_entry in manifest['files'].values():
+			used.add( files_entry['skeleton'] )
+			for digests in files_entry['lists'].values():
+				used.update( digests )
+
+	#objects are stored as [first 2 characters of the hash]/[rest of it].
+	#Those being written (.tmp) belong to a save in progress.
+	removed = 0
+	for prefix in os.scandir( objects_dir ):
+		if not prefix.is_dir():
+			continue
+		for object_entry in os.scandir( prefix.path ):
+			if not object_entry.name.endswith( '.tmp' ) and prefix.name+object_entry.name not in used:
+				os.remove( object_entry.path )
+				removed += 1
+		if not os.listdir( prefix.path ):
+			os.rmdir( prefix.path )
+	print( '** INFO: {} objects no longer used by any configuration removed.'.format( removed ) )
+
+	return True
+
+if __name__ == '__main__':
+
+	#Load configuration if it exists
+	#config is stored directly in JSON format in a fixed location
+	config_file = os.getcwd()+'/.config.json'
+	config = helpers.get_config( config_file )				#returns config as a dictionary
+	if len( config ) == 0:
+		sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first\n' )
+		sys.exit(1)
+
+	if not ( len( sys.argv ) == 3 and sys.argv[1] in ( 'save', 'load' ) or sys.argv[1:] == [ 'gc' ] ):
+		print( '** ERROR: usage: store.py [save|load] [configuration_name] | store.py gc' )
+		sys.exit(1)
+
+	if sys.argv[1] == 'gc':
+		ok = gc( config )
+	elif sys.argv[1] == 'save':
+		ok = save( config, sys.argv[2] )
+	else:
+		ok = load( config, sys.argv[2] )
+	if not ok:
+		sys.exit(1)
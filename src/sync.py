@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+#
+# sync.py: restore the local buffer to a DC/OS cluster, sending only the changes
+#
+# Unlike the post_* scripts, which send every object in the buffer, this first
+# gets the configuration currently in the target cluster: users, groups and
+# their memberships, ACLs and their permissions, and Marathon service groups and
+# apps. It then compares it with the buffer to plan which objects need to be
+# created, which need to be updated and which are unchanged, and only sends
+# the requests for the first two. Re-running a restore against a cluster that
+# was partly restored, or syncing a cluster that is already up to date, only
+# sends the requests for what is missing.
+#
+# Run with RESTORE_MODE=diff in env.sh, the POST option of ./run.sh uses this
+# instead of the post_* scripts.
+
+#reference:
+#https://docs.mesosphere.com/1.8/administration/id-and-access-mgt/iam-api/
+#https://mesosphere.github.io/marathon/docs/rest-api.html
+
+import sys
+import os
+import json
+import helpers			#helper functions in separate module helpers.py
+import tracing			#spans of the phases in separate module tracing.py
+from post_service_groups import wait_for_mom
+
+def read_buffer( config, key ):
+	"""
+	Load a file in the local buffer as a dictionary.
+	Returns None and shows an error if it hasn't been retrieved.
+	"""
+	if not os.path.isfile( config[key] ):
+		sys.stdout.write( '** ERROR: Buffer is empty. Please LOAD or GET {} before POSTing it.\n'.format( os.path.basename( config[key] ) ) )
+		return None
+
+	buffer_file = open( config[key], 'r' )
+	content = json.loads( buffer_file.read() )
+	buffer_file.close()
+
+	return content
+
+def apply_plan( client, name, plan, unchanged ):
+	"""
+	Send the requests in a plan to DC/OS. Each step in the plan is a tuple of
+	( 'create'|'update', method, path, label, data ).
+	`unchanged` is the number of objects that didn't need any request.
+	Returns True if all requests succeeded.
+	"""
+	creates = len( [ step for step in plan if step[0] == 'create' ] )
+	print( '** INFO: {}: {} to create, {} to update, {} unchanged.'.format( name, creates, len( plan ) - creates, unchanged ) )
+
+	ok = True
+	for action, method, path, label, data in plan:
+		if client.request( method, path, label, data ) is None:
+			ok = False
+
+	return ok
+
+@tracing.phase
+def sync_users( config, client ):
+	"""
+	Create the users in USERS_FILE missing in DC/OS, and update the description
+	of those that changed. New users are created with DEFAULT_USER_PASSWORD.
+	"""
+	users = read_buffer( config, 'USERS_FILE' )
+	if users is None:
+		return False
+
+	request = client.get( '/acs/api/v1/users', 'GET target Users' )
+	if request is None:
+		return False
+	current = { user['uid']: user for user in request.json()['array'] }
+
+	plan = []
+	unchanged = 0
+	for index, user in enumerate( users['array'] ):
+		uid = user['uid']
+		#remote users are not posted
+		if user.get( 'is_remote', False ):
+			continue
+		if uid not in current:
+			plan.append( ( 'create', 'PUT', '/acs/api/v1/users/'+uid, 'PUT User: {} : {}'.format( index, uid ),
+				{ 'description': user['description'], 'password': config['DEFAULT_USER_PASSWORD'] } ) )
+		elif current[uid]['description'] != user['description']:
+			#existing users keep their password
+			plan.append( ( 'update', 'PATCH', '/acs/api/v1/users/'+uid, 'PATCH User: {} : {}'.format( index, uid ),
+				{ 'description': user['description'] } ) )
+		else:
+			unchanged += 1
+
+	ok = apply_plan( client, 'Users', plan, unchanged )
+	sys.stdout.write( '\n** INFO: Sync Users: 							Done.\n' )
+
+	return ok
+
+@tracing.phase
+def sync_groups( config, client ):
+	"""
+	Create the groups in GROUPS_FILE missing in DC/OS, update the description of
+	those that changed, and add the user-to-group memberships in GROUPS_USERS_FILE
+	missing in DC/OS.
+	"""
+	groups = read_buffer( config, 'GROUPS_FILE' )
+	groups_users = read_buffer( config, 'GROUPS_USERS_FILE' )
+	if groups is None or groups_users is None:
+		return False
+
+	request = client.get( '/acs/api/v1/groups', 'GET target Groups' )
+	if request is None:
+		return False
+	current = { helpers.escape( group['gid'] ): group for group in request.json()['array'] }
+
+	plan = []
+	unchanged = 0
+	for index, group in enumerate( groups['array'] ):
+		#test for empty group
+		if 'gid' not in group:
+			continue
+		gid = helpers.escape( group['gid'] )
+		if gid not in current:
+			plan.append( ( 'create', 'PUT', '/acs/api/v1/groups/'+gid, 'PUT Group: {} {}'.format( index, gid ),
+				{ 'description': group['description'] } ) )
+		elif current[gid]['description'] != group['description']:
+			plan.append( ( 'update', 'PATCH', '/acs/api/v1/groups/'+gid, 'PATCH Group: {} {}'.format( index, gid ),
+				{ 'description': group['description'] } ) )
+		else:
+			unchanged += 1
+	ok = apply_plan( client, 'Groups', plan, unchanged )
+
+	#memberships: only groups that already existed can have members in DC/OS
+	plan = []
+	unchanged = 0
+	for index, group_user in enumerate( groups_users['array'] ):
+		if 'gid' not in group_user:
+			continue
+		gid = helpers.escape( group_user['gid'] )
+		members = set()
+		if gid in current:
+			request = client.get( '/acs/api/v1/groups/'+gid+'/users', 'GET target Group Memberships: {}'.format( gid ) )
+			if request is None:
+				ok = False
+				continue
+			members = { membership['user']['uid'] for membership in request.json()['array'] }
+		for user in group_user.get( 'users', [] ):
+			uid = user['user']['uid']
+			if uid not in members:
+				plan.append( ( 'create', 'PUT', '/acs/api/v1/groups/'+gid+'/users/'+uid,
+					'PUT Group: {} : {} User: {}'.format( index, gid, uid ), None ) )
+			else:
+				unchanged += 1
+	ok = apply_plan( client, 'Group memberships', plan, unchanged ) and ok
+	sys.stdout.write( '\n** INFO: Sync Groups: 							Done.\n' )
+
+	return ok
+
+@tracing.phase
+def sync_acls( config, client ):
+	"""
+	Create the ACLs in ACLS_FILE missing in DC/OS, update the description of
+	those that changed, and grant the permissions in ACLS_PERMISSIONS_FILE
+	missing in DC/OS.
+	"""
+	for key in ( 'ACLS_FILE', 'ACLS_PERMISSIONS_FILE' ):
+		if not os.path.isfile( config[key] ):
+			sys.stdout.write( '** ERROR: Buffer is empty. Please LOAD or GET {} before POSTing it.\n'.format( os.path.basename( config[key] ) ) )
+			return False
+
+	request = client.get( '/acs/api/v1/acls', 'GET target ACLs' )
+	if request is None:
+		return False
+	current = { helpers.escape( acl['rid'] ): acl for acl in request.json()['array'] }
+
+	plan = []
+	unchanged = 0
+	for index, acl in enumerate( helpers.read_array( config['ACLS_FILE'] ) ):
+		rid = helpers.escape( acl['rid'] )
+		if rid not in current:
+			plan.append( ( 'create', 'PUT', '/acs/api/v1/acls/'+rid, 'PUT ACL: {} : {}'.format( index, rid ),
+				{ 'description': acl['description'] } ) )
+		elif current[rid]['description'] != acl['description']:
+			plan.append( ( 'update', 'PATCH', '/acs/api/v1/acls/'+rid, 'PATCH ACL: {} : {}'.format( index, rid ),
+				{ 'description': acl['description'] } ) )
+		else:
+			unchanged += 1
+	ok = apply_plan( client, 'ACLs', plan, unchanged )
+
+	#permissions: only ACLs that already existed can have permissions granted in DC/OS
+	plan = []
+	unchanged = 0
+	for acl_permission in helpers.read_array( config['ACLS_PERMISSIONS_FILE'] ):
+		if 'rid' not in acl_permission:
+			continue
+		rid = helpers.escape( acl_permission['rid'] )
+		granted = set()
+		if rid in current:
+			request = client.get( '/acs/api/v1/acls/'+rid+'/permissions', 'GET target ACL Permissions: {}'.format( rid ) )
+			if request is None:
+				ok = False
+				continue
+			permissions = request.json()
+			granted = { ( 'users', user['uid'], action['name'] ) for user in permissions['users'] for action in user['actions'] }
+			granted |= { ( 'groups', helpers.escape( group['gid'] ), action['name'] ) for group in permissions['groups'] for action in group['actions'] }
+
+		#PUT /acls/{rid}/users/{uid}/{action}
+		#PUT /acls/{rid}/groups/{gid}/{action}
+		for kind, field in ( ( 'users', 'uid' ), ( 'groups', 'gid' ) ):
+			for index, principal in enumerate( acl_permission.get( kind, [] ) ):
+				if field not in principal:
+					continue
+				principal_id = principal[field] if kind == 'users' else helpers.escape( principal[field] )
+				for action in principal['actions']:
+					if ( kind, principal_id, action['name'] ) not in granted:
+						plan.append( ( 'create', 'PUT', '/acs/api/v1/acls/'+rid+'/'+kind+'/'+principal_id+'/'+action['name'],
+							'PUT Action: {} : {} {}: {} ACL: {}'.format( index, action['name'], kind, principal_id, rid ), None ) )
+					else:
+						unchanged += 1
+	ok = apply_plan( client, 'ACL permissions', plan, unchanged ) and ok
+	sys.stdout.write( '\n** INFO: Sync ACLs: 							Done.\n' )
+
+	return ok
+
+def plan_marathon( client, base, name, root_service_group, apps ):
+	"""
+	Plan the requests to restore a tree of service groups and a list of apps to
+	the Marathon instance at `base` ('/marathon' or '/service/[name]').
+	Returns the plan and the number of unchanged objects, or None if the current
+	configuration couldn't be retrieved.
+	"""
+	request = client.get( base+'/v2/groups', 'GET target Service Groups: {}'.format( name ) )
+	if request is None:
+		return None
+	current_groups = set()
+	pending = [ request.json() ]
+	while pending:
+		group = pending.pop()
+		current_groups.add( group['id'] )
+		pending.extend( group.get( 'groups', [] ) )
+
+	request = client.get( base+'/v2/apps', 'GET target Apps: {}'.format( name ) )
+	if request is None:
+		return None
+	current_apps = { app['id']: app for app in request.json()['apps'] }
+
+	plan = []
+	unchanged = 0
+
+	#a missing group is posted with all the groups under it,
+	#an existing one is skipped and the groups under it are checked
+	pending = list( root_service_group['groups'] )
+	while pending:
+		service_group = pending.pop( 0 )
+		if service_group['id'] not in current_groups:
+			helpers.format_service_group( service_group )
+			plan.append( ( 'create', 'POST', base+'/v2/groups', 'POST Service Group: {} {}'.format( name, service_group['id'] ), service_group ) )
+		else:
+			unchanged += 1
+			pending.extend( service_group.get( 'groups', [] ) )
+
+	#a missing app is posted, an existing one is updated if any of its fields changed
+	for app in apps:
+		helpers.format_app( app )
+		if app['id'] not in current_apps:
+			plan.append( ( 'create', 'POST', base+'/v2/apps', 'POST App: {} {}'.format( name, app['id'] ), app ) )
+		else:
+			current_app = helpers.format_app( current_apps[app['id']] )
+			if any( current_app.get( field ) != value for field, value in app.items() ):
+				plan.append( ( 'update', 'PUT', base+'/v2/apps'+app['id'], 'PUT App: {} {}'.format( name, app['id'] ), app ) )
+			else:
+				unchanged += 1
+
+	return plan, unchanged
+
+@tracing.phase
+def sync_service_groups( config, client ):
+	"""
+	Restore the service groups and apps missing in Marathon and update the apps
+	that changed, then do the same in each Marathon-on-Marathon instance, once
+	the ones missing have been launched and are running.
+	"""
+	root_service_group = read_buffer( config, 'SERVICE_GROUPS_FILE' )
+	apps = read_buffer( config, 'APPS_FILE' )
+	service_groups_mom = read_buffer( config, 'SERVICE_GROUPS_MOM_FILE' )
+	apps_mom = read_buffer( config, 'APPS_MOM_FILE' )
+	if root_service_group is None or apps is None or service_groups_mom is None or apps_mom is None:
+		return False
+
+	#MoM instances are apps of the root Marathon: add those that aren't in the apps file
+	app_ids = { app['id'] for app in apps['apps'] }
+	for service_group_mom in service_groups_mom['mom_groups']:
+		if service_group_mom['app']['id'] not in app_ids:
+			apps['apps'].append( service_group_mom['app'] )
+
+	planned = plan_marathon( client, '/marathon', 'Marathon', root_service_group, apps['apps'] )
+	if planned is None:
+		return False
+	plan, unchanged = planned
+	ok = apply_plan( client, 'Service Groups and Apps', plan, unchanged )
+
+	#seconds to wait for each MoM instance to start
+	timeout = float( config.get( 'MOM_TIMEOUT', 600 ) )
+
+	for service_group_mom in service_groups_mom['mom_groups']:
+		service_name = service_group_mom['DCOS_SERVICE_NAME']
+		#wait until the MoM instance is running so that we can sync its groups and apps
+		if not wait_for_mom( client, service_group_mom['app']['id'], service_name, timeout ):
+			ok = False
+			continue
+		mom_apps = []
+		for mom in apps_mom['mom_apps']:
+			if mom['DCOS_SERVICE_NAME'] == service_name:
+				mom_apps = mom['apps']['apps']
+		planned = plan_marathon( client, '/service/'+service_name, 'MoM '+service_name, service_group_mom['groups'], mom_apps )
+		if planned is None:
+			ok = False
+			continue
+		plan, unchanged = planned
+		ok = apply_plan( client, 'MoM {} Service Groups and Apps'.format( service_name ), plan, unchanged ) and ok
+
+	sys.stdout.write( '\n** INFO: Sync Service Groups and Apps: 							Done.\n' )
+
+	return ok
+
+#phases of a diff-based restore, in the order they are run
+SYNC_PHASES = [ sync_users, sync_groups, sync_acls, sync_service_groups ]
+
+if __name__ == '__main__':
+
+	#Load configuration if it exists
+	#config is stored directly in JSON format in a fixed location
+	config_file = os.getcwd()+'/.config.json'
+	config = helpers.get_config( config_file )				#returns config as a dictionary
+	if len( config ) == 0:
+		sys.stdout.write( '** ERROR: Configuration not found. Please run ./run.sh first\n' )
+		sys.exit(1)
+
+	client = helpers.get_client( config )
+	#what is in DC/OS now is compared with the buffer, not what was there before
+	if client.cache is not None:
+		client.cache.clear()
+	for phase in SYNC_PHASES:
+		if not phase( config, client ):
+			print( '** ERROR: {} did not complete.'.format( phase.__name__ ) )
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#
+# tracing.py: spans of the phases of a backup or restore, written to a trace file
+#
+# With TRACE_FILE set in env.sh, each phase (users, groups, ACLs, service
+# groups), and the work inside it (each ACL, each MoM instance, the wait for a
+# MoM instance to start...) is written to TRACE_FILE as a span with its start,
+# duration and thread when it finishes. The file is in JSON lines, one event
+# of the Trace Event Format per line. `tracing.py [trace_file] > trace.json`
+# turns it into the JSON array of events that chrome://tracing and
+# https://ui.perfetto.dev open: spans run by the pool of workers are shown in a
+# row per thread, so the overlap between them and the time spent waiting show up.
+# Runs are appended to the same file, each as a process of its own.
+
+import os
+import sys
+import json
+import time
+import threading
+import functools
+import contextlib
+import metrics			#latency and throughput by endpoint in separate module metrics.py
+
+class Tracer:
+	"""
+	Writes the spans of this process to a trace file. If `path` is empty,
+	spans are not recorded at all.
+	"""
+
+	def __init__( self, path ):
+		self.path = path
+		self.trace_file = None
+		self.lock = threading.Lock()
+		self.pid = os.getpid()
+		self.threads = {}				#thread ident -> tid shown in the trace
+
+	def span( self, name, category, **args ):
+		"""
+		Return a context manager that records its block as a span called
+		`name`, in `category` (e.g. 'phase'), with `args` shown as its details.
+		"""
+		if not self.path:
+			return contextlib.nullcontext()
+		return self.record( name, category, args )
+
+	@contextlib.contextmanager
+	def record( self, name, category, args ):
+		start = time.time()
+		try:
+			yield
+		finally:
+			self.write( {
+				'name': name,
+				'cat': category,
+				'ph': 'X',
+				'ts': int( start * 1000000 ),
+				'dur': int( ( time.time() - start ) * 1000000 ),
+				'pid': self.pid,
+				'tid': self.thread(),
+				'args': args
+				} )
+
+	def thread( self ):
+		"""
+		Return the tid of the current thread, naming it in the trace the first
+		time it's seen.
+		"""
+		ident = threading.get_ident()
+		if ident in self.threads:
+			return self.threads[ident]
+
+		with self.lock:
+			tid = self.threads[ident] = len( self.threads ) + 1
+		self.write( { 'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': { 'name': threading.current_thread().name } } )
+
+		return tid
+
+	def write( self, event ):
+		"""
+		Append an event to the trace file as a line of JSON, opening it the
+		first time.
+		"""
+		line = json.dumps( event )
+		with self.lock:
+			if self.trace_file is None:
+				self.trace_file = open( self.path, 'a' )
+				self.trace_file.write( json.dumps( { 'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': { 'name': metrics.run_name() } } )+'\n' )
+			self.trace_file.write( line+'\n' )
+			self.trace_file.flush()
+
+def phase( function ):
+	"""
+	Decorator for the phase functions, called as function( config, client ),
+	that records each call as a span in the 'phase' category.
+	"""
+	@functools.wraps( function )
+	def traced( config, client, *args, **kwargs ):
+		with client.tracer.span( function.__name__, 'phase' ):
+			return function( config, client, *args, **kwargs )
+
+	return traced
+
+def read_events( path ):
+	"""
+	Return the events in a trace file, skipping a line left incomplete by a
+	run that was interrupted while writing it.
+	"""
+	events = []
+	trace_file = open( path, 'r' )
+	for line in trace_file:
+		try:
+			events.append( json.loads( line ) )
+		except ValueError:
+			continue
+	trace_file.close()
+
+	return events
+
+if __name__ == '__main__':
+
+	if len( sys.argv ) != 2 or not os.path.isfile( sys.argv[1] ):
+		print( '** ERROR: usage: tracing.py [trace_file]' )
+		sys.exit(1)
+
+	#the viewers open a JSON array of events
+	json.dump( read_events( sys.argv[1] ), sys.stdout )
+	sys.stdout.write( '\n' )